@@ -0,0 +1,257 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from decodificador import como_lectura
+from metricas import METRICAS
+
+# ----------------------------------------------------------
+# ALMACÉN HISTÓRICO EN DISCO (SQLite, un fichero por día)
+# ----------------------------------------------------------
+# - La ingesta solo hace un put_nowait() en una cola: nunca bloquea el
+#   hilo de red de paho. Si la cola se llena se cuenta como descartado.
+# - Un hilo escritor agrupa los mensajes y hace UN commit cada
+#   LOTE_MAX mensajes o cada LOTE_MS milisegundos (group commit).
+# - Cada día UTC va en su propio fichero (historico/lecturas_AAAAMMDD.sqlite)
+#   en modo WAL, con índice (sensor, ts) para las consultas por rango.
+
+CARPETA_HISTORICO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "historico")
+LOTE_MAX = 500           # Mensajes por commit como máximo
+LOTE_MS = 200            # Tiempo máximo que un mensaje espera a ser escrito
+COLA_MAX = 100_000       # Mensajes pendientes antes de empezar a descartar
+CACHE_AGREGADOS = 64     # Ventanas agregadas (cubetas cerradas) guardadas en caché
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS lecturas (
+    ts     REAL NOT NULL,
+    sensor TEXT NOT NULL,
+    campo  TEXT NOT NULL,
+    valor  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_sensor_ts ON lecturas (sensor, ts);
+"""
+
+
+def _dia(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y%m%d")
+
+
+class AlmacenHistorico:
+    def __init__(self, carpeta=CARPETA_HISTORICO, lote_max=LOTE_MAX, lote_ms=LOTE_MS):
+        self.carpeta = carpeta
+        self.lote_max = lote_max
+        self.lote_s = lote_ms / 1000.0
+        os.makedirs(carpeta, exist_ok=True)
+
+        self.cola = queue.Queue(maxsize=COLA_MAX)
+        self.escritos = 0        # Filas (sensor, campo, valor) guardadas
+        self.fallidas = 0        # Filas perdidas por un error de SQLite
+        self.descartados = 0
+        self._conexiones = {}    # día -> conexión (solo las usa el hilo escritor)
+        self._cache = {}         # (sensor, resolución, inicio, fin) -> cubetas cerradas
+        self._lock_cache = threading.Lock()
+        METRICAS.medidor("historico_cola", "Mensajes esperando al escritor del histórico",
+                         funcion=self.cola.qsize)
+        METRICAS.contador("historico_escritos_total", "Filas escritas en el histórico",
+                          funcion=lambda: self.escritos)
+        METRICAS.contador("historico_fallidas_total", "Filas que no se pudieron escribir en el histórico",
+                          funcion=lambda: self.fallidas)
+        METRICAS.contador("historico_descartados_total", "Mensajes descartados por cola del histórico llena",
+                          funcion=lambda: self.descartados)
+        self._hilo = threading.Thread(target=self._escritor, daemon=True)
+        self._hilo.start()
+
+    # ---------- INGESTA (no bloqueante) ----------
+    def guardar(self, registro):
+        """Encola una Lectura (o dict con "ID"). Nunca bloquea."""
+        lectura = como_lectura(registro)
+        if lectura is None:
+            return
+        t = lectura.hora()   # Hora del sensor corregida (tiempo.py) si se conoce
+        filas = [(t, lectura.ID, c, v) for c, v in lectura.medidas()]
+        if not filas:
+            return
+        try:
+            self.cola.put_nowait(filas)
+        except queue.Full:
+            self.descartados += 1
+
+    def guardar_lote(self, lote):
+        """Encola un LoteLecturas entero como un solo elemento de la cola."""
+        filas = []
+        ts = lote.t_corregido()
+        for c, v in lote.medidas():
+            validos = ~np.isnan(v)
+            filas.extend((t, lote.ID, c, x) for t, x in zip(ts[validos].tolist(), v[validos].tolist()))
+        if not filas:
+            return
+        try:
+            self.cola.put_nowait(filas)
+        except queue.Full:
+            self.descartados += 1
+
+    # ---------- HILO ESCRITOR ----------
+    def _ruta(self, dia):
+        return os.path.join(self.carpeta, f"lecturas_{dia}.sqlite")
+
+    def _conexion(self, dia):
+        con = self._conexiones.get(dia)
+        if con is None:
+            con = sqlite3.connect(self._ruta(dia))
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.executescript(ESQUEMA)
+            self._conexiones[dia] = con
+            # Solo se mantienen abiertos los ficheros de los dos últimos días (y
+            # el que se acaba de abrir, aunque sea más antiguo: un rezagado)
+            for viejo in sorted(d for d in self._conexiones if d != dia)[:-2]:
+                self._conexiones.pop(viejo).close()
+        return con
+
+    def _escritor(self):
+        while True:
+            lote = [self.cola.get()]
+            limite = time.monotonic() + self.lote_s
+            while len(lote) < self.lote_max:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self.cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            self._escribir(lote)
+
+    def _escribir(self, lote):
+        # Cada fila a su día (un lote que cruza la medianoche UTC va a dos ficheros)
+        por_dia = {}
+        for filas in lote:
+            for fila in filas:
+                por_dia.setdefault(_dia(fila[0]), []).append(fila)
+        for dia, filas in por_dia.items():
+            try:
+                con = self._conexion(dia)
+                with con:  # Una transacción (un commit) por lote y día
+                    con.executemany("INSERT INTO lecturas VALUES (?, ?, ?, ?)", filas)
+            except sqlite3.Error as e:
+                print(f"Error escribiendo histórico: {e}")
+                self.fallidas += len(filas)
+                continue
+            self.escritos += len(filas)
+
+    # ---------- CONSULTAS ----------
+    def _particiones(self, t0, t1):
+        dia = datetime.fromtimestamp(t0, tz=timezone.utc).date()
+        fin = datetime.fromtimestamp(t1, tz=timezone.utc).date()
+        while dia <= fin:
+            ruta = self._ruta(dia.strftime("%Y%m%d"))
+            if os.path.exists(ruta):
+                yield ruta
+            dia += timedelta(days=1)
+
+    def rango(self, sensor_id, t0, t1=None, campos=None):
+        """Lecturas de un sensor entre t0 y t1 (epoch s) como DataFrame ancho."""
+        t1 = time.time() if t1 is None else t1
+        sql = "SELECT ts, campo, valor FROM lecturas WHERE sensor = ? AND ts BETWEEN ? AND ?"
+        params = [sensor_id, t0, t1]
+        if campos:
+            sql += f" AND campo IN ({','.join('?' * len(campos))})"
+            params += list(campos)
+
+        trozos = []
+        for ruta in self._particiones(t0, t1):
+            con = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+            try:
+                trozos.append(pd.read_sql_query(sql, con, params=params))
+            finally:
+                con.close()
+        if not trozos:
+            return pd.DataFrame()
+
+        largo = pd.concat(trozos, ignore_index=True)
+        if largo.empty:
+            return pd.DataFrame()
+        ancho = largo.pivot_table(index="ts", columns="campo", values="valor", aggfunc="last")
+        ancho = ancho.sort_index().reset_index()
+        ancho.columns.name = None
+        ancho.insert(0, "received_at", pd.to_datetime(ancho.pop("ts"), unit="s"))
+        return ancho
+
+    def agregado(self, sensor_id, t0, resolucion, t1=None):
+        """Cubetas de `resolucion` s (min/max/media/cuenta, como Agregados.dataframe)
+        entre t0 y t1, agregadas en SQLite. Las cubetas cerradas se guardan en caché:
+        cada refresco solo vuelve a agregar la cubeta en curso."""
+        t1 = time.time() if t1 is None else t1
+        inicio = t0 - t0 % resolucion
+        corte = t1 - t1 % resolucion      # Principio de la cubeta en curso
+        clave = (sensor_id, resolucion, inicio, corte)
+        with self._lock_cache:
+            cerradas = self._cache.get(clave)
+        if cerradas is None:
+            cerradas = self._agregar_sql(sensor_id, inicio, corte, resolucion)
+            with self._lock_cache:
+                self._cache[clave] = cerradas
+                while len(self._cache) > CACHE_AGREGADOS:
+                    self._cache.pop(next(iter(self._cache)))
+        df = pd.concat([cerradas, self._agregar_sql(sensor_id, corte, t1, resolucion)], ignore_index=True)
+        if df.empty:
+            return pd.DataFrame()
+        return df[df["received_at"] >= pd.to_datetime(t0, unit="s")].reset_index(drop=True)
+
+    def _agregar_sql(self, sensor_id, t0, t1, resolucion):
+        # GROUP BY en SQLite: a pandas solo llegan las cubetas, no las lecturas
+        sql = ("SELECT CAST(ts / ? AS INTEGER) AS cubeta, campo, MIN(valor), MAX(valor), "
+               "SUM(valor), COUNT(valor) FROM lecturas WHERE sensor = ? AND ts >= ? AND ts < ? "
+               "GROUP BY cubeta, campo")
+        filas = []
+        for ruta in self._particiones(t0, t1):
+            con = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+            try:
+                filas += con.execute(sql, (resolucion, sensor_id, t0, t1)).fetchall()
+            finally:
+                con.close()
+        if not filas:
+            return pd.DataFrame()
+        largo = pd.DataFrame(filas, columns=["cubeta", "campo", "min", "max", "suma", "count"])
+        # Una cubeta puede repartirse entre dos ficheros diarios
+        g = largo.groupby(["cubeta", "campo"]).agg(min=("min", "min"), max=("max", "max"),
+                                                   suma=("suma", "sum"), count=("count", "sum"))
+        g["mean"] = g["suma"] / g["count"]
+        ancho = g[["min", "max", "mean", "count"]].unstack("campo")
+        ancho.columns = [f"{campo}_{estadistico}" for estadistico, campo in ancho.columns]
+        ancho = ancho.sort_index().reset_index()
+        ancho.insert(0, "received_at", pd.to_datetime(ancho.pop("cubeta") * resolucion, unit="s"))
+        return ancho
+
+    def sensores(self, t0, t1=None):
+        """IDs con datos entre t0 y t1."""
+        t1 = time.time() if t1 is None else t1
+        ids = set()
+        for ruta in self._particiones(t0, t1):
+            con = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+            try:
+                ids.update(r[0] for r in con.execute(
+                    "SELECT DISTINCT sensor FROM lecturas WHERE ts BETWEEN ? AND ?", (t0, t1)))
+            finally:
+                con.close()
+        return sorted(ids)
+
+
+def precargar(almacen, segundos, *destinos):
+    """Pasa los últimos `segundos` del histórico a cada destino (p. ej.
+    RegistroSensores.agregar) para que un reinicio del dashboard no arranque vacío."""
+    t0 = time.time() - segundos
+    for sensor_id in almacen.sensores(t0):
+        df = almacen.rango(sensor_id, t0)
+        if df.empty:
+            continue
+        ts = (df.pop("received_at") - pd.Timestamp(0)).dt.total_seconds()
+        df = df.assign(ID=sensor_id, received_ts=ts)
+        for fila in df.to_dict("records"):
+            for destino in destinos:
+                destino(fila)
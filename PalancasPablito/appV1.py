@@ -28,7 +28,7 @@ import json
 import pandas as pd
 import plotly.graph_objects as go
 import time
-from collections import deque
+from registro_sensores import RegistroSensores
 
 # ----------------------------------------------------------
 # CONFIGURACIÓN DE LA PÁGINA
@@ -45,21 +45,26 @@ st.set_page_config(
 BROKER = "192.168.0.88"
 TOPIC = "Enviromental Sensors Network"
 TARGET_ID = "A1"
-MAX_POINTS = 200
+MAX_POINTS = 200_000  # Presupuesto global de muestras (todos los sensores)
+PLOT_POINTS = 200     # Últimas muestras que se copian y dibujan en cada refresco
 
 # Usamos st.cache_resource para mantener una única instancia de los datos
 # y del cliente MQTT, evitando que se reinicien cada vez que Streamlit refresca.
 @st.cache_resource
 class SharedState:
     def __init__(self):
-        self.data = deque(maxlen=MAX_POINTS)
-        self.lock = False # Simple flag por si acaso
+        # Una serie temporal independiente por ID de sensor
+        self.registro = RegistroSensores(MAX_POINTS)
 
     def add_record(self, record):
-        self.data.append(record)
-    
-    def get_dataframe(self):
-        return pd.DataFrame(list(self.data))
+        self.registro.agregar(record)
+
+    def get_sensor_ids(self):
+        return self.registro.ids()
+
+    def get_dataframe(self, sensor_id, n=PLOT_POINTS):
+        df = self.registro.dataframe(sensor_id, n)
+        return df if df is not None else pd.DataFrame()
 
 # Instancia compartida de datos
 state = SharedState()
@@ -72,7 +77,7 @@ def on_message(client, userdata, msg):
         payload = msg.payload.decode("utf-8")
         data = json.loads(payload)
         # Guardar todos los mensajes recibidos, sin filtrar por ID
-        data["received_at"] = time.strftime("%H:%M:%S")
+        data["received_ts"] = time.time()
         state.add_record(data)
     except Exception as e:
         print(f"Error procesando mensaje: {e}")
@@ -137,14 +142,20 @@ opcion = st.selectbox(
     ("Temperatura y Humedad", "Solo Temperatura", "Solo Humedad", "Solo UVI", "Temperatura, Humedad y UVI", "Todas las variables")
 )
 
+# Selector del sensor a visualizar
+sensor_ids = state.get_sensor_ids()
+sensor_sel = st.selectbox(
+    "¿De qué sensor?",
+    sensor_ids,
+    index=sensor_ids.index(TARGET_ID) if TARGET_ID in sensor_ids else 0
+) if sensor_ids else TARGET_ID
+
 # Contenedores para métricas y gráficos
 placeholder_metrics = st.empty()
 placeholder_charts = st.empty()
 
 # --- VISUALIZACIÓN REACTIVA STREAMLIT ---
-df = state.get_dataframe()
-if 'ID' in df.columns:
-    df = df[df['ID'] == 'A1']
+df = state.get_dataframe(sensor_sel)
 
 variables = {
     "Temperatura y Humedad": ["Temp_C", "Humidity_Per"],
@@ -171,7 +182,7 @@ if not df.empty:
 
 # Mostrar gráfica en tiempo real
 if cols and not df.empty:
-    chart_data = df[cols].copy()
+    chart_data = df[[c for c in cols if c in df.columns]].copy()
     x = chart_data.index  # Eje X: número de muestra, igual que en monitor_qtt.py
 
     ylabels = {
@@ -205,7 +216,7 @@ if cols and not df.empty:
     fig.update_layout(
         xaxis_title="Muestras (tiempo)",
         yaxis_title="Valor medido",
-        title="Lecturas en tiempo real – ID A1",
+        title=f"Lecturas en tiempo real – ID {sensor_sel}",
         legend_title="Variable",
         template="simple_white",
         height=500,
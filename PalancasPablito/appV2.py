@@ -2,10 +2,11 @@ import streamlit as st
 import paho.mqtt.client as mqtt
 import json
 import pandas as pd
-import plotly.graph_objects as go
 import time
-from collections import deque
-import threading
+import os
+from registro_sensores import RegistroSensores
+from salud_conexion import SaludConexion
+from grafica_incremental import grafica_en_vivo, Traza
 
 # ----------------------------------------------------------
 # CONFIGURACIÓN Y CONSTANTES
@@ -16,15 +17,14 @@ st.set_page_config(
     page_icon="🌡️"
 )
 
-BROKER = "broker.emqx.io"
+BROKER = os.environ.get("MQTT_BROKER", "broker.emqx.io")
 TOPIC = "Enviromental Sensors Network"
 TARGET_ID = "A1"
-MAX_POINTS = 200
-UPDATE_INTERVAL_SECONDS = 5 # Intervalo para la comprobación del estado
-
-# Inicializar st.session_state para la gestión de la actualización
-if 'new_data' not in st.session_state:
-    st.session_state.new_data = False
+MAX_POINTS = 200_000 # Presupuesto global de muestras (todos los sensores)
+RECENT_POINTS = 200  # Últimas muestras que se copian a pandas en cada refresco (métricas y mensajes)
+KEEPALIVE = 15 # s; cada keepalive da una muestra de RTT (PINGREQ -> PINGRESP)
+PUSH_CHECK = 0.25 # Cada cuánto se atiende a los widgets mientras se esperan datos
+PUSH_MIN_INTERVAL = 0.2 # Agrupa ráfagas de mensajes en un solo refresco
 
 # Diccionario de variables (estático)
 variables_map = {
@@ -43,37 +43,48 @@ variables_map = {
 class SharedState:
     """Clase para mantener los datos de forma persistente y concurrente."""
     def __init__(self):
-        self.data = deque(maxlen=MAX_POINTS)
-        self.lock = threading.Lock() # Uso de un Lock para seguridad en el acceso
+        # Una serie por ID; el registro tiene su propio Lock
+        self.registro = RegistroSensores(MAX_POINTS)
 
     def add_record(self, record):
-        with self.lock:
-            self.data.append(record)
+        self.registro.agregar(record)
+
+    def get_sensor_ids(self):
+        return self.registro.ids()
+
+    def get_dataframe(self, sensor_id, n=RECENT_POINTS):
+        df = self.registro.dataframe(sensor_id, n)
+        return df if df is not None else pd.DataFrame()
 
-    def get_dataframe(self):
-        with self.lock:
-            if not self.data: 
-                return pd.DataFrame()
-            return pd.DataFrame(list(self.data))
+    def get_csv(self, sensor_id):
+        # Todo el buffer del sensor: solo al pulsar el botón de descarga
+        df = self.registro.dataframe(sensor_id)
+        return (df if df is not None else pd.DataFrame()).to_csv(index=False).encode('utf-8')
 
 state = SharedState()
 
+@st.cache_resource
+def get_salud():
+    # Estado de la conexión alimentado por los callbacks del cliente MQTT
+    return SaludConexion()
+
+salud = get_salud()
+
+def on_connect(client, userdata, flags, reason_code, properties=None):
+    # Suscribirse aquí para recuperar la suscripción tras cada reconexión
+    client.subscribe(TOPIC)
+
 def on_message(client, userdata, msg):
+    salud.mensaje_recibido()
     try:
         payload = msg.payload.decode("utf-8")
         data = json.loads(payload)
         
-        if 'ID' in data and data['ID'] == TARGET_ID:
-             data["received_at"] = time.strftime("%H:%M:%S")
+        if 'ID' in data:
+             data["received_ts"] = time.time()
+             # add_record sube la versión del sensor y despierta a las
+             # sesiones que lo están mostrando (ver final del script).
              state.add_record(data)
-             
-             # **ESTA ES LA CLAVE:** Marcar que hay nuevos datos y forzar la recarga
-             # Usamos una función de callback para evitar errores de contexto.
-             if st.session_state.get('app_running', False):
-                 st.session_state.new_data = True
-                 print("Nuevo mensaje recibido, programando rerun...")
-                 # No usamos st.rerun() directamente en el hilo MQTT.
-                 # El bucle del timer lo detectará.
 
     except Exception as e:
         print(f"Error procesando mensaje: {e}")
@@ -83,28 +94,21 @@ def start_mqtt_client():
     # Usando CallbackAPIVersion.VERSION2 para evitar DeprecationWarning
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2) 
     client.on_message = on_message
-    client.connect(BROKER, 1883, 60)
-    client.subscribe(TOPIC)
+    salud.instalar(client, on_connect=on_connect)
+    # connect_async: si el broker no está, loop_start reintenta en segundo plano
+    client.connect_async(BROKER, 1883, KEEPALIVE)
     client.loop_start() 
     return client
 
 client = start_mqtt_client()
 
-def mqtt_status(broker):
-    try:
-        temp_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        temp_client.connect(broker, 1883, 2)
-        temp_client.disconnect()
-        return True
-    except: return False
+def hace(t):
+    return "nunca" if t is None else f"hace {time.time() - t:.0f} s"
 
 # ----------------------------------------------------------
 # LÓGICA DE VISUALIZACIÓN
 # ----------------------------------------------------------
 
-# Configurar el estado de la aplicación como en ejecución
-st.session_state.app_running = True
-
 # 1. Título y explicación
 st.title("🌡️ Monitoreo de Temperatura y Humedad en una Base Lunar")
 
@@ -126,26 +130,45 @@ opcion = st.selectbox(
 )
 cols_to_display = variables_map.get(opcion, [])
 
+sensor_ids = state.get_sensor_ids()
+sensor_sel = st.selectbox(
+    "¿De qué sensor?",
+    sensor_ids,
+    index=sensor_ids.index(TARGET_ID) if TARGET_ID in sensor_ids else 0,
+    key="sensor_selector_unique"
+) if sensor_ids else TARGET_ID
+
 st.markdown("---") 
 
-# Obtener datos y filtrar (Se ejecuta en cada rerun)
-df = state.get_dataframe()
-if not df.empty and 'ID' in df.columns:
-    df_filtered = df[df['ID'] == TARGET_ID].copy()
-else:
-    df_filtered = pd.DataFrame()
+# Obtener datos y filtrar (Se ejecuta en cada rerun).
+# La versión se toma ANTES de leer para no perder mensajes que lleguen entretanto.
+version_vista = state.registro.version_de((sensor_sel,))
+df_filtered = state.get_dataframe(sensor_sel)
 
 # 3. Estado de Conexión
-if mqtt_status(BROKER):
-    st.success("🟢 Conectado al broker MQTT")
+# Solo memoria: ninguna conexión de red en cada refresco
+resumen = salud.resumen()
+if resumen["conectado"]:
+    st.success(f"🟢 Conectado al broker MQTT · último mensaje {hace(resumen['ultimo_mensaje'])}")
 else:
-    st.error("🔴 Desconectado del broker MQTT")
+    st.error(f"🔴 Desconectado del broker MQTT ({resumen['motivo']}) · desde {hace(resumen['ultimo_cambio'])}")
+with st.expander("Salud de la conexión"):
+    h1, h2, h3, h4 = st.columns(4)
+    h1.metric("Reconexiones", resumen["reconexiones"])
+    if resumen["muestras_rtt"]:
+        h2.metric("RTT p50", f"{resumen['rtt_p50_ms']:.1f} ms")
+        h3.metric("RTT p95", f"{resumen['rtt_p95_ms']:.1f} ms")
+        h4.metric("RTT p99", f"{resumen['rtt_p99_ms']:.1f} ms")
+    else:
+        h2.metric("RTT", "---")
+        st.caption(f"El RTT se mide con el keepalive (cada {KEEPALIVE} s).")
 
 # 4. Métricas
 st.header("Métricas Actuales")
 if not df_filtered.empty:
     latest = df_filtered.iloc[-1]
-    metric_cols = st.columns(len(cols_to_display))
+    cols_to_display = [c for c in cols_to_display if c in df_filtered.columns]
+    metric_cols = st.columns(max(1, len(cols_to_display)))
     for i, var in enumerate(cols_to_display):
         valor = latest.get(var, None)
         if var == "Temp_C": metric_cols[i].metric("Temperatura", f"{valor} °C")
@@ -158,20 +181,14 @@ else:
 st.markdown("---") 
 
 # 5. Gráficos
-st.header(f"Lecturas en tiempo real – ID {TARGET_ID}")
+st.header(f"Lecturas en tiempo real – ID {sensor_sel}")
 if cols_to_display and not df_filtered.empty:
-    chart_data = df_filtered[cols_to_display].copy()
-    
-    # Lógica de Plotly
-    fig = go.Figure()
-    for var in cols_to_display:
-        if var in chart_data:
-            fig.add_trace(go.Scatter(
-                x=chart_data.index, y=chart_data[var], mode="lines",
-                name=var.replace("_", " "), line=dict(width=3)
-            ))
-    fig.update_layout(height=500, template="simple_white")
-    st.plotly_chart(fig, use_container_width=True)
+    # La figura vive en el navegador: cada refresco solo manda las muestras nuevas
+    grafica_en_vivo(
+        "grafica_v2", state.registro,
+        [Traza(sensor_sel, var, var.replace("_", " ")) for var in cols_to_display],
+        altura=500, plantilla="simple_white"
+    )
 else:
      st.info("Selecciona variables o espera datos para mostrar el gráfico.")
 
@@ -182,17 +199,17 @@ if not df_filtered.empty:
     st.subheader("Últimos 10 mensajes recibidos:")
     # Usamos st.code para formatear el JSON, manteniendo la organización
     for record in df_filtered.tail(10).to_dict(orient='records'):
-        st.code(json.dumps(record, indent=2), language='json')
+        st.code(json.dumps(record, indent=2, default=str), language='json')
 else:
     st.text("No se han recibido datos para mostrar.")
 
 # 7. Botón de Descarga (¡NO en el bucle!)
 if not df_filtered.empty:
-    csv_data = df_filtered.to_csv(index=False).encode('utf-8')
     st.download_button(
         label="Descargar datos en formato CSV",
-        data=csv_data,
-        file_name="datos_sensor_A1.csv",
+        # Callable: el CSV se genera al pulsar, no en cada refresco
+        data=lambda sid=sensor_sel: state.get_csv(sid),
+        file_name=f"datos_sensor_{sensor_sel}.csv",
         mime="text/csv",
         # Clave ÚNICA que no está en un bucle y no da error
         key="download_button_final" 
@@ -202,20 +219,15 @@ if not df_filtered.empty:
 # MANEJO DE ACTUALIZACIÓN AUTOMÁTICA (El reemplazo del While True)
 # ----------------------------------------------------------
 
-# Función para reiniciar el script de Streamlit si hay nuevos datos
-def check_for_data_and_rerun():
-    # Solo ejecutar si hay nuevos datos
-    if st.session_state.new_data:
-        st.session_state.new_data = False # Resetear la bandera
-        st.rerun() # Forzar la re-ejecución del script
-
-    # Programar la próxima comprobación
-    threading.Timer(UPDATE_INTERVAL_SECONDS, check_for_data_and_rerun).start()
-
-# Asegurar que la comprobación solo se inicie una vez
-if 'rerun_timer_started' not in st.session_state:
-    check_for_data_and_rerun()
-    st.session_state.rerun_timer_started = True
-
-# La aplicación Streamlit termina aquí. El timer se encarga de re-ejecutarla
-# cuando hay nuevos datos o cada 5 segundos si quieres una actualización base.
\ No newline at end of file
+# El hilo MQTT no puede tocar st.session_state, así que es la propia sesión la que
+# espera (sin consumir CPU) sobre la Condition del registro hasta que su sensor
+# reciba datos nuevos, y solo entonces se re-ejecuta.
+while not state.registro.esperar_cambio((sensor_sel,), version_vista, PUSH_CHECK):
+    # Leer session_state es un punto de control: si el usuario cambia un
+    # widget o cierra la pestaña, Streamlit interrumpe la espera aquí.
+    _ = "var_selector_unique" in st.session_state
+    # Un cambio de estado de la conexión también merece refresco
+    if salud.conectado != resumen["conectado"]:
+        break
+time.sleep(PUSH_MIN_INTERVAL)
+st.rerun()
\ No newline at end of file
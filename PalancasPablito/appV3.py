@@ -1,11 +1,25 @@
 import streamlit as st
-import paho.mqtt.client as mqtt
 import json
 import pandas as pd
 import plotly.graph_objects as go
 import time
-from collections import deque
 import threading
+import os
+from registro_sensores import RegistroSensores
+from almacen_historico import AlmacenHistorico, precargar
+from decodificador import Decodificador, LoteLecturas
+from codec_binario import TOPIC_BINARIO
+from difusion import ClienteDifusion, DIRECCION_POR_DEFECTO
+from ingesta_async import NucleoIngesta
+from submuestreo import Agregados, reducir, MAX_PUNTOS_TRAZA
+from estadisticas_vivo import EstadisticasVivo, VENTANAS as VENTANAS_ESTADISTICAS
+from motor_alarmas import MotorAlarmas
+from limpieza import Limpiador, vacia
+from tiempo import RelojSensores, TOPIC_TIME
+from metricas import METRICAS, LockMedido, PUERTO as PUERTO_METRICAS, servir as servir_metricas
+from perfilador import Perfilador, Muestreador
+from grafica_incremental import grafica_en_vivo, Traza
+from log_trafico import LogTrafico, CARPETA_TRAFICO
 
 # ----------------------------------------------------------
 # 1. CONFIGURACIÓN DE PÁGINA
@@ -15,14 +29,57 @@ st.set_page_config(
     layout="wide",
     page_icon="🌔"
 )
+inicio_render = time.perf_counter()
+
+# Perfilado opcional del render (PERFILAR_DASHBOARD=1): tiempos por sección y pilas
+PROFILE = os.environ.get("PERFILAR_DASHBOARD") == "1"
+
+
+@st.cache_resource
+def perfilado():
+    perfil = Perfilador(activo=PROFILE)
+    return perfil, Muestreador(archivo=os.path.basename(__file__), hilos=perfil.en_curso)
+
+
+perfil, muestreador = perfilado()
+perfil.empezar()
 
 # Constantes
-BROKER = "10.42.0.1"
+BROKER = os.environ.get("MQTT_BROKER", "10.42.0.1")  # MQTT_BROKER=127.0.0.1 -> broker_local.py
 TOPIC = "Enviromental Sensors Network"
-TARGET_ID = "A1"       # TU SENSOR (Para gráficas)
-MAX_POINTS = 100       # Puntos para gráficas
-MAX_LOGS = 50          # Últimos mensajes a mostrar en el log
-REFRESH_RATE = 1       # Tasa de refresco
+# "mqtt": este proceso abre su propio cliente | "demonio": recibe de demonio_ingesta.py
+FUENTE_DATOS = os.environ.get("FUENTE_DATOS", "mqtt")
+TARGET_ID = "A1"       # TU SENSOR (Seleccionado por defecto en las gráficas)
+MAX_POINTS = 1_000_000 # Presupuesto global de muestras (todos los sensores)
+PLOT_POINTS = 20_000   # Últimas muestras en vivo (se reducen a MAX_PUNTOS_TRAZA al dibujar)
+DOWNSAMPLER = "minmax" # "minmax" (vectorizado, el más rápido) o "lttb"
+INCREMENTAL_CHARTS = True  # En vivo: el navegador conserva la figura y solo recibe las muestras nuevas
+PRELOAD_SECONDS = 6 * 3600  # Histórico que se carga en memoria al arrancar
+# Ventanas de tiempo seleccionables (None = en vivo, desde memoria)
+HISTORY_WINDOWS = {
+    "En vivo": None,
+    "Última hora": 3600,
+    "Últimas 24 h": 24 * 3600,
+    "Últimos 7 días": 7 * 24 * 3600,
+}
+TRAFFIC_ON_DISK = True # Log de tráfico indexado en trafico/ (millones de mensajes); False: solo en RAM
+TRAFFIC_PAGE_SIZE = 25 # Mensajes por página del log
+TRAFFIC_WINDOWS = {"Todo": None, "Último minuto": 60, "Últimos 10 min": 600, "Última hora": 3600}
+REFRESH_MODE = "push"  # "push": solo se refresca al llegar datos nuevos | "poll": cada REFRESH_RATE s
+REFRESH_RATE = 1       # Tasa de refresco (modo "poll")
+PUSH_CHECK = 0.25      # Cada cuánto se atiende a los widgets mientras se espera (modo "push")
+PUSH_MIN_INTERVAL = 0.2  # Agrupa ráfagas de mensajes en un solo refresco
+# Cola entre la red y el dashboard: None = contrapresión (se deja de leer del
+# socket) | "descartar_antiguos" / "por_sensor" / "muestreo" (ver cola_ingesta.py)
+QUEUE_POLICY = "descartar_antiguos"
+QUEUE_SIZE = 20_000    # Mensajes en cola antes de aplicar la política
+WORKERS = 1            # Hilos que decodifican e ingieren
+
+# Métricas propias del dashboard (las de ingesta las registra cada módulo)
+RENDER = METRICAS.histograma("dashboard_render_segundos", "Duración de cada ejecución del script",
+                             limites=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+ESPERA_LOCK = METRICAS.histograma("dashboard_espera_lock_segundos", "Espera por el lock de cada estructura",
+                                  ("estructura",), escala=1e-9)   # Se observa en ns
 
 # ----------------------------------------------------------
 # 2. GESTIÓN DE DATOS
@@ -30,61 +87,105 @@ REFRESH_RATE = 1       # Tasa de refresco
 @st.cache_resource
 class SensorData:
     def __init__(self):
-        self.graph_data = deque(maxlen=MAX_POINTS)
-        self.log_data = deque(maxlen=MAX_LOGS)
-        self.lock = threading.Lock()
+        self.registro = RegistroSensores(MAX_POINTS, lock=LockMedido(threading.Lock(), ESPERA_LOCK.de("registro")))
+        self.agregados = Agregados()   # Cubetas 1 s / 10 s / 1 min / 1 h
+        self.estadisticas = EstadisticasVivo()   # Media/desv/percentiles 1 min / 1 h / 24 h
+        self.alarmas = MotorAlarmas.desde_fichero()   # Reglas de alarmas.json
+        self.limpieza = Limpiador()   # Rangos físicos + Hampel por sensor y campo
+        # Log de tráfico: JSON serializado al llegar, índice por sensor/campo/hora y paginado
+        self.trafico = LogTrafico(CARPETA_TRAFICO if TRAFFIC_ON_DISK else None)
+        # Lo que espera la ingesta (y cada sesión al leer) por el lock de cada estructura
+        for nombre in ("agregados", "estadisticas", "alarmas", "limpieza", "trafico"):
+            estructura = getattr(self, nombre)
+            estructura.lock = LockMedido(estructura.lock, ESPERA_LOCK.de(nombre))
+        # Histórico persistente: arranque en caliente con las últimas horas
+        self.almacen = AlmacenHistorico()
+        precargar(self.almacen, PRELOAD_SECONDS, self.registro.agregar, self.agregados.agregar,
+                  self.estadisticas.agregar)
+        self.reloj = RelojSensores()   # Desfase/deriva de cada sensor frente a TimeNow
+        self.decodificador = Decodificador(self.reloj)
+        servir_metricas()   # /metrics en PUERTO_METRICAS
 
     def add_record(self, record):
-        with self.lock:
-            # 1. Log general
-            self.log_data.append(record)
-            
-            # 2. Gráficas (Solo A1 y sin errores de temperatura)
-            if record.get('ID') == TARGET_ID:
-                temp = record.get("Temp_C", 0)
-                # Filtro simple anti-picos de error
-                if temp < 150.0: 
-                    self.graph_data.append(record)
-
-    def get_graph_df(self):
-        with self.lock:
-            return pd.DataFrame(list(self.graph_data))
-
-    def get_log_df(self):
-        with self.lock:
-            return pd.DataFrame(list(self.log_data))
+        """Ingesta de una Lectura ya decodificada (o de un lote de muestras)."""
+        self.add_records([record])
+
+    def add_records(self, records):
+        """Ingesta de varios mensajes: cada estructura toma su lock una vez por llamada."""
+        # 1. Log general (se serializa aquí, una vez, y no en cada render)
+        self.trafico.agregar_varios(records)
+
+        # 2. Gráficas (Una serie por sensor y sin picos ni valores imposibles):
+        # lo que rechaza la limpieza queda a NaN y el resto de la muestra se usa
+        lecturas, lotes = [], []
+        for r in self.limpieza.limpiar_varios(records):
+            if vacia(r):
+                continue
+            (lotes if isinstance(r, LoteLecturas) else lecturas).append(r)
+        if not lecturas and not lotes:
+            # No entra en las gráficas, pero el log sí ha cambiado
+            self.registro.notificar()
+            return
+        self.registro.agregar_varios(lecturas + lotes)
+        self.alarmas.evaluar_varios(lecturas + lotes)
+        self.agregados.agregar_varios(lecturas)
+        self.estadisticas.agregar_varios(lecturas)
+        for lote in lotes:
+            self.agregados.agregar_lote(lote)
+            self.estadisticas.agregar_lote(lote)
+        # Con el demonio, es él quien escribe el histórico (una sola vez)
+        if FUENTE_DATOS == "mqtt":
+            for r in lecturas:
+                self.almacen.guardar(r)
+            for lote in lotes:
+                self.almacen.guardar_lote(lote)
+
+    def get_sensor_ids(self):
+        return self.registro.ids()
+
+    def get_graph_df(self, sensor_id, n=PLOT_POINTS):
+        # Solo se copian las últimas n muestras de cada columna
+        df = self.registro.dataframe(sensor_id, n)
+        return df if df is not None else pd.DataFrame()
+
+    def get_history_df(self, sensor_id, seconds):
+        desde = time.time() - seconds
+        # 1. Agregados en memoria a la resolución que deja <= MAX_PUNTOS_TRAZA
+        res = self.agregados.resolucion_para(seconds)
+        if res is not None:
+            df = self.agregados.dataframe(sensor_id, res, desde)
+            if df is not None:
+                return df
+            # 2. La memoria aún no cubre la ventana (arranque reciente): las mismas
+            # cubetas agregadas en SQLite (solo se recalcula la cubeta en curso)
+            return self.almacen.agregado(sensor_id, desde, res)
+        # 3. Si no, consulta por rango (índice sensor, ts) en el histórico
+        return self.almacen.rango(sensor_id, desde)
 
 state = SensorData()
 
 # ----------------------------------------------------------
 # 3. LÓGICA MQTT
 # ----------------------------------------------------------
-def on_message(client, userdata, msg):
-    try:
-        payload = msg.payload.decode("utf-8")
-        data = json.loads(payload)
-        # Añadimos hora de recepción local
-        data["received_at"] = time.strftime("%H:%M:%S")
-        state.add_record(data)
-    except Exception as e:
-        print(f"Error: {e}")
-
 @st.cache_resource
 def start_mqtt():
-    try:
-        try:
-            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        except AttributeError:
-            client = mqtt.Client()
-        client.on_message = on_message
-        client.connect(BROKER, 1883, 60)
-        client.subscribe(TOPIC)
-        client.loop_start()
-        return client
-    except Exception as e:
-        return None
-
-start_mqtt()
+    if FUENTE_DATOS == "demonio":
+        # Sin conexión al broker: los registros llegan ya decodificados
+        return ClienteDifusion(DIRECCION_POR_DEFECTO, state.add_record)
+    # Núcleo asyncio en su propio hilo: conexión, keepalive, decodificación y
+    # reparto por lotes (JSON y, de los nodos en modo binario, tramas compactas)
+    nucleo = NucleoIngesta(state.decodificador, politica=QUEUE_POLICY,
+                           trabajadores=WORKERS, capacidad=QUEUE_SIZE)
+    nucleo.conectar(BROKER, 1883, [TOPIC, TOPIC_BINARIO, TOPIC_TIME])
+    nucleo.consumidor(state.add_records, TOPIC, lotes=True)
+    nucleo.consumidor(state.add_records, TOPIC_BINARIO, lotes=True)
+    # Hora de referencia: solo alimenta el reloj (no es una lectura)
+    nucleo.consumidor(lambda m: state.reloj.referencia(m.payload, m.recibido), TOPIC_TIME, crudo=True)
+    # Los cambios de estado de las alarmas vuelven al broker (retenidos)
+    state.alarmas.publicar = lambda topic, payload: nucleo.publicar(topic, payload, qos=1, retain=True)
+    return nucleo.iniciar()
+
+ingesta = start_mqtt()
 
 # ----------------------------------------------------------
 # 4. INTERFAZ GRÁFICA
@@ -103,16 +204,51 @@ with st.expander("ℹ️ ¿Por qué son importantes estos datos?", expanded=Fals
     * ⏲️ **Presión Atmosférica:**  Necesaria para mantener la integridad estructural del módulo y permitir el intercambio gaseoso (CO₂/O₂) de las plantas. Una caída de presión indica una fuga crítica.
     """)
 
-st.info(f"📊 Graficando datos de: **{TARGET_ID}** | 👂 Escuchando red global: **{TOPIC}**")
+# --- B. SELECCIÓN DE SENSORES Y DATOS ---
+sensor_ids = state.get_sensor_ids()
+por_defecto = [TARGET_ID] if TARGET_ID in sensor_ids else sensor_ids[:1]
+selected_ids = st.multiselect(
+    "📡 Sensores a graficar (puedes superponer varios)",
+    sensor_ids,
+    default=por_defecto,
+    key="sel_sensores"
+)
+etiqueta_ids = ", ".join(selected_ids) if selected_ids else TARGET_ID
+window_label = st.radio("🕒 Ventana de tiempo", list(HISTORY_WINDOWS), horizontal=True, key="sel_ventana")
+window_seconds = HISTORY_WINDOWS[window_label]
+show_traffic = st.checkbox("Mostrar tráfico de red de todos los sensores", value=True, key="chk_trafico")
+
+# Versión de los datos que va a pintar ESTA sesión (antes de leerlos, para no perder cambios).
+# Si se muestra el tráfico de todos, cualquier mensaje cuenta; si no, solo los sensores elegidos.
+watch_ids = None if show_traffic else tuple(selected_ids)
+version_vista = state.registro.version_de(watch_ids)
+
+st.info(f"📊 Graficando datos de: **{etiqueta_ids}** | 👂 Escuchando red global: **{TOPIC}**")
 
-# --- B. DATOS ---
-df_graphs = state.get_graph_df()
-df_logs = state.get_log_df()
+# Alarmas activas de cualquier sensor (motor_alarmas, evaluado en la ingesta)
+for sensor_alarma, regla, nivel in state.alarmas.activas():
+    if nivel == "peligro":
+        st.error(f"🚨 **{sensor_alarma}**: {regla}")
+    else:
+        st.warning(f"⚠️ **{sensor_alarma}**: {regla}")
+
+perfil.marca("controles")
+
+graph_dfs = {}
+for sid in selected_ids:
+    if window_seconds is None:
+        df_sensor = state.get_graph_df(sid)
+    else:
+        df_sensor = state.get_history_df(sid, window_seconds)
+    if not df_sensor.empty:
+        graph_dfs[sid] = df_sensor
+perfil.marca("datos")
 
 # --- C. DESCARGA ---
-if not df_graphs.empty:
+if graph_dfs:
     col_dl, _ = st.columns([1, 4])
-    csv = df_graphs.to_csv(index=False).encode('utf-8')
+    df_export = pd.concat([df.assign(ID=sid) for sid, df in graph_dfs.items()], ignore_index=True)
+    csv = df_export.to_csv(index=False).encode('utf-8')
     col_dl.download_button(
         label="⬇️ Descargar Mis Datos (CSV)",
         data=csv,
@@ -120,35 +256,83 @@ if not df_graphs.empty:
         mime="text/csv",
         key="btn_download"
     )
+perfil.marca("descarga")
 
 st.markdown("---")
 
 # --- D. GRÁFICAS Y MÉTRICAS ---
-if not df_graphs.empty:
-    latest = df_graphs.iloc[-1]
+if graph_dfs:
+    # 1. Métricas (4 columnas por sensor seleccionado)
+    for sid, df_sensor in graph_dfs.items():
+        # Valor actual desde memoria (también cuando se grafica el histórico)
+        latest = state.registro.ultimo(sid) or df_sensor.iloc[-1].to_dict()
+        if len(graph_dfs) > 1:
+            st.caption(f"Sensor **{sid}**")
+        c1, c2, c3, c4 = st.columns(4)
 
-    # 1. Métricas (Ahora son 4 columnas)
-    c1, c2, c3, c4 = st.columns(4)
-    
-    c1.metric("🌡️ Temperatura", f"{latest.get('Temp_C')} °C")
-    c2.metric("💧 Humedad", f"{latest.get('Humidity_Per')} %")
-    c3.metric("☀️ UVI", f"{latest.get('UVI')}")
-    # Nueva métrica de Presión
-    c4.metric("⏲️ Presión", f"{latest.get('Pressure_hPa', '---')} hPa")
+        c1.metric("🌡️ Temperatura", f"{latest.get('Temp_C')} °C")
+        c2.metric("💧 Humedad", f"{latest.get('Humidity_Per')} %")
+        c3.metric("☀️ UVI", f"{latest.get('UVI')}")
+        # Nueva métrica de Presión
+        c4.metric("⏲️ Presión", f"{latest.get('Pressure_hPa', '---')} hPa")
 
-    # Función para dibujar gráficas limpias
+    # Estadísticas móviles ya calculadas en la ingesta (no se recorre el DataFrame)
+    with st.expander("📐 Estadísticas móviles", expanded=False):
+        ventana_est = st.radio("Ventana", list(VENTANAS_ESTADISTICAS), index=1,
+                               horizontal=True, key="sel_ventana_est")
+        for sid in graph_dfs:
+            resumen = state.estadisticas.resumen_sensor(sid, ventana_est)
+            if resumen:
+                st.caption(f"Sensor **{sid}** · ventana {ventana_est}")
+                st.dataframe(pd.DataFrame.from_dict(resumen, orient="index").round(2),
+                             use_container_width=True)
+    perfil.marca("métricas")
+
+    # Función para dibujar gráficas limpias (una traza por sensor)
     def plot_metric(label, var_name, color, unit):
-        if var_name in df_graphs.columns:
+        trazas = {sid: df for sid, df in graph_dfs.items()
+                  if var_name in df.columns or f"{var_name}_mean" in df.columns}
+        if trazas and window_seconds is None and INCREMENTAL_CHARTS:
+            # En vivo: grafica_incremental manda solo lo escrito desde el último refresco
+            grafica_en_vivo(
+                f"grafica_{var_name}", state.registro,
+                [Traza(sid, var_name, f"{label} {sid}", color if i == 0 else None)
+                 for i, sid in enumerate(trazas)],
+                titulo=f"{label} ({', '.join(trazas)})", unidad=unit,
+                altura=300, ventana=PLOT_POINTS
+            )
+        elif trazas:
             fig = go.Figure()
-            fig.add_trace(go.Scatter(
-                x=df_graphs['received_at'], 
-                y=df_graphs[var_name],
-                mode='lines+markers', 
-                name=label,
-                line=dict(color=color, width=3)
-            ))
+            for i, (sid, df_sensor) in enumerate(trazas.items()):
+                # El primer sensor mantiene el color de la métrica
+                line = dict(color=color if i == 0 else None, width=3)
+                if var_name in df_sensor.columns:
+                    # Datos crudos: se reducen a <= MAX_PUNTOS_TRAZA conservando los picos
+                    x, y = reducir(df_sensor, var_name, MAX_PUNTOS_TRAZA, DOWNSAMPLER)
+                    fig.add_trace(go.Scatter(
+                        x=x, y=y,
+                        mode='lines+markers' if len(y) <= 200 else 'lines',
+                        name=f"{label} {sid}",
+                        line=line
+                    ))
+                else:
+                    # Agregados: banda mín/máx + media de cada cubeta
+                    x = df_sensor['received_at']
+                    fig.add_trace(go.Scatter(
+                        x=x, y=df_sensor[f"{var_name}_max"], mode='lines',
+                        line=dict(width=0), showlegend=False, hoverinfo='skip'
+                    ))
+                    fig.add_trace(go.Scatter(
+                        x=x, y=df_sensor[f"{var_name}_min"], mode='lines',
+                        line=dict(width=0), fill='tonexty', name=f"Mín/Máx {sid}",
+                        fillcolor='rgba(128,128,128,0.25)'
+                    ))
+                    fig.add_trace(go.Scatter(
+                        x=x, y=df_sensor[f"{var_name}_mean"], mode='lines',
+                        name=f"{label} {sid} (media)", line=line
+                    ))
             fig.update_layout(
-                title=f"{label} ({TARGET_ID})",
+                title=f"{label} ({', '.join(trazas)})",
                 yaxis_title=unit,
                 height=300,
                 margin=dict(l=20, r=20, t=40, b=20),
@@ -156,6 +340,7 @@ if not df_graphs.empty:
                 hovermode="x unified"
             )
             st.plotly_chart(fig, use_container_width=True)
+        perfil.marca(f"gráfica {var_name}")
 
     # 2. Gráficas (4 filas)
     plot_metric("Temperatura", "Temp_C", "#FF4B4B", "°C")
@@ -165,37 +350,147 @@ if not df_graphs.empty:
     plot_metric("Presión Atmosférica", "Pressure_hPa", "#2ca02c", "hPa")
 
 else:
-    st.warning(f"⏳ Esperando datos específicos del sensor {TARGET_ID} para graficar...")
+    st.warning(f"⏳ Esperando datos específicos del sensor {etiqueta_ids} para graficar...")
 
 st.markdown("---")
+perfil.marca("separador")
 
 # --- E. LOG DE MENSAJES (Limpio y Expandido) ---
 st.subheader("📡 Tráfico de Red (Todos los Sensores)")
 
-if not df_logs.empty:
-    last_logs = df_logs.tail(10).iloc[::-1]
-    
-    for i, row in last_logs.iterrows():
-        raw_dict = row.to_dict()
-        # Eliminamos NaN para limpiar visualización
-        clean_dict = {k: v for k, v in raw_dict.items() if pd.notna(v)}
-        
-        sensor_id = clean_dict.get('ID', 'Desconocido')
-        time_rcv = clean_dict.get('received_at', '?')
-        
-        prefix = "✅" if sensor_id == TARGET_ID else "🔔"
-        
-        st.markdown(f"**{prefix} [{time_rcv}] ID: {sensor_id}**")
-        
-        # JSON completo sin contraer
-        json_str = json.dumps(clean_dict, indent=4)
-        st.code(json_str, language='json')
+if not show_traffic:
+    st.text("Tráfico oculto (solo se refresca al llegar datos de los sensores elegidos).")
+elif len(state.trafico):
+    # Filtros y paginación en el servidor: al navegador solo llega la página visible
+    def _primera_pagina():
+        st.session_state["trafico_pagina"] = 1
+
+    f1, f2, f3, f4 = st.columns([2, 1, 1, 2])
+    filtro_ids = f1.multiselect("ID", state.trafico.ids(), key="trafico_ids", on_change=_primera_pagina)
+    filtro_campo = f2.selectbox("Campo", ["(todos)"] + state.trafico.campos(), key="trafico_campo",
+                                on_change=_primera_pagina)
+    filtro_ventana = f3.selectbox("Llegada", list(TRAFFIC_WINDOWS), key="trafico_ventana",
+                                  on_change=_primera_pagina)
+    filtro_texto = f4.text_input("Buscar", key="trafico_texto", placeholder="Texto en el JSON",
+                                 on_change=_primera_pagina)
+    segundos = TRAFFIC_WINDOWS[filtro_ventana]
+    filtros = dict(
+        sensores=filtro_ids or None,
+        campo=None if filtro_campo == "(todos)" else filtro_campo,
+        desde=time.time() - segundos if segundos else None,
+        texto=filtro_texto or None,
+        tam=TRAFFIC_PAGE_SIZE,
+    )
+    pagina = state.trafico.consulta(pagina=st.session_state.get("trafico_pagina", 1) - 1, **filtros)
+    if pagina.total and not pagina.entradas:
+        # La página pedida ya no existe (filtro más estricto): a la última
+        pagina = state.trafico.consulta(pagina=pagina.paginas - 1, **filtros)
+    st.session_state["trafico_pagina"] = pagina.pagina + 1
+
+    if pagina.entradas:
+        st.dataframe(pd.DataFrame({
+            "": ["✅" if e.sensor in selected_ids else "🔔" for e in pagina.entradas],
+            "#": [e.seq for e in pagina.entradas],
+            "Hora": [time.strftime("%H:%M:%S", time.localtime(e.ts)) for e in pagina.entradas],
+            "ID": [e.sensor for e in pagina.entradas],
+            "Mensaje": [e.texto for e in pagina.entradas],
+        }), use_container_width=True, hide_index=True)
+        p1, p2 = st.columns([1, 4])
+        p1.number_input("Página", min_value=1, max_value=pagina.paginas, key="trafico_pagina")
+        mas = "" if pagina.exacto else " o más"
+        p2.caption(f"{pagina.total}{mas} mensajes · página {pagina.pagina + 1} de "
+                   f"{pagina.paginas}{'+' if mas else ''} · {len(state.trafico)} en el log")
+        with st.expander("🔎 Mensaje completo", expanded=False):
+            por_seq = {e.seq: e for e in pagina.entradas}
+            seq = st.selectbox("Mensaje", list(por_seq), key="trafico_detalle",
+                               format_func=lambda n: f"#{n} · {por_seq[n].sensor}")
+            # Solo el mensaje elegido se vuelve a formatear con sangría
+            st.code(json.dumps(json.loads(por_seq[seq].texto), indent=4), language='json')
+    else:
+        st.text("Ningún mensaje cumple el filtro.")
 
 else:
     st.text("Esperando tráfico en la red...")
+perfil.marca("log")
+
+dec = state.decodificador.estadisticas()
+if dec["mensajes"]:
+    st.caption(f"Decodificación ({dec['backend']}): {dec['mensajes']} mensajes · "
+               f"{dec['media_us']:.1f} µs/msg de media · máx {dec['max_us']:.0f} µs · "
+               f"{dec['errores']} descartados")
+limp = state.limpieza.estadisticas()
+if limp["fuera_de_rango"] or limp["picos"]:
+    por_sensor = " · ".join(f"{s}: {c['fuera_de_rango'] + c['picos']}" for s, c in limp["por_sensor"].items())
+    st.caption(f"Limpieza: {limp['fuera_de_rango']} fuera de rango y {limp['picos']} picos rechazados "
+               f"de {limp['revisadas']} muestras ({por_sensor})")
+reloj = state.reloj.estadisticas()
+if reloj["por_fuente"]:
+    desfases = " · ".join(f"{s}: {e['desfase_s']:+.2f} s ({e['deriva_ppm']:+.0f} ppm)"
+                          for s, e in reloj["por_fuente"].items())
+    referencia = (f"TimeNow {reloj['desfase_referencia_s']:+.2f} s" if reloj["referencia"]
+                  else "sin TimeNow (reloj local)")
+    st.caption(f"Relojes ({referencia}): {desfases}")
+cola = ingesta.estadisticas().get("cola") if isinstance(ingesta, NucleoIngesta) else None
+if cola:
+    st.caption(f"Cola ({cola['politica']}): {cola['en_cola']}/{cola['capacidad']} en cola · "
+               f"máx {cola['ocupacion_max']} · {cola['encolados']} encolados · "
+               f"{cola['descartados']} descartados por saturación")
+
+# --- F. MÉTRICAS (las mismas que se sirven en /metrics) ---
+with st.expander("📈 Métricas de ingesta", expanded=False):
+    ahora_metricas = time.time()
+    recibidos = METRICAS["ingesta_recibidos_total"].total() if "ingesta_recibidos_total" in METRICAS else 0
+    previas = st.session_state.get("metricas_previas")
+    st.session_state["metricas_previas"] = (ahora_metricas, recibidos)
+    ritmo = (recibidos - previas[1]) / (ahora_metricas - previas[0]) if previas and ahora_metricas > previas[0] else None
+
+    def _ms(s):
+        return "---" if s is None else f"{s * 1000:.3f} ms"
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("📥 Recibidos", f"{recibidos}", f"{ritmo:.1f} msg/s" if ritmo is not None else None)
+    m2.metric("⚙️ Decodificar (p99)", _ms(METRICAS["ingesta_decodificacion_segundos"].cuantil(0.99)))
+    m3.metric("🔒 Espera lock (p99)", _ms(ESPERA_LOCK.cuantil(0.99)))
+    m4.metric("🖥️ Render (p50)", _ms(RENDER.cuantil(0.5)))
+    st.dataframe(pd.DataFrame(METRICAS.tabla()), use_container_width=True, hide_index=True)
+    st.caption(f"Formato Prometheus en http://127.0.0.1:{PUERTO_METRICAS}/metrics (variable METRICAS_PUERTO)")
+
+perfil.marca("pie")
+
+if PROFILE:
+    with st.expander("⏱️ Perfil del render", expanded=False):
+        resumen_perfil = perfil.resumen()
+        if resumen_perfil:
+            st.caption(f"Últimas {len(perfil.ejecuciones)} ejecuciones del script, de la sección más cara a la más barata")
+            st.dataframe(pd.DataFrame.from_dict(resumen_perfil, orient="index").round(2),
+                         use_container_width=True)
+        c_muestreo, c_pilas = st.columns(2)
+        segundos_muestreo = c_muestreo.number_input("Segundos de muestreo", 1, 600, 30, key="seg_muestreo")
+        if c_muestreo.button("🔴 Muestrear pilas", key="btn_muestrear", disabled=muestreador.activo):
+            muestreador.iniciar(segundos_muestreo)
+        if muestreador.activo:
+            c_pilas.caption(f"Muestreando... {muestreador.muestras} muestras")
+        elif muestreador.pilas:
+            c_pilas.download_button("⬇️ Pilas plegadas (flamegraph)", muestreador.plegadas().encode("utf-8"),
+                                    file_name="dashboard.folded", mime="text/plain", key="btn_pilas")
+            c_pilas.caption(f"{sum(muestreador.pilas.values())} pilas en {muestreador.muestras} muestras "
+                            f"(flamegraph.pl, speedscope o `python perfilador.py dashboard.folded`)")
+    perfil.marca("perfil")
+
+perfil.terminar()
+RENDER.observar(time.perf_counter() - inicio_render)
 
 # ----------------------------------------------------------
 # 5. ACTUALIZACIÓN AUTOMÁTICA
 # ----------------------------------------------------------
-time.sleep(REFRESH_RATE)
+if REFRESH_MODE == "push":
+    # Se duerme sobre la Condition del registro hasta que llegue un mensaje que
+    # afecte a esta sesión: sin datos nuevos no se vuelve a ejecutar el script.
+    while not state.registro.esperar_cambio(watch_ids, version_vista, PUSH_CHECK):
+        # Leer session_state es un punto de control de Streamlit: si el usuario
+        # toca un widget o cierra la pestaña, la espera se interrumpe aquí.
+        _ = "sel_sensores" in st.session_state
+    time.sleep(PUSH_MIN_INTERVAL)
+else:
+    time.sleep(REFRESH_RATE)
 st.rerun()
\ No newline at end of file
@@ -0,0 +1,383 @@
+import argparse
+import heapq
+import json
+import multiprocessing as mp
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import numpy as np
+import paho.mqtt.client as mqtt
+import codec_binario
+from decodificador import Decodificador
+from registro_sensores import RegistroSensores
+from simulacion_mensajes_externos import generar_datos_simulados, UBICACION
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# ----------------------------------------------------------
+# BANCO DE CARGA Y RENDIMIENTO
+# ----------------------------------------------------------
+# Lanza miles de sensores virtuales contra un broker local y mide:
+#  - throughput publicado e ingerido (msgs/s)
+#  - latencia publicación -> dato listo para pintar (p50/p95/p99)
+#  - mensajes perdidos / duplicados (nº de secuencia por sensor)
+#  - crecimiento de memoria (RSS) de los procesos indicados con --pid
+# y deja un informe JSON. Con --referencia compara contra un informe
+# anterior y sale con código 1 si hay regresión (para usar antes de desplegar).
+#
+# La "sonda" es un suscriptor con el mismo camino de ingesta que el
+# dashboard (Decodificador + RegistroSensores): la latencia se toma
+# cuando la muestra ya está en el registro. Sonda y generadores corren
+# en procesos separados para que el GIL del banco no falsee la medida.
+#
+# Uso:
+#   python banco_carga.py --sensores 2000 --tasa 0.5 --duracion 60 --salida informe.json
+#   python banco_carga.py --formato ambiental --rafaga 10 --pid 1234 --referencia base.json
+#   python banco_carga.py --broker-local      (lanza broker_local.py: sin red, reproducible)
+
+TOPIC = "Enviromental Sensors Network"
+FORMATOS = ("co2", "ambiental", "binario")
+TOLERANCIA = 0.15   # Empeoramiento relativo permitido frente a --referencia
+
+
+# ---------- CARGA ----------
+def payload_sensor(formato, sensor_id, seq):
+    """Mensaje de un sensor virtual. Los JSON llevan Seq y Tx_ts para la sonda."""
+    ahora = time.time()
+    if formato == "binario":
+        # La trama v1 no tiene sitio para la secuencia: solo cuenta throughput
+        valores = {"Temp_C": random.uniform(15, 25), "Humidity_Per": random.uniform(30, 60),
+                   "Pressure_hPa": random.uniform(990, 1020), "UVI": random.uniform(0, 3)}
+        return codec_binario.codificar_lectura(sensor_id, valores, int(ahora))
+    if formato == "co2":
+        # Misma forma que el simulador B2
+        co, co2 = generar_datos_simulados()
+        datos = {"ID": sensor_id, "Location": UBICACION, "Tiempo_UTC": time.strftime("%Y-%j-%H:%M:%S", time.gmtime(ahora)),
+                 "CO_ppm": co, "CO2_ppm": co2, "Status": "OK"}
+    else:
+        # Misma forma que el firmware de recogida_datos.ino
+        datos = {"ID": sensor_id, "Tiempo_UTC": time.strftime("%Y-%j-%H:%M:%S", time.gmtime(ahora)),
+                 "Temp_C": round(random.uniform(15, 25), 2), "Humidity_Per": round(random.uniform(30, 60), 2),
+                 "UVI": round(random.uniform(0, 3), 2), "Pressure_hPa": round(random.uniform(990, 1020), 2)}
+    datos["Seq"] = seq
+    datos["Tx_ts"] = ahora
+    return json.dumps(datos)
+
+
+class Generador:
+    """Un cliente MQTT que publica por un grupo de sensores virtuales.
+
+    Cada sensor emite ráfagas de `rafaga` mensajes seguidos; entre ráfagas
+    espera rafaga / tasa segundos de media (exponencial si poisson=True).
+    """
+
+    def __init__(self, args, ids, topic, enviados, fallos):
+        self.args = args
+        self.ids = ids
+        self.topic = topic
+        self.enviados = enviados   # mp.Value compartidos con el proceso principal
+        self.fallos = fallos
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.max_queued_messages_set(0)
+        self.client.connect(args.broker, args.puerto, 60)
+        self.client.loop_start()
+
+    def _espera(self):
+        media = self.args.rafaga / self.args.tasa
+        return random.expovariate(1 / media) if self.args.poisson else media
+
+    def ejecutar(self, fin):
+        # Arranque escalonado para no sincronizar a todos los sensores
+        agenda = [(time.time() + random.uniform(0, self._espera()), sid) for sid in self.ids]
+        heapq.heapify(agenda)
+        seq = dict.fromkeys(self.ids, 0)
+        while agenda:
+            t, sid = agenda[0]
+            if t >= fin or time.time() >= fin:   # También si va con retraso
+                break
+            pausa = t - time.time()
+            if pausa > 0:
+                time.sleep(pausa)
+            for _ in range(self.args.rafaga):
+                info = self.client.publish(self.topic, payload_sensor(self.args.formato, sid, seq[sid]))
+                seq[sid] += 1
+                if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                    self.enviados.value += 1
+                else:
+                    self.fallos.value += 1
+            heapq.heapreplace(agenda, (t + self._espera(), sid))
+
+    def cerrar(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def _proceso_generador(args, ids, topic, fin, enviados, fallos):
+    g = Generador(args, ids, topic, enviados, fallos)
+    try:
+        g.ejecutar(fin)
+    except KeyboardInterrupt:
+        pass
+    time.sleep(0.5)   # Que salga lo que queda en el socket
+    g.cerrar()
+
+
+# ---------- SONDA (mismo camino que el dashboard) ----------
+class Sonda:
+    def __init__(self, args, topic, contador):
+        self.contador = contador    # mp.Value: progreso visible desde el proceso principal
+        self.decodificador = Decodificador()
+        self.registro = RegistroSensores()
+        self.lock = threading.Lock()
+        self.latencias = []
+        self.recibidos = 0
+        self.duplicados = 0
+        self.ultima_seq = {}    # ID -> última secuencia vista
+        self.vistos = {}        # ID -> nº de secuencias distintas vistas
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_connect = lambda c, u, f, rc, p=None: c.subscribe(topic, 0)
+        self.client.on_message = self.on_message
+        self.client.connect(args.broker, args.puerto, 60)
+        self.client.loop_start()
+
+    def on_message(self, client, userdata, msg):
+        lectura = self.decodificador.decodificar(msg.payload)
+        if lectura is None:
+            return
+        self.registro.agregar(lectura)
+        listo = time.time()
+        extra = getattr(lectura, "extra", None) or {}
+        with self.lock:
+            self.recibidos += 1
+            self.contador.value = self.recibidos
+            if "Tx_ts" in extra:
+                self.latencias.append(listo - extra["Tx_ts"])
+            seq = extra.get("Seq")
+            if seq is not None:
+                anterior = self.ultima_seq.get(lectura.ID, -1)
+                if seq <= anterior:
+                    self.duplicados += 1
+                else:
+                    self.ultima_seq[lectura.ID] = seq
+                    self.vistos[lectura.ID] = self.vistos.get(lectura.ID, 0) + 1
+
+    def resultado(self):
+        with self.lock:
+            return {
+                "recibidos": self.recibidos,
+                "unicos": sum(self.vistos.values()),
+                "duplicados": self.duplicados,
+                "latencias": np.array(self.latencias),
+                "decodificador": self.decodificador.estadisticas(),
+            }
+
+    def cerrar(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+def _proceso_sonda(args, topic, contador, parar, salida):
+    sonda = Sonda(args, topic, contador)
+    try:
+        parar.wait()
+    except KeyboardInterrupt:
+        pass
+    sonda.cerrar()
+    salida.put(sonda.resultado())
+
+
+# ---------- MEMORIA DE LOS PROCESOS VIGILADOS ----------
+def rss_mb(pid):
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / 2**20
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class Memoria(threading.Thread):
+    """Muestrea el RSS de {nombre: pid} cada `periodo` segundos."""
+
+    def __init__(self, pids, periodo=1.0):
+        super().__init__(daemon=True)
+        self.pids = dict(pids, banco=os.getpid())
+        self.periodo = periodo
+        self.muestras = {nombre: [] for nombre in self.pids}
+        self.parar = threading.Event()
+
+    def run(self):
+        while not self.parar.is_set():
+            for nombre, pid in self.pids.items():
+                mb = rss_mb(pid)
+                if mb is not None:
+                    self.muestras[nombre].append(mb)
+            self.parar.wait(self.periodo)
+
+    def resumen(self):
+        r = {}
+        for nombre, mbs in self.muestras.items():
+            if mbs:
+                r[nombre] = {"inicial_mb": round(mbs[0], 1), "final_mb": round(mbs[-1], 1),
+                             "max_mb": round(max(mbs), 1), "crecimiento_mb": round(mbs[-1] - mbs[0], 1)}
+        return r
+
+
+# ---------- INFORME ----------
+def informe(args, enviados, fallos, sonda, memoria, segundos):
+    r = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("salida", "referencia")},
+        "duracion_s": round(segundos, 2),
+        "enviados": enviados,
+        "fallos_publicacion": fallos,
+        "throughput_envio": round(enviados / segundos, 1),
+        "memoria": memoria.resumen(),
+    }
+    if sonda is not None:
+        lat = sonda["latencias"] * 1000.0
+        r.update({
+            "recibidos": sonda["recibidos"],
+            "throughput_ingesta": round(sonda["recibidos"] / segundos, 1),
+            # Lo publicado que nunca llegó (incluye lo que falta al final)
+            "perdidos": enviados - sonda["unicos"] if args.formato != "binario" else None,
+            "duplicados": sonda["duplicados"],
+            "decodificador": sonda["decodificador"],
+        })
+        if len(lat):
+            p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+            r["latencia_ms"] = {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2),
+                                "max": round(float(lat.max()), 2)}
+    return r
+
+
+def regresiones(actual, base, tolerancia=TOLERANCIA):
+    """Lista de métricas que han empeorado más de `tolerancia` frente a `base`."""
+    fallos = []
+
+    def comparar(nombre, a, b, mayor_es_mejor):
+        if a is None or b is None or b == 0:
+            return
+        cambio = (a - b) / abs(b)
+        if (mayor_es_mejor and cambio < -tolerancia) or (not mayor_es_mejor and cambio > tolerancia):
+            fallos.append(f"{nombre}: {b} -> {a} ({cambio:+.0%})")
+
+    comparar("throughput_ingesta", actual.get("throughput_ingesta"), base.get("throughput_ingesta"), True)
+    for p in ("p50", "p99"):
+        comparar(f"latencia {p}", actual.get("latencia_ms", {}).get(p), base.get("latencia_ms", {}).get(p), False)
+    if (actual.get("perdidos") or 0) > (base.get("perdidos") or 0):
+        fallos.append(f"perdidos: {base.get('perdidos')} -> {actual.get('perdidos')}")
+    return fallos
+
+
+# ---------- PROGRAMA ----------
+def argumentos(argv=None):
+    p = argparse.ArgumentParser(description="Banco de carga MQTT para la red de sensores")
+    p.add_argument("--broker", default="127.0.0.1")
+    p.add_argument("--puerto", type=int, default=1883)
+    p.add_argument("--broker-local", action="store_true", help="Lanzar broker_local.py en --puerto y vigilar su memoria")
+    p.add_argument("--topic", default=None, help="Por defecto el topic JSON (o el binario con --formato binario)")
+    p.add_argument("--sensores", type=int, default=1000, help="Nº de sensores virtuales")
+    p.add_argument("--prefijo", default="V", help="IDs: <prefijo>0000, <prefijo>0001...")
+    p.add_argument("--formato", choices=FORMATOS, default="co2")
+    p.add_argument("--tasa", type=float, default=0.5, help="Mensajes/s por sensor (media)")
+    p.add_argument("--rafaga", type=int, default=1, help="Mensajes seguidos por envío")
+    p.add_argument("--poisson", action="store_true", help="Esperas exponenciales en vez de fijas")
+    p.add_argument("--procesos", type=int, default=4, help="Procesos generadores (una conexión MQTT cada uno)")
+    p.add_argument("--duracion", type=float, default=30.0, help="Segundos de carga")
+    p.add_argument("--espera", type=float, default=3.0, help="Segundos extra para vaciar lo que está en vuelo")
+    p.add_argument("--sin-sonda", action="store_true", help="Solo generar carga (la mide otro proceso)")
+    p.add_argument("--pid", type=int, action="append", default=[], help="Proceso a vigilar (repetible)")
+    p.add_argument("--salida", default="informe_carga.json")
+    p.add_argument("--referencia", default=None, help="Informe anterior para detectar regresiones")
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = argumentos(argv)
+    topic = args.topic or (codec_binario.TOPIC_BINARIO if args.formato == "binario" else TOPIC)
+    ids = [f"{args.prefijo}{i:04d}" for i in range(args.sensores)]
+
+    broker = None
+    if args.broker_local:
+        ruta = os.path.join(os.path.dirname(os.path.abspath(__file__)), "broker_local.py")
+        broker = subprocess.Popen([sys.executable, ruta, "--host", args.broker, "--puerto", str(args.puerto)])
+        time.sleep(1.0)
+
+    parar = mp.Event()
+    salida = mp.Queue()
+    recibidos = mp.Value("q", 0, lock=False)
+    procesos = []
+    if not args.sin_sonda:
+        procesos.append(mp.Process(target=_proceso_sonda, args=(args, topic, recibidos, parar, salida), daemon=True))
+        procesos[0].start()
+        time.sleep(1.0)   # Suscripción de la sonda activa antes de empezar
+
+    print(f"🚀 {args.sensores} sensores x {args.tasa} msg/s ({args.formato}) -> {args.broker}:{args.puerto} '{topic}'")
+    inicio = time.time()
+    fin = inicio + args.duracion
+    contadores = [(mp.Value("q", 0, lock=False), mp.Value("q", 0, lock=False)) for _ in range(args.procesos)]
+    generadores = [mp.Process(target=_proceso_generador, args=(args, ids[k::args.procesos], topic, fin, *contadores[k]),
+                              daemon=True) for k in range(args.procesos)]
+    for g in generadores:
+        g.start()
+    procesos += generadores
+    vigilados = {f"pid_{pid}": pid for pid in args.pid}
+    vigilados.update({f"generador_{k}": g.pid for k, g in enumerate(generadores)})
+    if broker:
+        vigilados["broker_local"] = broker.pid
+    if not args.sin_sonda:
+        vigilados["sonda"] = procesos[0].pid
+    memoria = Memoria(vigilados)
+    memoria.start()
+    try:
+        while any(g.is_alive() for g in generadores):
+            time.sleep(1.0)
+            enviados = sum(e.value for e, _ in contadores)
+            print(f"  {time.time() - inicio:5.0f} s | enviados {enviados} | ingeridos {recibidos.value if not args.sin_sonda else '-'}")
+    except KeyboardInterrupt:
+        print("\nCarga interrumpida.")
+    time.sleep(args.espera)
+    segundos = time.time() - inicio - args.espera
+    memoria.parar.set()
+    parar.set()
+    sonda = None if args.sin_sonda else salida.get(timeout=30)
+    for p in procesos:
+        p.join(timeout=5)
+    if broker:
+        broker.terminate()
+
+    enviados = sum(e.value for e, _ in contadores)
+    fallos = sum(f.value for _, f in contadores)
+    r = informe(args, enviados, fallos, sonda, memoria, segundos)
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(r, f, indent=2, ensure_ascii=False)
+    print(json.dumps({k: v for k, v in r.items() if k != "config"}, indent=2, ensure_ascii=False))
+    print(f"📄 Informe en {args.salida}")
+
+    if args.referencia:
+        with open(args.referencia, encoding="utf-8") as f:
+            fallos = regresiones(r, json.load(f))
+        for fallo in fallos:
+            print(f"❌ Regresión en {fallo}")
+        if fallos:
+            return 1
+        print("✅ Sin regresiones frente a la referencia")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
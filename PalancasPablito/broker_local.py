@@ -0,0 +1,287 @@
+import argparse
+import asyncio
+import struct
+import threading
+from protocolo_mqtt import (
+    CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP, SUBSCRIBE, SUBACK,
+    UNSUBSCRIBE, UNSUBACK, PINGREQ, DISCONNECT, PINGRESP_BYTES,
+    paquete, leer_paquete, leer_cadena, leer_publish, trama_publish, coincide,
+)
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# ----------------------------------------------------------
+# BROKER MQTT LOCAL (para pruebas sin red y benchmarks)
+# ----------------------------------------------------------
+# Subconjunto de MQTT 3.1.1 sobre asyncio, suficiente para todos los
+# scripts del proyecto:
+#  - CONNECT / CONNACK (sin usuario obligatorio; el "will" se publica si
+#    el cliente se cae sin DISCONNECT)
+#  - SUBSCRIBE / UNSUBSCRIBE con comodines "+" y "#"
+#  - PUBLISH QoS 0 y 1 (QoS 2 se acepta y se reparte como QoS 1)
+#  - Mensajes retenidos
+#  - PINGREQ / PINGRESP
+# Sin sesiones persistentes ni reintentos de QoS 1: todo vive en memoria.
+# Los paquetes se (de)serializan con protocolo_mqtt.py.
+#
+# Para apuntar los scripts aquí:  MQTT_BROKER=127.0.0.1
+# Uso:  python broker_local.py [--host 127.0.0.1] [--puerto 1883]
+
+HOST = "127.0.0.1"
+PUERTO = 1883
+MAX_BUFFER_SALIDA = 8 * 2**20   # Bytes pendientes por cliente antes de tirar QoS 0
+MAX_DESTINOS = 10_000           # Topics distintos en la caché de coincidencias (luego se vacía)
+
+
+class _Sesion(asyncio.Protocol):
+    def __init__(self, broker):
+        self.broker = broker
+        self.transport = None
+        self.buf = bytearray()
+        self.client_id = None
+        self.conectada = False    # Hasta aceptar su CONNECT no se atiende nada más
+        self.suscripciones = {}   # filtro -> QoS concedido
+        self.will = None
+        self.siguiente_id = 0
+        self.descartados = 0
+
+    # ---------- asyncio ----------
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buf += data
+        ini = 0
+        try:
+            while True:
+                p = leer_paquete(self.buf, ini)
+                if p is None:
+                    break
+                tipo, flags, cuerpo, ini = p
+                self._atender(tipo, flags, cuerpo)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            print(f"Paquete inválido de {self.client_id}: {e}")
+            self.transport.close()
+        del self.buf[:ini]
+
+    def connection_lost(self, exc):
+        self.broker.quitar(self)
+        if self.conectada and self.will is not None:
+            self.broker.publicar(*self.will)
+
+    # ---------- envío ----------
+    def enviar(self, topic, payload, qos, retain=False):
+        if self.transport.is_closing():
+            return
+        if qos == 0 and self.transport.get_write_buffer_size() > MAX_BUFFER_SALIDA:
+            self.descartados += 1   # Cliente lento: no se le deja crecer la memoria
+            return
+        packet_id = None
+        if qos:
+            self.siguiente_id = self.siguiente_id % 0xFFFF + 1
+            packet_id = self.siguiente_id
+        self.transport.write(trama_publish(topic, payload, qos, retain, packet_id))
+
+    # ---------- protocolo ----------
+    def _atender(self, tipo, flags, cuerpo):
+        if not self.conectada:
+            # El primer paquete tiene que ser CONNECT; si no, se corta la conexión
+            if tipo == CONNECT and not self.transport.is_closing():
+                self._connect(cuerpo)
+            else:
+                self.transport.close()
+            return
+        if tipo == PUBLISH:
+            self._publish(flags, cuerpo)
+        elif tipo == CONNECT:
+            self.transport.close()   # Un segundo CONNECT es una violación del protocolo
+        elif tipo == SUBSCRIBE:
+            self._subscribe(cuerpo)
+        elif tipo == UNSUBSCRIBE:
+            self._unsubscribe(cuerpo)
+        elif tipo == PINGREQ:
+            self.transport.write(PINGRESP_BYTES)
+        elif tipo == PUBREL:
+            self.transport.write(paquete(PUBCOMP, 0, cuerpo[:2]))
+        elif tipo == DISCONNECT:
+            self.will = None
+            self.transport.close()
+        # PUBACK / PUBREC / PUBCOMP de los clientes: sin reintentos, nada que hacer
+
+    def _connect(self, cuerpo):
+        _, pos = leer_cadena(cuerpo, 0)          # "MQTT" (o "MQIsdp" en 3.1)
+        nivel, flags = cuerpo[pos], cuerpo[pos + 1]
+        pos += 4                                # nivel + flags + keepalive
+        cid, pos = leer_cadena(cuerpo, pos)
+        self.client_id = cid.decode("utf-8") or f"anon-{id(self):x}"
+        if flags & 0x04:
+            topic, pos = leer_cadena(cuerpo, pos)
+            mensaje, pos = leer_cadena(cuerpo, pos)
+            self.will = (topic.decode("utf-8"), mensaje, min((flags >> 3) & 0x03, 1), bool(flags & 0x20))
+        if nivel not in (3, 4):
+            self.transport.write(paquete(CONNACK, 0, b"\x00\x01"))   # Versión no soportada
+            self.transport.close()
+            return
+        self.conectada = True
+        self.broker.registrar(self)
+        self.transport.write(paquete(CONNACK, 0, b"\x00\x00"))
+
+    def _publish(self, flags, cuerpo):
+        topic, payload, qos, retain, packet_id = leer_publish(flags, cuerpo)
+        if qos:
+            self.transport.write(paquete(PUBACK if qos == 1 else PUBREC, 0, packet_id))
+        self.broker.publicar(topic, payload, min(qos, 1), retain)
+
+    def _subscribe(self, cuerpo):
+        packet_id, pos = cuerpo[:2], 2
+        concedidos = bytearray()
+        nuevos = []
+        while pos < len(cuerpo):
+            filtro, pos = leer_cadena(cuerpo, pos)
+            qos = min(cuerpo[pos] & 0x03, 1)
+            pos += 1
+            filtro = filtro.decode("utf-8")
+            self.suscripciones[filtro] = qos
+            concedidos.append(qos)
+            nuevos.append((filtro, qos))
+        self.broker.suscripciones_cambiadas()
+        self.transport.write(paquete(SUBACK, 0, packet_id + bytes(concedidos)))
+        for filtro, qos in nuevos:
+            for topic, (payload, qos_ret) in self.broker.retenidos_para(filtro):
+                self.enviar(topic, payload, min(qos, qos_ret), retain=True)
+
+    def _unsubscribe(self, cuerpo):
+        packet_id, pos = cuerpo[:2], 2
+        while pos < len(cuerpo):
+            filtro, pos = leer_cadena(cuerpo, pos)
+            self.suscripciones.pop(filtro.decode("utf-8"), None)
+        self.broker.suscripciones_cambiadas()
+        self.transport.write(paquete(UNSUBACK, 0, packet_id))
+
+
+class BrokerLocal:
+    def __init__(self, host=HOST, puerto=PUERTO):
+        self.host = host
+        self.puerto = puerto
+        self.sesiones = {}       # client_id -> _Sesion
+        self.retenidos = {}      # topic -> (payload, qos)
+        self._destinos = {}      # topic -> [(sesión, qos)] (caché de coincidencias)
+        self.publicados = 0
+        self.servidor = None
+        self.loop = None
+        self._hilo = None
+
+    # ---------- sesiones ----------
+    def registrar(self, sesion):
+        anterior = self.sesiones.get(sesion.client_id)
+        if anterior is not None and anterior is not sesion:
+            # Mismo client_id: MQTT manda cerrar la conexión vieja
+            anterior.will = None
+            anterior.transport.close()
+        self.sesiones[sesion.client_id] = sesion
+        self.suscripciones_cambiadas()
+
+    def quitar(self, sesion):
+        if self.sesiones.get(sesion.client_id) is sesion:
+            del self.sesiones[sesion.client_id]
+            self.suscripciones_cambiadas()
+
+    def suscripciones_cambiadas(self):
+        self._destinos.clear()
+
+    def _destinos_de(self, topic):
+        destinos = self._destinos.get(topic)
+        if destinos is None:
+            destinos = []
+            for s in self.sesiones.values():
+                qos = max((q for f, q in s.suscripciones.items() if coincide(f, topic)), default=None)
+                if qos is not None:
+                    destinos.append((s, qos))
+            if len(self._destinos) >= MAX_DESTINOS:
+                self._destinos.clear()   # Topics con IDs únicos no deben hacer crecer la caché sin fin
+            self._destinos[topic] = destinos
+        return destinos
+
+    # ---------- mensajes ----------
+    def publicar(self, topic, payload, qos=0, retain=False):
+        self.publicados += 1
+        if retain:
+            if payload:
+                self.retenidos[topic] = (payload, qos)
+            else:
+                self.retenidos.pop(topic, None)
+        for sesion, qos_sub in self._destinos_de(topic):
+            sesion.enviar(topic, payload, min(qos, qos_sub))
+
+    def retenidos_para(self, filtro):
+        return [(t, v) for t, v in self.retenidos.items() if coincide(filtro, t)]
+
+    def estadisticas(self):
+        return {
+            "clientes": len(self.sesiones),
+            "publicados": self.publicados,
+            "retenidos": len(self.retenidos),
+            "descartados": sum(s.descartados for s in self.sesiones.values()),
+        }
+
+    # ---------- arranque ----------
+    async def iniciar(self):
+        self.loop = asyncio.get_running_loop()
+        self.servidor = await self.loop.create_server(lambda: _Sesion(self), self.host, self.puerto)
+        return self
+
+    async def servir(self):
+        await self.iniciar()
+        print(f"🛰️  Broker local en {self.host}:{self.puerto}")
+        async with self.servidor:
+            await self.servidor.serve_forever()
+
+    def iniciar_en_hilo(self):
+        """Arranca el broker en un hilo propio (para usarlo dentro de otro script)."""
+        listo = threading.Event()
+        error = []
+
+        def _correr():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.iniciar())
+            except BaseException as e:   # p. ej. puerto ocupado: se relanza en quien llamó
+                error.append(e)
+                loop.close()
+                return
+            finally:
+                listo.set()
+            loop.run_forever()
+
+        self._hilo = threading.Thread(target=_correr, daemon=True)
+        self._hilo.start()
+        listo.wait()
+        if error:
+            raise error[0]
+        return self
+
+    def detener(self):
+        if self.loop is not None and self.servidor is not None:
+            self.loop.call_soon_threadsafe(self.servidor.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Broker MQTT local (subconjunto 3.1.1)")
+    p.add_argument("--host", default=HOST)
+    p.add_argument("--puerto", type=int, default=PUERTO)
+    args = p.parse_args(argv)
+    if uvloop is not None:
+        uvloop.install()
+    try:
+        asyncio.run(BrokerLocal(args.host, args.puerto).servir())
+    except KeyboardInterrupt:
+        print("\nBroker detenido.")
+
+
+if __name__ == "__main__":
+    main()
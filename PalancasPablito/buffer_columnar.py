@@ -0,0 +1,129 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------------
+# BUFFER CIRCULAR COLUMNAR (NumPy)
+# ----------------------------------------------------------
+# Sustituye a la deque de diccionarios: cada campo vive en su propio
+# array float64 preasignado y la marca de tiempo en otro.
+#
+# Truco del "espejo": cada muestra se escribe dos veces, en la posición
+# i y en i + capacidad. Así las últimas N muestras SIEMPRE están
+# contiguas en memoria y se pueden devolver como una vista (sin copia).
+
+CAMPOS_SENSOR = ("Temp_C", "Humidity_Per", "UVI", "Pressure_hPa")
+
+_generaciones = itertools.count(1)
+
+
+class BufferColumnar:
+    def __init__(self, capacidad, campos=CAMPOS_SENSOR):
+        self.capacidad = int(capacidad)
+        self.campos = tuple(campos)
+        # Columna de tiempo (epoch en segundos) + una columna por campo
+        self.tiempo = np.full(2 * self.capacidad, np.nan)
+        self.columnas = {c: np.full(2 * self.capacidad, np.nan) for c in self.campos}
+        self.pos = 0        # Siguiente posición a escribir (0..capacidad-1)
+        self.total = 0      # Muestras escritas desde el inicio (o desde redimensionar)
+        # Cursor para leer "lo nuevo": `escritas` nunca baja (tampoco al
+        # redimensionar) y `generacion` cambia si el buffer se crea de nuevo
+        self.generacion = next(_generaciones)
+        self.escritas = 0
+
+    def __len__(self):
+        return min(self.total, self.capacidad)
+
+    def agregar(self, t, valores):
+        """Añade una muestra. `valores` es un dict campo -> número."""
+        i = self.pos
+        j = i + self.capacidad
+        self.tiempo[i] = self.tiempo[j] = t
+        for campo, col in self.columnas.items():
+            v = valores.get(campo)
+            try:
+                v = float(v) if v is not None else np.nan
+            except (TypeError, ValueError):
+                v = np.nan
+            col[i] = col[j] = v
+        self.pos = (i + 1) % self.capacidad
+        self.total += 1
+        self.escritas += 1
+
+    def agregar_lote(self, t, columnas):
+        """Añade N muestras de golpe: t (N,) y columnas {campo: array (N,)}.
+
+        Escritura vectorizada en las dos mitades del espejo; si el lote no
+        cabe entero solo se guardan las últimas `capacidad` muestras.
+        """
+        t = np.asarray(t, dtype=float)
+        n = len(t)
+        if n == 0:
+            return
+        k = min(n, self.capacidad)
+        idx = (self.pos + (n - k) + np.arange(k)) % self.capacidad
+        espejo = idx + self.capacidad
+        self.tiempo[idx] = self.tiempo[espejo] = t[n - k:]
+        for campo, col in self.columnas.items():
+            v = columnas.get(campo)
+            v = np.nan if v is None else np.asarray(v, dtype=float)[n - k:]
+            col[idx] = col[espejo] = v
+        self.pos = (self.pos + n) % self.capacidad
+        self.total += n
+        self.escritas += n
+
+    def agregar_campo(self, campo):
+        """Añade una columna nueva (rellena con NaN) si no existía."""
+        if campo not in self.columnas:
+            self.columnas[campo] = np.full(2 * self.capacidad, np.nan)
+            self.campos += (campo,)
+
+    def redimensionar(self, capacidad):
+        """Cambia la capacidad conservando las muestras más recientes que quepan."""
+        capacidad = int(capacidad)
+        if capacidad == self.capacidad:
+            return
+        n = min(len(self), capacidad)
+        t, cols = self.ultimos(n)
+        nuevo = BufferColumnar(capacidad, self.campos)
+        nuevo.tiempo[:n] = nuevo.tiempo[capacidad:capacidad + n] = t
+        for c, col in cols.items():
+            nuevo.columnas[c][:n] = nuevo.columnas[c][capacidad:capacidad + n] = col
+        self.capacidad = capacidad
+        self.tiempo = nuevo.tiempo
+        self.columnas = nuevo.columnas
+        self.pos = n % capacidad
+        self.total = n
+
+    def _rango(self, n):
+        # Las últimas n muestras terminan justo antes de pos + capacidad
+        n = len(self) if n is None else min(int(n), len(self))
+        fin = self.pos + self.capacidad
+        return fin - n, fin
+
+    def ultimos(self, n=None):
+        """Vista (sin copia) de las últimas n muestras: (tiempo, {campo: array})."""
+        ini, fin = self._rango(n)
+        return self.tiempo[ini:fin], {c: col[ini:fin] for c, col in self.columnas.items()}
+
+    def ultimo(self):
+        """Última muestra como dict, o None si está vacío."""
+        if self.total == 0:
+            return None
+        k = self.pos + self.capacidad - 1
+        fila = {c: col[k] for c, col in self.columnas.items()}
+        fila["received_at"] = self.tiempo[k]
+        return fila
+
+    def dataframe(self, n=None, copiar=True):
+        """DataFrame de las últimas n muestras.
+
+        Con copiar=False las columnas comparten memoria con el buffer (las
+        muestras más antiguas pueden sobrescribirse mientras se usa).
+        """
+        t, cols = self.ultimos(n)
+        datos = {"received_at": pd.to_datetime(t, unit="s")}
+        for c, col in cols.items():
+            datos[c] = col.copy() if copiar else col
+        return pd.DataFrame(datos, copy=False)
@@ -0,0 +1,127 @@
+import math
+import struct
+import time
+import numpy as np
+
+# ----------------------------------------------------------
+# FORMATO BINARIO COMPACTO (opcional) PARA LOS NODOS ESP32
+# ----------------------------------------------------------
+# Los nodos que lo activan (FORMATO_BINARIO en el .ino) publican en
+# TOPIC_BINARIO en vez de en el topic JSON, para que los consumidores
+# antiguos no reciban bytes que no entienden. Los colectores Python se
+# suscriben a los dos y detectan el formato de CADA mensaje por el
+# primer byte (MAGIA), así que el JSON sigue funcionando igual.
+#
+# Trama v1, little endian, 40 bytes (el JSON equivalente ocupa ~130):
+#   B   magia (0xA5)
+#   B   versión (1)
+#   B   máscara de campos presentes (bit i -> CAMPOS_BINARIO[i])
+#   B   reservado
+#   8s  ID del sensor (ASCII, relleno con \0)
+#   I   hora del sensor en epoch s (0 = sin sincronizar)
+#   6f  Temp_C, Humidity_Per, Pressure_hPa, UVI, CO_ppm, CO2_ppm (float32)
+
+MAGIA = 0xA5
+VERSION_LECTURA = 1
+TOPIC_BINARIO = "Enviromental Sensors Network/bin"
+
+# Mismo orden que decodificador.CAMPOS_ESQUEMA
+CAMPOS_BINARIO = ("Temp_C", "Humidity_Per", "Pressure_hPa", "UVI", "CO_ppm", "CO2_ppm")
+DECIMALES = 3   # Quita el "ruido" de float32 al pasar a float64
+
+CABECERA = struct.Struct("<BBBB")
+LECTURA_V1 = struct.Struct("<BBBB8sI6f")
+
+# El mismo layout como dtype de NumPy para decodificar muchas tramas de golpe
+DTYPE_V1 = np.dtype([
+    ("magia", "u1"), ("version", "u1"), ("mascara", "u1"), ("reservado", "u1"),
+    ("id", "S8"), ("epoch", "<u4"),
+] + [(c, "<f4") for c in CAMPOS_BINARIO])
+
+assert DTYPE_V1.itemsize == LECTURA_V1.size
+
+
+def es_binario(payload):
+    return len(payload) >= CABECERA.size and payload[0] == MAGIA
+
+
+def tiempo_utc(epoch):
+    """Epoch del sensor -> "AAAA-DDD-HH:MM:SS" (mismo formato que TimeNow)."""
+    return time.strftime("%Y-%j-%H:%M:%S", time.gmtime(epoch)) if epoch else None
+
+
+def codificar_lectura(sensor_id, valores, epoch=0):
+    """Empaqueta una lectura (dict campo -> valor) en una trama v1."""
+    mascara = 0
+    nums = []
+    for i, campo in enumerate(CAMPOS_BINARIO):
+        v = valores.get(campo)
+        if v is None or (isinstance(v, float) and math.isnan(v)):
+            nums.append(math.nan)
+        else:
+            mascara |= 1 << i
+            nums.append(float(v))
+    return LECTURA_V1.pack(MAGIA, VERSION_LECTURA, mascara, 0,
+                           sensor_id.encode("ascii")[:8], int(epoch), *nums)
+
+
+def decodificar_lectura(payload):
+    """Trama v1 -> (ID, epoch, tupla de 6 floats con NaN en los ausentes)."""
+    magia, version, mascara, _, sid, epoch, *nums = LECTURA_V1.unpack_from(payload)
+    if magia != MAGIA or version != VERSION_LECTURA:
+        raise ValueError(f"Trama binaria no soportada (versión {version})")
+    for i in range(len(nums)):
+        # float32 -> float con los decimales que realmente manda el firmware
+        nums[i] = round(nums[i], DECIMALES) if mascara & (1 << i) else math.nan
+    return sid.rstrip(b"\0").decode("ascii"), epoch, tuple(nums)
+
+
+def decodificar_lote_v1(tramas):
+    """Muchas tramas v1 (lista de bytes) -> array estructurado de NumPy, sin bucles."""
+    datos = np.frombuffer(b"".join(tramas), dtype=DTYPE_V1)
+    if len(datos) and (np.any(datos["magia"] != MAGIA) or np.any(datos["version"] != VERSION_LECTURA)):
+        raise ValueError("Lote con tramas que no son v1")
+    return datos
+
+
+# ----------------------------------------------------------
+# TRAMA DE LOTE (v2): N muestras de un nodo en un solo mensaje
+# ----------------------------------------------------------
+#   B B B B 8s I H   cabecera como v1 (versión 2) + nº de muestras N
+#   N x H            desfase de cada muestra respecto a `epoch`, en ms
+#   K x N x f        una columna float32 por cada campo presente en la máscara
+VERSION_LOTE = 2
+CABECERA_LOTE = struct.Struct("<BBBB8sIH")
+
+
+def codificar_lote(sensor_id, dt_ms, columnas, epoch=0):
+    """Empaqueta un lote: dt_ms (N enteros) y columnas {campo: N valores}."""
+    dt = np.asarray(dt_ms, dtype="<u2")
+    mascara = 0
+    bloques = []
+    for i, campo in enumerate(CAMPOS_BINARIO):
+        if campo in columnas:
+            mascara |= 1 << i
+            bloques.append(np.asarray(columnas[campo], dtype="<f4").tobytes())
+    cab = CABECERA_LOTE.pack(MAGIA, VERSION_LOTE, mascara, 0,
+                             sensor_id.encode("ascii")[:8], int(epoch), len(dt))
+    return cab + dt.tobytes() + b"".join(bloques)
+
+
+def decodificar_lote(payload):
+    """Trama v2 -> (ID, epoch, dt_ms, {campo: array float64}) sin bucles por muestra."""
+    magia, version, mascara, _, sid, epoch, n = CABECERA_LOTE.unpack_from(payload)
+    if magia != MAGIA or version != VERSION_LOTE:
+        raise ValueError(f"Trama de lote no soportada (versión {version})")
+    campos = [c for i, c in enumerate(CAMPOS_BINARIO) if mascara & (1 << i)]
+    ini = CABECERA_LOTE.size
+    if len(payload) != ini + 2 * n + 4 * n * len(campos):
+        raise ValueError("Trama de lote con longitud incorrecta")
+    dt = np.frombuffer(payload, dtype="<u2", count=n, offset=ini).astype(np.int64)
+    valores = np.frombuffer(payload, dtype="<f4", count=n * len(campos), offset=ini + 2 * n)
+    valores = valores.astype(float).round(DECIMALES).reshape(len(campos), n)
+    return sid.rstrip(b"\0").decode("ascii"), epoch, dt, dict(zip(campos, valores))
+
+
+def version_trama(payload):
+    return payload[1] if es_binario(payload) and len(payload) > 1 else None
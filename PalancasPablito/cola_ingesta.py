@@ -0,0 +1,200 @@
+import re
+import threading
+from collections import Counter, deque
+import codec_binario
+from metricas import METRICAS
+
+# ----------------------------------------------------------
+# COLA ACOTADA ENTRE EL CALLBACK DE RED Y LOS CONSUMIDORES
+# ----------------------------------------------------------
+# El hilo de red (on_message de paho o el loop de ingesta_async) solo mete
+# bytes crudos en una cola acotada y vuelve: decodificar y guardar lo hace
+# un pool de trabajadores. Si la cola se llena NUNCA se espera: se aplica
+# una política de descarte y se cuenta lo perdido.
+#
+#  - "descartar_antiguos": entra el nuevo y sale el más viejo.
+#  - "por_sensor": con la cola llena, se tira el mensaje nuevo si su sensor
+#    ya ocupa más de su parte (capacidad / sensores en cola); si no, el más
+#    viejo. Un nodo que inunda la red no deja sin sitio a los demás.
+#  - "muestreo": a partir de media cola se acepta 1 de cada k mensajes
+#    (k crece con la ocupación hasta MUESTREO_MAX); llena, se tira el nuevo.
+#
+# Sin locks en el camino del productor: deque.append/popleft son atómicos,
+# el contador por sensor solo lo escribe el productor (los trabajadores le
+# devuelven las claves consumidas por otra deque) y el aviso a los
+# trabajadores es un Event que solo se toca si estaban parados.
+#
+# Cada trabajador tiene su propia cola y los mensajes se reparten por ID
+# de sensor: se mantiene el orden de cada sensor aunque haya varios.
+
+POLITICAS = ("descartar_antiguos", "por_sensor", "muestreo")
+CAPACIDAD_COLA = 20_000
+TRABAJADORES = 1        # Con el GIL, más de 1 solo ayuda si los consumidores hacen E/S
+LOTE_TRABAJADOR = 500   # Mensajes que un trabajador saca de una vez
+MUESTREO_MAX = 9        # Con la cola casi llena se acepta 1 de cada 9
+
+_RE_ID = re.compile(rb'"ID"\s*:\s*"([^"]*)"')
+
+
+def clave_sensor(payload):
+    """ID del sensor sin decodificar el mensaje entero (b"" si no se encuentra)."""
+    if codec_binario.es_binario(payload):
+        return bytes(payload[4:12]).rstrip(b"\0")
+    m = _RE_ID.search(payload, 0, 256)
+    return m.group(1) if m else b""
+
+
+class ColaAcotada:
+    """Cola de un productor y un consumidor con política de desbordamiento."""
+
+    def __init__(self, capacidad=CAPACIDAD_COLA, politica="descartar_antiguos"):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política desconocida: {politica} (válidas: {', '.join(POLITICAS)})")
+        self.capacidad = max(1, int(capacidad))
+        self.politica = politica
+        self.items = deque()               # (clave, item)
+        self.hay_datos = threading.Event()
+        self._en_cola = Counter()          # clave -> mensajes en cola (solo "por_sensor")
+        self._devueltos = deque()          # Claves ya consumidas, pendientes de descontar
+        self._saltados = 0                 # Progreso del muestreo
+        # Contadores
+        self.encolados = 0
+        self.descartados = 0
+        self.descartados_sensor = Counter()
+        self.ocupacion_max = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    # ---------- PRODUCTOR (hilo de red) ----------
+    def meter(self, clave, item):
+        """Encola sin bloquear nunca. Devuelve False si el mensaje nuevo se descartó."""
+        if self.politica == "por_sensor":
+            self._descontar()
+        n = len(self.items)
+        if self.politica == "muestreo" and n >= self.capacidad // 2:
+            k = 1 + (MUESTREO_MAX - 1) * (n - self.capacidad // 2) // max(1, self.capacidad - self.capacidad // 2)
+            self._saltados += 1
+            if n >= self.capacidad or self._saltados % k:
+                return self._descartar(clave)
+        elif n >= self.capacidad:
+            if self.politica == "por_sensor":
+                cuota = self.capacidad / max(1, len(self._en_cola))
+                if self._en_cola[clave] >= cuota:
+                    return self._descartar(clave)
+            self._tirar_mas_viejo()
+
+        self.items.append((clave, item))
+        if self.politica == "por_sensor":
+            self._en_cola[clave] += 1
+        self.encolados += 1
+        if n + 1 > self.ocupacion_max:
+            self.ocupacion_max = n + 1
+        if not self.hay_datos.is_set():
+            self.hay_datos.set()
+        return True
+
+    def _descartar(self, clave):
+        self.descartados += 1
+        self.descartados_sensor[clave] += 1
+        return False
+
+    def _tirar_mas_viejo(self):
+        try:
+            clave, _ = self.items.popleft()
+        except IndexError:   # El trabajador la vació mientras tanto
+            return
+        self.descartados += 1
+        self.descartados_sensor[clave] += 1
+        if self.politica == "por_sensor":
+            self._restar(clave)
+
+    def _descontar(self):
+        # Claves que ya sacaron los trabajadores (solo el productor toca _en_cola)
+        while self._devueltos:
+            self._restar(self._devueltos.popleft())
+
+    def _restar(self, clave):
+        self._en_cola[clave] -= 1
+        if self._en_cola[clave] <= 0:
+            del self._en_cola[clave]
+
+    # ---------- CONSUMIDOR (trabajador) ----------
+    def sacar(self, n=LOTE_TRABAJADOR):
+        """Hasta n items (lista vacía si no hay nada)."""
+        items = []
+        try:
+            for _ in range(n):
+                clave, item = self.items.popleft()
+                items.append(item)
+                if self.politica == "por_sensor":
+                    self._devueltos.append(clave)
+        except IndexError:
+            pass
+        return items
+
+    def esperar(self, timeout=0.1):
+        """Duerme hasta que el productor avise (o timeout) si la cola está vacía."""
+        self.hay_datos.clear()
+        if not self.items:
+            self.hay_datos.wait(timeout)
+
+
+class PoolTrabajadores:
+    """N hilos que sacan lotes de su cola y llaman a `procesar(lista)`."""
+
+    def __init__(self, procesar, trabajadores=TRABAJADORES, capacidad=CAPACIDAD_COLA,
+                 politica="descartar_antiguos", lote=LOTE_TRABAJADOR):
+        self.procesar = procesar
+        self.lote = lote
+        self.colas = [ColaAcotada(capacidad // trabajadores, politica) for _ in range(trabajadores)]
+        self.errores = 0
+        # Profundidad y descartes se leen de las colas al pedir las métricas
+        METRICAS.medidor("cola_ingesta_ocupacion", "Mensajes esperando a un trabajador",
+                         funcion=lambda: sum(len(c) for c in self.colas))
+        METRICAS.medidor("cola_ingesta_capacidad", "Capacidad total de la cola de ingesta",
+                         funcion=lambda: sum(c.capacidad for c in self.colas))
+        METRICAS.contador("cola_ingesta_descartados_total", "Mensajes descartados por cola llena",
+                          ("sensor",), funcion=self.descartados_por_sensor)
+        METRICAS.contador("cola_ingesta_errores_total", "Excepciones al procesar un lote",
+                          funcion=lambda: self.errores)
+        for k, cola in enumerate(self.colas):
+            threading.Thread(target=self._trabajar, args=(cola,), daemon=True, name=f"trabajador-{k}").start()
+
+    def meter(self, payload, item=None):
+        """Llamar desde el callback de red: solo clasifica por sensor y encola."""
+        clave = clave_sensor(payload)
+        cola = self.colas[hash(clave) % len(self.colas)] if len(self.colas) > 1 else self.colas[0]
+        return cola.meter(clave, payload if item is None else item)
+
+    def _trabajar(self, cola):
+        while True:
+            items = cola.sacar(self.lote)
+            if not items:
+                cola.esperar()
+                continue
+            try:
+                self.procesar(items)
+            except Exception as e:
+                self.errores += 1
+                print(f"Error: {e}")
+
+    def descartados_por_sensor(self):
+        descartados = Counter()
+        for c in self.colas:
+            descartados.update(c.descartados_sensor)
+        return {k.decode("ascii", "replace"): v for k, v in descartados.items()}
+
+    def estadisticas(self):
+        descartados = Counter(self.descartados_por_sensor())
+        return {
+            "politica": self.colas[0].politica,
+            "trabajadores": len(self.colas),
+            "capacidad": sum(c.capacidad for c in self.colas),
+            "en_cola": sum(len(c) for c in self.colas),
+            "ocupacion_max": max(c.ocupacion_max for c in self.colas),
+            "encolados": sum(c.encolados for c in self.colas),
+            "descartados": sum(c.descartados for c in self.colas),
+            "descartados_por_sensor": dict(descartados.most_common(10)),
+            "errores": self.errores,
+        }
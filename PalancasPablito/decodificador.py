@@ -0,0 +1,323 @@
+import json
+import math
+import numpy as np
+import time
+from typing import NamedTuple, Optional
+import codec_binario
+from tiempo import NS, a_ns
+from metricas import METRICAS
+
+# ----------------------------------------------------------
+# DECODIFICADOR DE MENSAJES DE SENSORES
+# ----------------------------------------------------------
+# - Backend JSON rápido si está instalado (orjson > msgspec), si no json.
+# - Esquema declarado del payload del firmware: los campos conocidos van
+#   directos a un registro tipado y compacto (Lectura), el resto a `extra`.
+# - Mide el coste de cada decodificación (ns) para poder vigilarlo.
+# - Detecta por mensaje si el payload es JSON o binario (codec_binario.py).
+
+try:
+    import orjson
+    _loads, BACKEND = orjson.loads, "orjson"
+except ImportError:
+    try:
+        import msgspec
+        _loads, BACKEND = msgspec.json.decode, "msgspec"
+    except ImportError:
+        _loads, BACKEND = json.loads, "json"
+
+NAN = float("nan")
+
+# Campos numéricos del firmware (recogida_datos.ino, demo_final.ino, simulador B2)
+CAMPOS_ESQUEMA = ("Temp_C", "Humidity_Per", "Pressure_hPa", "UVI", "CO_ppm", "CO2_ppm")
+LOTE_V1_MIN = 8   # Tramas v1 por lote a partir de las que compensa decodificar con NumPy
+
+DECODIFICADOS = METRICAS.contador("ingesta_decodificados_total", "Mensajes decodificados", ("sensor",))
+NO_DECODIFICABLES = METRICAS.contador("ingesta_no_decodificables_total", "Mensajes descartados al decodificar")
+TIEMPO_DECODIFICACION = METRICAS.histograma("ingesta_decodificacion_segundos", "Coste de decodificar un mensaje",
+                                            escala=1e-9)   # Se observa en ns
+
+# Claves del JSON que no son medidas (Seq y Tx_ts las pone banco_carga.py)
+CLAVES_NO_MEDIDAS = {"ID", "Tiempo_UTC", "Location", "Status", "received_at", "received_ts", "Seq", "Tx_ts"}
+
+
+class Lectura(NamedTuple):
+    ID: str
+    Tiempo_UTC: Optional[str]
+    received_ts: float             # Llegada al colector (epoch s)
+    Temp_C: float = NAN
+    Humidity_Per: float = NAN
+    Pressure_hPa: float = NAN
+    UVI: float = NAN
+    CO_ppm: float = NAN
+    CO2_ppm: float = NAN
+    extra: Optional[dict] = None   # Claves fuera del esquema (Location, Status, O2...)
+    t_ns: int = 0                  # Hora de la medida corregida (epoch ns, tiempo.py); 0 = desconocida
+
+    def hora(self):
+        """Hora de la medida (epoch s): la del sensor corregida o, sin ella, la de llegada."""
+        return self.t_ns / NS if self.t_ns else self.received_ts
+
+    def medidas(self):
+        """Pares (campo, valor) numéricos presentes (sin NaN), incluidos los extra."""
+        for campo, v in zip(CAMPOS_ESQUEMA, self[3:9]):
+            if v == v:
+                yield campo, v
+        if self.extra:
+            for k, v in self.extra.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool) and v == v \
+                        and k not in CLAVES_NO_MEDIDAS:
+                    yield k, float(v)
+
+    def como_dict(self):
+        """Vista tipo JSON (para el log o exportar)."""
+        d = {"ID": self.ID}
+        if self.Tiempo_UTC is not None:
+            d["Tiempo_UTC"] = self.Tiempo_UTC
+        for campo, v in zip(CAMPOS_ESQUEMA, self[3:9]):
+            if v == v:
+                d[campo] = v
+        if self.extra:
+            d.update(self.extra)
+        d["received_at"] = time.strftime("%H:%M:%S", time.localtime(self.received_ts))
+        return d
+
+    @classmethod
+    def desde_dict(cls, data, recibido=None):
+        """Construye una Lectura desde un dict ya parseado (None si no tiene ID)."""
+        sensor_id = data.get("ID")
+        if sensor_id is None:
+            return None
+        valores = []
+        usados = 0
+        for campo in CAMPOS_ESQUEMA:
+            v = data.get(campo)
+            if v is None:
+                valores.append(NAN)
+                continue
+            usados += 1
+            try:
+                valores.append(float(v))
+            except (TypeError, ValueError):
+                valores.append(NAN)
+        extra = None
+        # Solo se recorre el dict si trae claves fuera del esquema
+        esperadas = 1 + usados + ("Tiempo_UTC" in data)
+        if len(data) > esperadas:
+            extra = {k: v for k, v in data.items()
+                     if k not in CAMPOS_ESQUEMA and k not in ("ID", "Tiempo_UTC", "received_ts", "received_at")}
+            extra = extra or None
+        if recibido is None:
+            recibido = data.get("received_ts") or time.time()
+        return cls(str(sensor_id), data.get("Tiempo_UTC"), float(recibido), *valores, extra)
+
+
+class LoteLecturas(NamedTuple):
+    """N muestras de un mismo nodo (trama de lote binaria v2 o JSON con "Lote")."""
+    ID: str
+    Tiempo_UTC: Optional[str]
+    received_ts: float          # Llegada del mensaje (= hora de la última muestra)
+    t: np.ndarray               # Hora de cada muestra (epoch s, float64)
+    columnas: dict              # campo -> np.ndarray float64 (N valores)
+    t_ns: int = 0               # Hora corregida de la última muestra (epoch ns); 0 = desconocida
+    sello_ns: int = 0           # Hora del nodo de la última muestra (cabecera + dt_ms[-1], epoch ns); 0 = sin cabecera
+
+    def __len__(self):
+        return len(self.t)
+
+    def hora(self):
+        return self.t_ns / NS if self.t_ns else self.received_ts
+
+    def t_corregido(self):
+        """Hora de cada muestra (epoch s) en el reloj corregido."""
+        return self.t + (self.t_ns / NS - self.received_ts) if self.t_ns else self.t
+
+    def medidas(self):
+        """Pares (campo, array) de las columnas del lote."""
+        return self.columnas.items()
+
+    def reemplazar(self, **cambios):
+        """Como _replace, que aquí no sirve: valida con len() y __len__ es el nº de muestras."""
+        return LoteLecturas(**{**self._asdict(), **cambios})
+
+    def filtrar(self, mascara):
+        """Lote con solo las muestras donde `mascara` es True (vectorizado)."""
+        return self.reemplazar(t=self.t[mascara],
+                               columnas={c: v[mascara] for c, v in self.columnas.items()})
+
+    def como_dict(self):
+        """Resumen para el log: nº de muestras y último valor de cada campo."""
+        d = {"ID": self.ID, "Muestras": len(self.t)}
+        if self.Tiempo_UTC is not None:
+            d["Tiempo_UTC"] = self.Tiempo_UTC
+        for c, v in self.columnas.items():
+            if len(v):
+                d[c] = float(v[-1])
+        d["received_at"] = time.strftime("%H:%M:%S", time.localtime(self.received_ts))
+        return d
+
+    @classmethod
+    def crear(cls, sensor_id, tiempo_utc, recibido, dt_ms, columnas):
+        # Sin hora fiable por muestra: la última llega "ahora" y las demás
+        # se colocan hacia atrás según sus desfases en ms.
+        dt = np.asarray(dt_ms, dtype=float)
+        t = recibido - (dt[-1] - dt) / 1000.0 if len(dt) else dt
+        cols = {c: np.asarray(v, dtype=float) for c, v in columnas.items()}
+        # La hora de la cabecera es la de dt_ms = 0, no la de la última muestra:
+        # el sello que se compara con la llegada es cabecera + dt_ms[-1].
+        sello_ns = 0
+        if tiempo_utc is not None and len(dt):
+            try:
+                sello_ns = a_ns(tiempo_utc) + int(dt[-1] * 1e6)
+            except (ValueError, UnicodeDecodeError):
+                pass
+        return cls(str(sensor_id), tiempo_utc, recibido, t, cols, 0, sello_ns)
+
+
+def como_lectura(registro):
+    """Acepta una Lectura o un dict (compatibilidad con el código antiguo)."""
+    if isinstance(registro, Lectura) or registro is None:
+        return registro
+    return Lectura.desde_dict(registro)
+
+
+class Decodificador:
+    def __init__(self, reloj=None):
+        """`reloj`: tiempo.RelojSensores opcional; con él cada registro con
+        Tiempo_UTC alimenta la estimación de su sensor y sale con t_ns."""
+        self.backend = BACKEND
+        self.reloj = reloj
+        self.mensajes = 0
+        self.binarios = 0
+        self.errores = 0
+        self.ns_total = 0
+        self.ns_max = 0
+
+    def decodificar(self, payload, recibido=None):
+        """bytes -> Lectura, LoteLecturas (tramas de lote) o None si no es válido."""
+        t0 = time.perf_counter_ns()
+        try:
+            if codec_binario.es_binario(payload):
+                self.binarios += 1
+                if codec_binario.version_trama(payload) == codec_binario.VERSION_LOTE:
+                    lectura = self._lote_binario(payload, recibido)
+                else:
+                    lectura = self._desde_binario(payload, recibido)
+            else:
+                data = _loads(payload)
+                if not isinstance(data, dict):
+                    lectura = None
+                elif "Lote" in data:
+                    lectura = self._lote_json(data, recibido)
+                else:
+                    lectura = Lectura.desde_dict(data, recibido)
+        except Exception:   # Cada backend tiene su propia excepción de parseo
+            lectura = None
+        if self.reloj is not None and lectura is not None:
+            lectura = self._sellar(lectura)
+        ns = time.perf_counter_ns() - t0
+        self.mensajes += 1
+        self.ns_total += ns
+        if ns > self.ns_max:
+            self.ns_max = ns
+        TIEMPO_DECODIFICACION.observar(ns)
+        if lectura is None:
+            self.errores += 1
+            NO_DECODIFICABLES.inc()
+        else:
+            DECODIFICADOS.de(lectura.ID).inc()
+        return lectura
+
+    def _sellar(self, registro):
+        if registro.Tiempo_UTC is None:
+            return registro
+        if isinstance(registro, LoteLecturas):
+            # Sello de la última muestra, que es la que llega en received_ts
+            t_ns = self.reloj.observar(registro.ID, registro.sello_ns or registro.Tiempo_UTC,
+                                       registro.received_ts)
+            return registro if t_ns is None else registro.reemplazar(t_ns=t_ns)
+        t_ns = self.reloj.observar(registro.ID, registro.Tiempo_UTC, registro.received_ts)
+        if t_ns is None:
+            return registro
+        return registro._replace(t_ns=t_ns)
+
+    @staticmethod
+    def _desde_binario(payload, recibido):
+        sensor_id, epoch, nums = codec_binario.decodificar_lectura(payload)
+        recibido = time.time() if recibido is None else recibido
+        return Lectura(sensor_id, codec_binario.tiempo_utc(epoch), recibido, *nums)
+
+    @staticmethod
+    def _lote_binario(payload, recibido):
+        sensor_id, epoch, dt, columnas = codec_binario.decodificar_lote(payload)
+        recibido = time.time() if recibido is None else recibido
+        return LoteLecturas.crear(sensor_id, codec_binario.tiempo_utc(epoch), recibido, dt, columnas)
+
+    @staticmethod
+    def _lote_json(data, recibido):
+        # {"ID": "A1", "Tiempo_UTC": "...", "Lote": {"dt_ms": [...], "Temp_C": [...], ...}}
+        lote = data["Lote"]
+        if data.get("ID") is None or not isinstance(lote, dict) or "dt_ms" not in lote:
+            return None
+        columnas = {c: v for c, v in lote.items() if c != "dt_ms" and isinstance(v, list)}
+        if any(len(v) != len(lote["dt_ms"]) for v in columnas.values()):
+            return None
+        recibido = time.time() if recibido is None else recibido
+        return LoteLecturas.crear(data["ID"], data.get("Tiempo_UTC"), recibido, lote["dt_ms"], columnas)
+
+    def decodificar_lote(self, payloads, recibidos=None):
+        """Varios payloads -> lista alineada con la entrada (Lectura, LoteLecturas
+        o None), en el mismo orden. Si hay al menos LOTE_V1_MIN tramas binarias
+        v1 se decodifican todas juntas con NumPy; el resto, una a una.
+        `recibidos`: hora de llegada de cada payload, o una para todos."""
+        n = len(payloads)
+        if recibidos is None or isinstance(recibidos, (int, float)):
+            recibidos = [time.time() if recibidos is None else recibidos] * n
+        v1 = {}   # posición -> Lectura sin sellar
+        posiciones = [i for i, p in enumerate(payloads)
+                      if len(p) == codec_binario.LECTURA_V1.size and codec_binario.es_binario(p)
+                      and p[1] == codec_binario.VERSION_LECTURA]
+        if len(posiciones) >= LOTE_V1_MIN:
+            t0 = time.perf_counter_ns()
+            try:
+                datos = codec_binario.decodificar_lote_v1([payloads[i] for i in posiciones])
+                bits = [(datos["mascara"] >> k) & 1 for k in range(len(CAMPOS_ESQUEMA))]
+                cols = [np.where(b, datos[c].astype(float).round(codec_binario.DECIMALES), np.nan).tolist()
+                        for b, c in zip(bits, CAMPOS_ESQUEMA)]
+                ids = [sid.rstrip(b"\0").decode("ascii") for sid in datos["id"].tolist()]
+                for k, (i, sid, epoch) in enumerate(zip(posiciones, ids, datos["epoch"].tolist())):
+                    v1[i] = Lectura(sid, codec_binario.tiempo_utc(epoch), recibidos[i], *(c[k] for c in cols))
+            except (ValueError, UnicodeDecodeError):
+                v1 = {}   # Alguna trama rara: todas una a una abajo
+            if v1:
+                por_mensaje = (time.perf_counter_ns() - t0) // len(v1)
+                self.mensajes += len(v1)
+                self.binarios += len(v1)
+                self.ns_total += por_mensaje * len(v1)
+                if por_mensaje > self.ns_max:
+                    self.ns_max = por_mensaje
+        salida = []
+        for i, p in enumerate(payloads):
+            lectura = v1.get(i)
+            if lectura is None:
+                salida.append(self.decodificar(p, recibidos[i]))
+                continue
+            # Se sella en orden de llegada: el reloj ve cada sensor en su orden
+            if self.reloj is not None:
+                lectura = self._sellar(lectura)
+            TIEMPO_DECODIFICACION.observar(por_mensaje)
+            DECODIFICADOS.de(lectura.ID).inc()
+            salida.append(lectura)
+        return salida
+
+    def estadisticas(self):
+        media_us = self.ns_total / self.mensajes / 1000 if self.mensajes else 0.0
+        return {
+            "backend": self.backend,
+            "mensajes": self.mensajes,
+            "binarios": self.binarios,
+            "errores": self.errores,
+            "media_us": media_us,
+            "max_us": self.ns_max / 1000,
+            "capacidad_msgs_s": 1e6 / media_us if media_us else math.inf,
+        }
@@ -0,0 +1,106 @@
+import os
+import paho.mqtt.client as mqtt
+from almacen_historico import AlmacenHistorico
+from decodificador import Decodificador, LoteLecturas
+from codec_binario import TOPIC_BINARIO
+from difusion import ServidorDifusion, DIRECCION_POR_DEFECTO
+from cola_ingesta import PoolTrabajadores
+from motor_alarmas import MotorAlarmas
+from limpieza import Limpiador, vacia
+from tiempo import RelojSensores, TOPIC_TIME
+from metricas import METRICAS, PUERTO, servir as servir_metricas
+
+# ----------------------------------------------------------
+# DEMONIO DE INGESTA
+# ----------------------------------------------------------
+# Una única suscripción MQTT para todo el sistema. Cada mensaje se
+# decodifica una vez, se guarda en el histórico y se reparte a todos los
+# dashboards por un socket local. Añadir pestañas o réplicas del
+# dashboard (con FUENTE_DATOS=demonio) no abre más conexiones al broker.
+#
+# El callback de paho solo encola los bytes: decodificar, escribir en disco
+# y repartir lo hace un trabajador. Si el disco o un dashboard se atascan,
+# la cola acotada descarta según POLITICA en vez de frenar la red.
+#
+# TimeNow no se encola: solo actualiza el reloj de referencia, y cada
+# lectura se guarda con la hora de su sensor corregida (tiempo.py).
+#
+# Uso:  python demonio_ingesta.py
+
+BROKER = os.environ.get("MQTT_BROKER", "10.42.0.1")
+TOPIC = "Enviromental Sensors Network"
+DIRECCION = DIRECCION_POR_DEFECTO
+POLITICA = os.environ.get("POLITICA_COLA", "por_sensor")   # Ver cola_ingesta.POLITICAS
+CAPACIDAD = 20_000
+PUERTO_METRICAS = PUERTO + 1   # El dashboard usa PUERTO en la misma máquina
+
+almacen = AlmacenHistorico()
+servidor = ServidorDifusion(DIRECCION)
+RECIBIDOS = METRICAS.contador("ingesta_recibidos_total", "Mensajes MQTT recibidos", ("topic",))
+
+reloj = RelojSensores()
+decodificador = Decodificador(reloj)
+alarmas = MotorAlarmas.desde_fichero()
+limpieza = Limpiador()
+
+
+def on_connect(client, userdata, flags, reason_code, properties=None):
+    print(f"✅ Conectado al broker {BROKER}: {reason_code}")
+    # JSON y, de los nodos en modo binario, tramas compactas
+    client.subscribe([(TOPIC, 0), (TOPIC_BINARIO, 0), (TOPIC_TIME, 0)])
+
+
+def procesar(payloads):
+    """Trabajador: decodifica, guarda y reparte un lote de mensajes."""
+    for payload in payloads:
+        try:
+            lectura = decodificador.decodificar(payload)
+            if lectura is None:
+                continue
+            # Misma limpieza que el dashboard antes de persistir (los dashboards
+            # conectados reciben el mensaje sin limpiar y aplican la suya)
+            limpia = limpieza.limpiar(lectura)
+            if not vacia(limpia):
+                if isinstance(limpia, LoteLecturas):
+                    almacen.guardar_lote(limpia)
+                else:
+                    almacen.guardar(limpia)
+                alarmas.evaluar(limpia)
+            servidor.publicar(lectura)
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+pool = PoolTrabajadores(procesar, capacidad=CAPACIDAD, politica=POLITICA)
+
+
+def on_message(client, userdata, msg):
+    # Hilo de red: solo encolar (nunca bloquea)
+    RECIBIDOS.de(msg.topic).inc()
+    if msg.topic == TOPIC_TIME:
+        reloj.referencia(msg.payload)
+        return
+    pool.meter(msg.payload)
+
+
+def main():
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.on_connect = on_connect
+    client.on_message = on_message
+    # Cambios de estado de las alarmas, retenidos en <topic alarmas>/<ID>/<regla>
+    alarmas.publicar = lambda topic, payload: client.publish(topic, payload, qos=1, retain=True)
+    client.connect(BROKER, 1883, 60)
+    servir_metricas(puerto=PUERTO_METRICAS)
+    print(f"📡 Repartiendo '{TOPIC}' en {DIRECCION} (JSON: {decodificador.backend})")
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        print("\nDemonio detenido.")
+        e = pool.estadisticas()
+        print(f"Cola ({e['politica']}): {e['encolados']} encolados · {e['descartados']} descartados · "
+              f"ocupación máx {e['ocupacion_max']}/{e['capacidad']}")
+        client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import marshal
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+import numpy as np
+from decodificador import Lectura, LoteLecturas
+
+# ----------------------------------------------------------
+# DIFUSIÓN LOCAL DE MENSAJES DECODIFICADOS
+# ----------------------------------------------------------
+# El demonio de ingesta (demonio_ingesta.py) decodifica cada mensaje UNA
+# vez y lo reparte a todos los dashboards conectados por un socket local.
+# Cada trama: 4 bytes de longitud (big endian) + 1 byte de tipo + la Lectura
+# como tupla en marshal (formato nativo de Python: mucho más barato que volver
+# a parsear JSON). Los lotes viajan con sus columnas como bytes crudos de
+# float64, que el cliente reconstruye con np.frombuffer sin copiar.
+#
+# Dirección: "unix:/ruta/al.sock" o "tcp:127.0.0.1:7071" (Windows).
+
+DIRECCION_POR_DEFECTO = "tcp:127.0.0.1:7071" if os.name == "nt" else "unix:/tmp/redes_sensores.sock"
+MAX_PENDIENTES = 10_000   # Tramas en cola por cliente lento antes de tirar las más viejas
+CABECERA = struct.Struct(">I")
+TIPO_LECTURA = b"L"
+TIPO_LOTE = b"M"
+
+
+def _crear_socket(direccion):
+    tipo, _, resto = direccion.partition(":")
+    if tipo == "unix":
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), resto
+    if tipo == "tcp":
+        host, _, puerto = resto.rpartition(":")
+        return socket.socket(socket.AF_INET, socket.SOCK_STREAM), (host, int(puerto))
+    raise ValueError(f"Dirección no soportada: {direccion}")
+
+
+def codificar(lectura):
+    """Serializa una Lectura (o un lote) una sola vez; la misma trama va a todos los clientes."""
+    if isinstance(lectura, LoteLecturas):
+        columnas = {c: v.tobytes() for c, v in lectura.columnas.items()}
+        cuerpo = TIPO_LOTE + marshal.dumps((lectura.ID, lectura.Tiempo_UTC, lectura.received_ts,
+                                            lectura.t.tobytes(), columnas, lectura.t_ns,
+                                            lectura.sello_ns))
+    else:
+        cuerpo = TIPO_LECTURA + marshal.dumps(tuple(lectura))
+    return CABECERA.pack(len(cuerpo)) + cuerpo
+
+
+def decodificar(cuerpo):
+    datos = marshal.loads(cuerpo[1:])
+    if cuerpo[:1] == TIPO_LOTE:
+        sid, tiempo_utc, recibido, t, columnas, t_ns, sello_ns = datos
+        return LoteLecturas(sid, tiempo_utc, recibido, np.frombuffer(t),
+                            {c: np.frombuffer(v) for c, v in columnas.items()}, t_ns, sello_ns)
+    return Lectura(*datos)
+
+
+class _Suscriptor:
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.pendientes = deque(maxlen=MAX_PENDIENTES)
+        self.hay_datos = threading.Condition()
+        self.perdidas = 0
+        self.vivo = True
+
+
+class ServidorDifusion:
+    """Lado del demonio: acepta dashboards y les reenvía cada trama."""
+
+    def __init__(self, direccion=DIRECCION_POR_DEFECTO):
+        self.direccion = direccion
+        self.suscriptores = []
+        self.lock = threading.Lock()
+        self.sock, destino = _crear_socket(direccion)
+        if direccion.startswith("unix:") and os.path.exists(destino):
+            os.unlink(destino)
+        if not direccion.startswith("unix:"):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(destino)
+        self.sock.listen()
+        threading.Thread(target=self._aceptar, daemon=True).start()
+
+    def _aceptar(self):
+        while True:
+            conexion, _ = self.sock.accept()
+            sus = _Suscriptor(conexion)
+            with self.lock:
+                self.suscriptores.append(sus)
+            threading.Thread(target=self._enviar, args=(sus,), daemon=True).start()
+            print(f"🖥️  Dashboard conectado ({len(self.suscriptores)} en total)")
+
+    def _enviar(self, sus):
+        try:
+            while True:
+                with sus.hay_datos:
+                    sus.hay_datos.wait_for(lambda: sus.pendientes)
+                    tramas = list(sus.pendientes)
+                    sus.pendientes.clear()
+                sus.conexion.sendall(b"".join(tramas))
+        except OSError:
+            pass
+        finally:
+            sus.vivo = False
+            sus.conexion.close()
+            with self.lock:
+                self.suscriptores.remove(sus)
+            print(f"🖥️  Dashboard desconectado ({len(self.suscriptores)} en total)")
+
+    def publicar(self, lectura):
+        """Llamar desde on_message: nunca bloquea (cada cliente tiene su cola)."""
+        trama = codificar(lectura)
+        with self.lock:
+            suscriptores = list(self.suscriptores)
+        for sus in suscriptores:
+            with sus.hay_datos:
+                if len(sus.pendientes) == sus.pendientes.maxlen:
+                    sus.perdidas += 1
+                sus.pendientes.append(trama)
+                sus.hay_datos.notify()
+
+
+class ClienteDifusion:
+    """Lado del dashboard: recibe Lecturas ya decodificadas y llama a `destino`."""
+
+    def __init__(self, direccion, destino, reintento=2.0):
+        self.direccion = direccion
+        self.destino = destino
+        self.reintento = reintento
+        self.conectado = False
+        self.recibidos = 0
+        threading.Thread(target=self._bucle, daemon=True).start()
+
+    def _bucle(self):
+        while True:
+            sock, destino = _crear_socket(self.direccion)
+            try:
+                sock.connect(destino)
+                self.conectado = True
+                self._leer(sock.makefile("rb", buffering=1 << 16))
+            except OSError as e:
+                print(f"Demonio de ingesta no disponible ({e}), reintentando...")
+            finally:
+                self.conectado = False
+                sock.close()
+            time.sleep(self.reintento)
+
+    def _leer(self, f):
+        while True:
+            cab = f.read(CABECERA.size)
+            if len(cab) < CABECERA.size:
+                return
+            (n,) = CABECERA.unpack(cab)
+            cuerpo = f.read(n)
+            if len(cuerpo) < n:
+                return
+            self.recibidos += 1
+            try:
+                self.destino(decodificar(cuerpo))
+            except Exception as e:
+                print(f"Error: {e}")
@@ -1,10 +1,11 @@
 import paho.mqtt.client as mqtt
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 import json
+import os
 
 # Configuración del broker MQTT
-broker = "broker.emqx.io"  # Dirección de tu broker MQTT
+broker = os.environ.get("MQTT_BROKER", "broker.emqx.io")  # Dirección de tu broker MQTT (MQTT_BROKER=127.0.0.1 -> broker_local.py)
 port = 1883  # Puerto MQTT
 topic = "TimeNow"  # Tópico MQTT para publicar el timestamp
 
@@ -23,9 +24,9 @@ client.on_connect = on_connect
 # Conectar al broker MQTT
 client.connect(broker, port, 60)
 
-# Función para obtener el timestamp en formato "YYYY-DDD-HH:MM:SS"
+# Función para obtener el timestamp en formato "YYYY-DDD-HH:MM:SS" (UTC, como Tiempo_UTC)
 def get_timestamp():
-    now = datetime.now()
+    now = datetime.now(timezone.utc)
     # Obtener el día del año (DOY)
     doy = now.timetuple().tm_yday
     return f"{now.year}-{doy:03d}-{now.strftime('%H:%M:%S')}"
@@ -0,0 +1,260 @@
+import math
+import threading
+import time
+from collections import deque
+import numpy as np
+from decodificador import como_lectura
+
+# ----------------------------------------------------------
+# ESTADÍSTICAS EN VIVO POR SENSOR Y CAMPO
+# ----------------------------------------------------------
+# Media, desviación, mínimo, máximo y percentiles de las ventanas móviles
+# de 1 min, 1 h y 24 h, actualizados en la ingesta (O(1) por muestra) y
+# consultables sin recorrer los datos (O(SUBCUBETAS) por consulta).
+#
+# Cada ventana se parte en SUBCUBETAS tramos. Cada tramo guarda:
+#  - n, media y M2 (Welford); los tramos se funden con la fórmula de Chan
+#  - mínimo y máximo
+#  - un histograma logarítmico (error relativo ~1 %) que, a diferencia de
+#    P², se puede fundir: los percentiles de la ventana salen de sumar los
+#    histogramas de sus tramos
+# Los niveles van en cascada: al cerrarse un tramo de 1 s se funde en el
+# tramo abierto de 1 min, y este en el de 24 min. Cada muestra solo toca el
+# nivel más fino. El borde viejo de la ventana se mueve a saltos de un tramo
+# (1/SUBCUBETAS de la ventana).
+
+SUBCUBETAS = 60
+VENTANAS = {"1 min": 60, "1 h": 3600, "24 h": 24 * 3600}
+PERCENTILES = (50, 90, 99)
+GAMMA = 1.02            # Ancho relativo de las casillas del histograma
+MIN_ABS = 1e-9          # |v| menor se cuenta como 0
+
+_LOG_GAMMA = math.log(GAMMA)
+_DESPLAZAMIENTO = 2000  # Mantiene positivo el índice de |v| >= MIN_ABS
+_ANCHOS = tuple(s // SUBCUBETAS for s in VENTANAS.values())   # 1 s, 60 s, 1440 s
+
+
+def casilla(v):
+    """Índice de la casilla del histograma; ordenar índices = ordenar valores."""
+    a = abs(v)
+    if a < MIN_ABS:
+        return 0
+    k = math.ceil(math.log(a) / _LOG_GAMMA) + _DESPLAZAMIENTO
+    return k if v > 0 else -k
+
+
+def casillas(v):
+    """casilla() vectorizada sobre un array sin NaN."""
+    a = np.abs(v)
+    k = np.zeros(len(v), dtype=np.int64)
+    grandes = a >= MIN_ABS
+    k[grandes] = np.ceil(np.log(a[grandes]) / _LOG_GAMMA).astype(np.int64) + _DESPLAZAMIENTO
+    return np.where(v < 0, -k, k)
+
+
+def valor_casilla(k):
+    """Valor representativo (centro relativo) de una casilla."""
+    if k == 0:
+        return 0.0
+    v = GAMMA ** (abs(k) - _DESPLAZAMIENTO) * 2 / (1 + GAMMA)
+    return v if k > 0 else -v
+
+
+class _Tramo:
+    """Momentos, extremos e histograma de un tramo de tiempo."""
+    __slots__ = ("inicio", "n", "media", "m2", "mn", "mx", "hist")
+
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.mn = math.inf
+        self.mx = -math.inf
+        self.hist = {}
+
+    def agregar(self, v):
+        # Welford
+        self.n += 1
+        d = v - self.media
+        self.media += d / self.n
+        self.m2 += d * (v - self.media)
+        if v < self.mn:
+            self.mn = v
+        if v > self.mx:
+            self.mx = v
+        k = casilla(v)
+        self.hist[k] = self.hist.get(k, 0) + 1
+
+    def fusionar(self, n, media, m2, mn, mx, hist):
+        # Chan et al.: combina dos conjuntos de momentos sin ver las muestras
+        if not n:
+            return
+        total = self.n + n
+        d = media - self.media
+        self.media += d * n / total
+        self.m2 += m2 + d * d * self.n * n / total
+        self.n = total
+        if mn < self.mn:
+            self.mn = mn
+        if mx > self.mx:
+            self.mx = mx
+        h = self.hist
+        for k, c in hist.items():
+            h[k] = h.get(k, 0) + c
+
+    def fusionar_tramo(self, otro):
+        self.fusionar(otro.n, otro.media, otro.m2, otro.mn, otro.mx, otro.hist)
+
+    def percentiles(self, ps=PERCENTILES):
+        """Percentiles (ps en orden creciente) con una sola pasada por el histograma."""
+        r = []
+        objetivos = [p / 100 * (self.n - 1) for p in ps]
+        acumulado = 0
+        for k in sorted(self.hist):
+            acumulado += self.hist[k]
+            while objetivos and acumulado > objetivos[0]:
+                objetivos.pop(0)
+                r.append(min(max(valor_casilla(k), self.mn), self.mx))
+        return r + [self.mx] * len(objetivos)
+
+    def resumen(self, percentiles=PERCENTILES):
+        r = {
+            "n": self.n,
+            "media": self.media,
+            "desv": math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0,
+            "min": self.mn,
+            "max": self.mx,
+        }
+        for p, v in zip(percentiles, self.percentiles(percentiles)):
+            r[f"p{p}"] = v
+        return r
+
+
+class _Serie:
+    """Tramos abiertos y cerrados de cada nivel para un (sensor, campo)."""
+    __slots__ = ("abiertos", "cerrados")
+
+    def __init__(self):
+        self.abiertos = [None] * len(_ANCHOS)
+        self.cerrados = [deque(maxlen=SUBCUBETAS) for _ in _ANCHOS]
+
+    def tramo(self, nivel, t):
+        """Tramo abierto del nivel que corresponde a t (cierra el anterior si toca)."""
+        ancho = _ANCHOS[nivel]
+        inicio = t - t % ancho
+        abierto = self.abiertos[nivel]
+        if abierto is not None and inicio <= abierto.inicio:
+            return abierto   # Mismo tramo (o muestra atrasada: se queda en el actual)
+        if abierto is not None:
+            self._cerrar(nivel, abierto)
+        abierto = self.abiertos[nivel] = _Tramo(inicio)
+        return abierto
+
+    def _cerrar(self, nivel, tramo):
+        self.cerrados[nivel].append(tramo)
+        if nivel + 1 < len(_ANCHOS):
+            self.tramo(nivel + 1, tramo.inicio).fusionar_tramo(tramo)
+
+    def ventana(self, nivel, desde):
+        """Tramo con todo lo que solapa [desde, ahora]: cerrados del nivel y
+        abiertos de ese nivel y los inferiores (aún no fundidos hacia arriba)."""
+        total = _Tramo(desde)
+        ancho = _ANCHOS[nivel]
+        for tramo in self.cerrados[nivel]:
+            if tramo.inicio + ancho > desde:
+                total.fusionar_tramo(tramo)
+        for inferior in range(nivel + 1):
+            abierto = self.abiertos[inferior]
+            if abierto is not None and abierto.inicio + _ANCHOS[inferior] > desde:
+                total.fusionar_tramo(abierto)
+        return total
+
+
+class EstadisticasVivo:
+    """Estadísticas móviles por (sensor, campo), alimentadas desde la ingesta."""
+
+    def __init__(self):
+        self.series = {}     # (sensor, campo) -> _Serie
+        self.campos = {}     # sensor -> [campos] (en orden de llegada)
+        self.lock = threading.Lock()
+
+    def _serie(self, sensor_id, campo):
+        serie = self.series.get((sensor_id, campo))
+        if serie is None:
+            serie = self.series[(sensor_id, campo)] = _Serie()
+            self.campos.setdefault(sensor_id, []).append(campo)
+        return serie
+
+    # ---------- INGESTA ----------
+    def agregar(self, registro):
+        lectura = como_lectura(registro)
+        if lectura is None:
+            return
+        with self.lock:
+            self._agregar(lectura)
+
+    def agregar_varios(self, registros):
+        """Varias Lecturas tomando el lock una vez (los lotes van por agregar_lote)."""
+        with self.lock:
+            for registro in registros:
+                lectura = como_lectura(registro)
+                if lectura is not None:
+                    self._agregar(lectura)
+
+    def _agregar(self, lectura):
+        # Llamar con el lock tomado
+        t = lectura.hora()
+        for campo, v in lectura.medidas():
+            self._serie(lectura.ID, campo).tramo(0, t).agregar(v)
+
+    def agregar_lote(self, lote):
+        """Añade un LoteLecturas: momentos, extremos e histograma de cada tramo
+        de 1 s se calculan con numpy y se funden de una vez."""
+        if len(lote) == 0 or not lote.columnas:
+            return
+        ancho = _ANCHOS[0]
+        t = lote.t_corregido()
+        with self.lock:
+            for campo, v in lote.columnas.items():
+                validos = ~np.isnan(v)
+                if not validos.any():
+                    continue
+                v = v[validos]
+                inicios = t[validos]
+                inicios = inicios - inicios % ancho
+                cortes = np.flatnonzero(np.r_[True, inicios[1:] != inicios[:-1]])
+                n = np.diff(np.r_[cortes, len(v)])
+                medias = np.add.reduceat(v, cortes) / n
+                m2 = np.add.reduceat((v - np.repeat(medias, n)) ** 2, cortes)
+                mn = np.minimum.reduceat(v, cortes)
+                mx = np.maximum.reduceat(v, cortes)
+                ks = casillas(v)
+                serie = self._serie(lote.ID, campo)
+                for i, ini in enumerate(cortes.tolist()):
+                    claves, cuentas = np.unique(ks[ini:ini + n[i]], return_counts=True)
+                    serie.tramo(0, float(inicios[ini])).fusionar(
+                        int(n[i]), float(medias[i]), float(m2[i]), float(mn[i]), float(mx[i]),
+                        dict(zip(claves.tolist(), cuentas.tolist())))
+
+    # ---------- CONSULTA ----------
+    def resumen(self, sensor_id, campo, ventana="1 h", ahora=None):
+        """{n, media, desv, min, max, p50, p90, p99} de la ventana, o None sin datos."""
+        nivel = list(VENTANAS).index(ventana)
+        desde = (ahora if ahora is not None else time.time()) - VENTANAS[ventana]
+        with self.lock:
+            serie = self.series.get((sensor_id, campo))
+            if serie is None:
+                return None
+            total = serie.ventana(nivel, desde)
+        return total.resumen() if total.n else None
+
+    def resumen_sensor(self, sensor_id, ventana="1 h", ahora=None):
+        """{campo: resumen} de todos los campos del sensor con datos en la ventana."""
+        ahora = ahora if ahora is not None else time.time()
+        r = {}
+        for campo in list(self.campos.get(sensor_id, ())):
+            res = self.resumen(sensor_id, campo, ventana, ahora)
+            if res is not None:
+                r[campo] = res
+        return r
@@ -0,0 +1,270 @@
+import argparse
+import glob
+import gzip
+import os
+import signal
+import struct
+import threading
+import time
+from codec_binario import TOPIC_BINARIO
+from ingesta_async import NucleoIngesta
+
+# ----------------------------------------------------------
+# GRABADOR DE TRÁFICO MQTT (sin interfaz, para semanas de captura)
+# ----------------------------------------------------------
+# Se suscribe a los topics indicados y escribe cada mensaje tal cual llegó
+# (payload crudo + hora de recepción) en ficheros .cap.gz:
+#  - Solo se añade al final; cada registro es
+#      <d: recibido> <H: len topic> <I: len payload> topic payload
+#    detrás de la cabecera MAGIA.
+#  - Los registros se acumulan en un buffer de BUFFER_BYTES que se comprime
+#    de una vez (memoria constante, pocas llamadas al sistema).
+#  - Rotación por tamaño (--max-mb) y por tiempo (--rotar-cada); con
+#    --conservar se borran los ficheros más viejos.
+#  - fsync: "nunca" (lo decide el SO), "rotacion" (al cerrar cada fichero),
+#    "periodico" (cada --cada s) o "siempre" (en cada volcado del buffer).
+#    Cada volcado hace un flush de zlib: si el proceso muere, lo escrito
+#    hasta el último volcado se puede leer.
+#
+# Uso:
+#   python grabador.py grabar [--topic T ...] [--dir capturas] [--fsync periodico]
+#   python grabador.py reproducir capturas/*.cap.gz [--velocidad 10]
+#   (más opciones de reproducción, CSV y sin red: reproduccion.py)
+
+BROKER = os.environ.get("MQTT_BROKER", "10.42.0.1")  # MQTT_BROKER=127.0.0.1 -> broker_local.py
+TOPIC = "Enviromental Sensors Network"
+DIRECTORIO = "capturas"
+EXTENSION = ".cap.gz"
+MAGIA = b"MQCAP1\n"
+POLITICAS_FSYNC = ("nunca", "rotacion", "periodico", "siempre")
+BUFFER_BYTES = 256 * 1024   # Se comprime y escribe al llenarse (o cada --cada s)
+MAX_MB = 256                # Tamaño (comprimido) de cada fichero antes de rotar
+ROTAR_CADA = 3600           # Segundos por fichero (0 = solo por tamaño)
+NIVEL_GZIP = 6
+
+_CABECERA = struct.Struct("<dHI")
+
+
+# ---------- ESCRITURA ----------
+class Grabador:
+    def __init__(self, directorio=DIRECTORIO, max_mb=MAX_MB, rotar_cada=ROTAR_CADA,
+                 fsync="periodico", cada=1.0, conservar=0, nivel=NIVEL_GZIP):
+        if fsync not in POLITICAS_FSYNC:
+            raise ValueError(f"fsync desconocido: {fsync} (válidos: {', '.join(POLITICAS_FSYNC)})")
+        self.directorio = directorio
+        self.max_bytes = int(max_mb * 2**20)
+        self.rotar_cada = rotar_cada
+        self.fsync = fsync
+        self.cada = cada
+        self.conservar = conservar
+        self.nivel = nivel
+        os.makedirs(directorio, exist_ok=True)
+        self.buf = bytearray()
+        self.topics = {}           # str -> bytes codificados (caché)
+        self.lock = threading.Lock()
+        self.crudo = None          # Fichero en disco (para tamaño y fsync)
+        self.gz = None
+        self.ruta = None
+        self.abierto_en = 0.0
+        self.ultimo_volcado = time.monotonic()
+        # Contadores
+        self.mensajes = 0
+        self.bytes_payload = 0
+        self.ficheros = 0
+
+    def _abrir(self):
+        # Hora + nº de fichero de esta sesión: el orden alfabético es el temporal
+        nombre = time.strftime("captura-%Y%m%d-%H%M%S") + f"-{self.ficheros:04d}{EXTENSION}"
+        self.ruta = os.path.join(self.directorio, nombre)
+        self.crudo = open(self.ruta, "ab")
+        self.gz = gzip.GzipFile(fileobj=self.crudo, mode="ab", compresslevel=self.nivel)
+        self.gz.write(MAGIA)
+        self.abierto_en = time.time()
+        self.ficheros += 1
+        self._limpiar_antiguos()
+
+    def _cerrar(self):
+        if self.gz is None:
+            return
+        self.gz.close()            # Cierra el miembro gzip (CRC + tamaño)
+        self.crudo.flush()
+        if self.fsync != "nunca":
+            os.fsync(self.crudo.fileno())
+        self.crudo.close()
+        self.gz = self.crudo = None
+
+    def _limpiar_antiguos(self):
+        if not self.conservar:
+            return
+        ficheros = sorted(glob.glob(os.path.join(self.directorio, "captura-*" + EXTENSION)))
+        for viejo in ficheros[:-self.conservar]:
+            try:
+                os.remove(viejo)
+            except OSError as e:
+                print(f"No se pudo borrar {viejo}: {e}")
+
+    def escribir(self, recibido, topic, payload):
+        """Añade un mensaje (desde cualquier hilo)."""
+        t = self.topics.get(topic)
+        if t is None:
+            t = self.topics[topic] = topic.encode("utf-8")
+        with self.lock:
+            self.buf += _CABECERA.pack(recibido, len(t), len(payload))
+            self.buf += t
+            self.buf += payload
+            self.mensajes += 1
+            self.bytes_payload += len(payload)
+            if len(self.buf) >= BUFFER_BYTES:
+                self._volcar()
+
+    def escribir_mensajes(self, mensajes):
+        """Consumidor crudo por lotes de NucleoIngesta (lista de Mensaje)."""
+        for m in mensajes:
+            self.escribir(m.recibido, m.topic, m.payload)
+
+    def _volcar(self, forzar_fsync=False):
+        # Llamar con el lock tomado
+        if self.gz is None:
+            self._abrir()
+        if self.buf:
+            self.gz.write(self.buf)
+            self.buf.clear()
+        self.gz.flush()            # Z_SYNC_FLUSH: legible aunque el proceso muera después
+        if self.fsync == "siempre" or forzar_fsync:
+            os.fsync(self.crudo.fileno())
+        self.ultimo_volcado = time.monotonic()
+        if self.crudo.tell() >= self.max_bytes or \
+                (self.rotar_cada and time.time() - self.abierto_en >= self.rotar_cada):
+            self._cerrar()
+
+    def tick(self):
+        """Llamar periódicamente: vuelca el buffer cada `cada` s aunque no esté lleno."""
+        with self.lock:
+            if time.monotonic() - self.ultimo_volcado >= self.cada and (self.buf or self.gz is not None):
+                self._volcar(forzar_fsync=self.fsync == "periodico")
+
+    def cerrar(self):
+        with self.lock:
+            if self.buf:
+                self._volcar()
+            self._cerrar()
+
+    def estadisticas(self):
+        return {"mensajes": self.mensajes, "bytes_payload": self.bytes_payload,
+                "ficheros": self.ficheros, "fichero": self.ruta}
+
+
+# ---------- LECTURA ----------
+def leer_captura(ruta):
+    """Genera (recibido, topic, payload) de un fichero de captura. Un final
+    truncado (proceso muerto a mitad de escritura) se ignora con un aviso."""
+    try:
+        with gzip.open(ruta, "rb") as f:
+            if f.read(len(MAGIA)) != MAGIA:
+                raise ValueError(f"{ruta} no es una captura (cabecera incorrecta)")
+            while True:
+                cab = f.read(_CABECERA.size)
+                if len(cab) < _CABECERA.size:
+                    if cab:
+                        print(f"⚠️  {ruta}: registro incompleto al final, ignorado")
+                    return
+                recibido, n_topic, n_payload = _CABECERA.unpack(cab)
+                cuerpo = f.read(n_topic + n_payload)
+                if len(cuerpo) < n_topic + n_payload:
+                    print(f"⚠️  {ruta}: registro incompleto al final, ignorado")
+                    return
+                yield recibido, cuerpo[:n_topic].decode("utf-8"), cuerpo[n_topic:]
+    except (EOFError, gzip.BadGzipFile) as e:
+        print(f"⚠️  {ruta}: fichero cortado ({e}); se ha leído hasta donde se pudo")
+
+
+def leer_capturas(rutas):
+    """Todas las capturas (ficheros o directorios) en orden de nombre = de tiempo."""
+    ficheros = []
+    for r in rutas:
+        if os.path.isdir(r):
+            ficheros += glob.glob(os.path.join(r, "*" + EXTENSION))
+        else:
+            ficheros.append(r)
+    for ruta in sorted(ficheros):
+        yield from leer_captura(ruta)
+
+
+# ---------- COMANDOS ----------
+def grabar(args):
+    grabador = Grabador(args.dir, args.max_mb, args.rotar_cada, args.fsync, args.cada, args.conservar)
+    nucleo = NucleoIngesta(politica=args.cola, capacidad=args.capacidad)
+    nucleo.conectar(args.broker, args.puerto, args.topic or [TOPIC, TOPIC_BINARIO],
+                    client_id=f"grabador-{os.getpid()}")
+    nucleo.consumidor(grabador.escribir_mensajes, crudo=True, lotes=True)
+    parar = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: parar.set())
+    nucleo.iniciar()
+    print(f"🎙️  Grabando {args.topic or [TOPIC, TOPIC_BINARIO]} de {args.broker} en {args.dir}/ (fsync {args.fsync})")
+    anterior, t_anterior = 0, time.time()
+    siguiente_informe = time.time() + args.informe
+    try:
+        while not parar.wait(min(args.cada, 1.0)):
+            grabador.tick()
+            if args.informe and time.time() >= siguiente_informe:
+                e = grabador.estadisticas()
+                ahora = time.time()
+                tasa = (e["mensajes"] - anterior) / (ahora - t_anterior)
+                anterior, t_anterior = e["mensajes"], ahora
+                siguiente_informe = ahora + args.informe
+                print(f"📼 {e['mensajes']} mensajes · {tasa:.0f} msg/s · {e['bytes_payload'] / 2**20:.1f} MB de payload · "
+                      f"{os.path.basename(e['fichero'] or '-')}")
+    except KeyboardInterrupt:
+        pass
+    nucleo.detener()
+    grabador.cerrar()
+    e = grabador.estadisticas()
+    print(f"\nGrabación cerrada: {e['mensajes']} mensajes en {e['ficheros']} fichero(s).")
+
+
+def reproducir(args):
+    # reproduccion.py importa este módulo (lectura de capturas): import aquí
+    import reproduccion
+    try:
+        destino = reproduccion.DestinoBroker(args.broker, args.puerto, args.topic)
+    except ConnectionError as e:
+        print(f"❌ {e}")
+        return
+    try:
+        resumen = reproduccion.reproducir(reproduccion.desde_capturas(args.capturas), destino, args.velocidad)
+    except KeyboardInterrupt:
+        return
+    print(f"▶️  {resumen['mensajes']} mensajes reproducidos en {resumen['segundos']} s.")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Grabador y reproductor de tráfico MQTT")
+    p.add_argument("--broker", default=BROKER)
+    p.add_argument("--puerto", type=int, default=1883)
+    sub = p.add_subparsers(dest="comando", required=True)
+
+    g = sub.add_parser("grabar", help="Suscribirse y guardar los mensajes")
+    g.add_argument("--topic", action="append", help=f"Filtro a grabar (repetible; por defecto '{TOPIC}' y el binario)")
+    g.add_argument("--dir", default=DIRECTORIO)
+    g.add_argument("--max-mb", type=float, default=MAX_MB, help="Tamaño de cada fichero antes de rotar")
+    g.add_argument("--rotar-cada", type=float, default=ROTAR_CADA, help="Segundos por fichero (0 = solo tamaño)")
+    g.add_argument("--fsync", choices=POLITICAS_FSYNC, default="periodico")
+    g.add_argument("--cada", type=float, default=1.0, help="Segundos entre volcados del buffer")
+    g.add_argument("--conservar", type=int, default=0, help="Nº de ficheros a conservar (0 = todos)")
+    g.add_argument("--cola", default=None, help="Política de cola_ingesta (por defecto, contrapresión)")
+    g.add_argument("--capacidad", type=int, default=100_000)
+    g.add_argument("--informe", type=float, default=60.0, help="Segundos entre líneas de estado (0 = ninguna)")
+    g.set_defaults(func=grabar)
+
+    r = sub.add_parser("reproducir", help="Publicar capturas en el broker")
+    r.add_argument("capturas", nargs="+", help="Ficheros .cap.gz o directorios")
+    r.add_argument("--velocidad", type=float, default=1.0, help="1 = tiempo real, N = N veces más rápido, 0 = sin esperas")
+    r.add_argument("--topic", default=None, help="Publicar todo en este topic (por defecto, el original)")
+    r.set_defaults(func=reproducir)
+
+    args = p.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import NamedTuple, Optional
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+import streamlit as st
+import streamlit.components.v1 as components
+from metricas import METRICAS
+
+# ----------------------------------------------------------
+# GRÁFICAS EN VIVO INCREMENTALES (Plotly.extendTraces)
+# ----------------------------------------------------------
+# st.plotly_chart reconstruye y reenvía la figura entera (x/y de toda la
+# ventana, layout y plantilla) en cada refresco. Aquí la figura vive en el
+# navegador (componente_grafica/index.html) y cada refresco solo manda las
+# muestras escritas en el registro desde el anterior:
+#  - Por sesión y gráfica se guarda hasta dónde ha visto el navegador el
+#    buffer de cada sensor (cursor (generación, escritas) de
+#    RegistroSensores.nuevas).
+#  - La figura entera (epoch nuevo) solo viaja la primera vez, al cambiar
+#    las trazas o la ventana, si el buffer de un sensor se ha recreado o si
+#    el navegador la pide (iframe recargado o incremento perdido: cada
+#    incremento lleva un `seq` consecutivo).
+#  - El navegador guarda como mucho `ventana` puntos por traza.
+# Coste por refresco: O(muestras nuevas) en CPU y bytes, no O(ventana).
+
+CARPETA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "componente_grafica")
+VENTANA = 20_000   # Puntos por traza que conserva el navegador
+
+PUNTOS = METRICAS.contador("dashboard_grafica_puntos_total", "Puntos enviados al navegador por las gráficas en vivo",
+                           ("envio",))
+
+
+class Traza(NamedTuple):
+    sensor: str
+    campo: str
+    nombre: str
+    color: Optional[str] = None
+
+
+def _preparar_componente():
+    """Copia index.html y plotly.min.js (del paquete plotly ya instalado: sin
+    CDN ni npm) a una carpeta temporal propia de esta versión de los dos, para
+    no escribir junto al código (puede ser de solo lectura)."""
+    html = os.path.join(CARPETA, "index.html")
+    js = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+    with open(html, "rb") as f:
+        huella = hashlib.sha1(f.read() + plotly.__version__.encode()).hexdigest()[:12]
+    carpeta = os.path.join(tempfile.gettempdir(), f"grafica_incremental-{huella}")
+    os.makedirs(carpeta, exist_ok=True)
+    for origen in (html, js):
+        destino = os.path.join(carpeta, os.path.basename(origen))
+        if not os.path.exists(destino):
+            # Copia a un nombre único y os.replace atómico: varios procesos a la vez no se pisan
+            temporal = f"{destino}.{os.getpid()}.tmp"
+            shutil.copyfile(origen, temporal)
+            os.replace(temporal, destino)
+    return components.declare_component("grafica_incremental", path=carpeta)
+
+
+_componente = _preparar_componente()
+
+
+def _columnas(t, v):
+    """Arrays -> listas para JSON: x en ms epoch (eje de fechas), NaN -> null."""
+    x = (t * 1000.0).tolist()
+    y = v.tolist()
+    if np.isnan(v).any():
+        y = [None if a != a else a for a in y]
+    return x, y
+
+
+def _figura(trazas, datos, titulo, unidad, altura, plantilla):
+    fig = go.Figure()
+    for traza in trazas:
+        t, cols = datos.get(traza.sensor, (np.empty(0), {}))
+        v = cols.get(traza.campo, np.full(len(t), np.nan))
+        x, y = _columnas(t, v)
+        fig.add_trace(go.Scattergl(x=x, y=y, mode="lines", name=traza.nombre,
+                                   line=dict(color=traza.color, width=3)))
+    fig.update_layout(
+        title=titulo,
+        xaxis=dict(type="date"),
+        yaxis_title=unidad,
+        height=altura,
+        margin=dict(l=20, r=20, t=40, b=20),
+        template=plantilla,
+        hovermode="x unified",
+    )
+    return json.loads(fig.to_json())
+
+
+def _leer(registro, sensores, vistas, ventana):
+    """Muestras de cada sensor posteriores a `vistas`: ({sensor: (t, cols)},
+    {sensor: cursor}, True si algún buffer se ha recreado)."""
+    datos, cursores = {}, {}
+    for sid in sensores:
+        previo = vistas.get(sid)
+        r = registro.nuevas(sid, previo, ventana)
+        if r is None:
+            continue
+        cursor, t, cols = r
+        if previo is not None and cursor[0] != previo[0]:
+            return datos, cursores, True   # Sensor expulsado y vuelto: buffer nuevo
+        datos[sid] = (t, cols)
+        cursores[sid] = cursor
+    return datos, cursores, False
+
+
+def grafica_en_vivo(clave, registro, trazas, titulo="", unidad="", altura=300,
+                    ventana=VENTANA, plantilla="plotly_white"):
+    """Dibuja (o actualiza) la gráfica `clave` con las trazas dadas (una por
+    sensor y campo) leyendo del RegistroSensores."""
+    trazas = list(trazas)
+    estado = st.session_state.setdefault(f"_estado_{clave}", {
+        "firma": None, "vistas": {}, "epoch": 0, "seq": 0, "atendido": None})
+    firma = (tuple(trazas), titulo, unidad, altura, ventana, plantilla)
+    sensores = list(dict.fromkeys(tr.sensor for tr in trazas))
+    # Valor que devuelve el componente: {"pide": n, "montaje": token} si el
+    # navegador quiere la figura. n vuelve a 1 al recargar el iframe, así que
+    # un pedido se identifica por el par (token de esa carga, n)
+    pedido = st.session_state.get(clave)
+    pide = None
+    if isinstance(pedido, dict) and pedido.get("pide") is not None:
+        pide = (pedido.get("montaje"), pedido["pide"])
+    completa = firma != estado["firma"] or (pide is not None and pide != estado["atendido"])
+    estado["atendido"] = pide
+
+    if not completa:
+        datos, cursores, completa = _leer(registro, sensores, estado["vistas"], ventana)
+    if completa:
+        datos, cursores, _ = _leer(registro, sensores, {}, ventana)
+        estado.update(firma=firma, vistas=cursores, epoch=estado["epoch"] + 1, seq=0)
+        PUNTOS.de("completa").inc(sum(len(t) for t, _ in datos.values()))
+        return _componente(figura=_figura(trazas, datos, titulo, unidad, altura, plantilla),
+                           epoch=estado["epoch"], altura=altura, key=clave, default=None)
+
+    estado["vistas"].update(cursores)
+    xs, ys, puntos = [], [], 0
+    for traza in trazas:
+        t, cols = datos.get(traza.sensor, (np.empty(0), {}))
+        v = cols.get(traza.campo)
+        x, y = _columnas(t, v) if v is not None else ([], [])
+        xs.append(x)
+        ys.append(y)
+        puntos += len(x)
+    if puntos:
+        estado["seq"] += 1
+        PUNTOS.de("incremento").inc(puntos)
+    return _componente(epoch=estado["epoch"], seq=estado["seq"], x=xs, y=ys,
+                       trazas=list(range(len(trazas))), ventana=ventana, altura=altura,
+                       key=clave, default=None)
@@ -0,0 +1,422 @@
+import asyncio
+import concurrent.futures
+import itertools
+import struct
+import threading
+import time
+from collections import deque
+from typing import NamedTuple
+from decodificador import Decodificador
+from cola_ingesta import PoolTrabajadores, CAPACIDAD_COLA, TRABAJADORES
+from metricas import METRICAS
+from protocolo_mqtt import (
+    CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP, PINGRESP,
+    PINGREQ_BYTES, DISCONNECT_BYTES,
+    paquete, leer_paquete, leer_publish, trama_connect, trama_subscribe, trama_publish, coincide,
+)
+
+# ----------------------------------------------------------
+# NÚCLEO DE INGESTA ASYNCIO
+# ----------------------------------------------------------
+# Un único event loop se encarga de todo lo que antes hacía el hilo de
+# paho en cada script: conexión (y reconexión), suscripciones, keepalive,
+# decodificación y reparto a los consumidores. Un proceso puede tener
+# varias conexiones (brokers) y muchos topics en el mismo loop.
+#
+#  - Contrapresión: si la cola de mensajes sin repartir llega a COLA_MAX
+#    se deja de leer del socket (pause_reading) hasta que baja a la mitad;
+#    es TCP quien frena al broker, no un lock.
+#  - Con `politica` (ver cola_ingesta.py) no hay contrapresión: el loop solo
+#    mete los bytes en una cola acotada que NUNCA le bloquea (descarta según
+#    la política) y un pool de trabajadores decodifica y reparte. Útil cuando
+#    un consumidor lento no debe frenar la red (keepalive, otros topics).
+#  - Los mensajes se reparten en lotes (hasta LOTE_MAX): un consumidor
+#    con lotes=True recibe una lista y toma sus locks UNA vez por lote.
+#  - Puente para frontends síncronos (Streamlit, matplotlib, input()):
+#    iniciar() lanza el loop en su propio hilo y publicar(), consumidor()
+#    y buzon() se pueden llamar desde cualquier hilo; vaciar() espera a que
+#    lo publicado salga al socket (o a bajar de la marca alta del búfer).
+#
+# Uso:
+#   nucleo = NucleoIngesta()
+#   nucleo.conectar(BROKER, 1883, [TOPIC, TOPIC_BINARIO])
+#   nucleo.consumidor(registro.agregar)                # Lecturas ya decodificadas
+#   nucleo.iniciar()
+
+COLA_MAX = 50_000       # Mensajes pendientes de repartir antes de pausar la lectura
+LOTE_MAX = 500          # Mensajes por vuelta del repartidor
+RECONEXION_MAX = 30.0   # Espera máxima entre reintentos (backoff exponencial)
+
+RECIBIDOS = METRICAS.contador("ingesta_recibidos_total", "Mensajes MQTT recibidos", ("topic",))
+ERRORES_CONSUMIDOR = METRICAS.contador("ingesta_errores_consumidor_total", "Excepciones en un consumidor")
+
+
+class Mensaje(NamedTuple):
+    topic: str
+    payload: bytes
+    recibido: float     # epoch s
+
+
+class _Consumidor(NamedTuple):
+    destino: object
+    filtro: str
+    crudo: bool         # True: recibe Mensaje | False: Lectura / LoteLecturas
+    lotes: bool         # True: recibe una lista por vuelta del repartidor
+
+
+class _Conexion(asyncio.Protocol):
+    """Una conexión MQTT (lado cliente) sobre asyncio."""
+
+    def __init__(self, nucleo, cfg):
+        self.nucleo = nucleo
+        self.cfg = cfg
+        self.transport = None
+        self.buf = bytearray()
+        self.conectada = asyncio.get_running_loop().create_future()
+        self.perdida = asyncio.get_running_loop().create_future()
+        self._ping = None
+        self.ultima_respuesta = time.monotonic()   # Último PINGRESP (o la conexión)
+        self.escribible = asyncio.Event()           # Limpio mientras el búfer de escritura pasa de la marca alta
+        self.escribible.set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.ultima_respuesta = time.monotonic()
+        transport.write(trama_connect(self.cfg.client_id, self.cfg.keepalive))
+
+    def data_received(self, data):
+        self.buf += data
+        ini = 0
+        try:
+            while True:
+                p = leer_paquete(self.buf, ini)
+                if p is None:
+                    break
+                tipo, flags, cuerpo, ini = p
+                self._atender(tipo, flags, cuerpo)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            print(f"Paquete inválido de {self.cfg.broker}: {e}")
+            self.transport.close()
+        del self.buf[:ini]
+
+    def pause_writing(self):
+        self.escribible.clear()
+
+    def resume_writing(self):
+        self.escribible.set()
+
+    def connection_lost(self, exc):
+        self.escribible.set()   # Nadie debe quedarse esperando a un socket cerrado
+        if not self.conectada.done():
+            self.conectada.set_exception(exc or ConnectionError("Conexión cerrada"))
+        if not self.perdida.done():
+            self.perdida.set_result(exc)
+
+    def _atender(self, tipo, flags, cuerpo):
+        if tipo == PUBLISH:
+            topic, payload, qos, _, packet_id = leer_publish(flags, cuerpo)
+            if qos == 1:
+                self.transport.write(paquete(PUBACK, 0, packet_id))
+            elif qos == 2:
+                self.transport.write(paquete(PUBREC, 0, packet_id))
+            self.nucleo._entrante(self, Mensaje(topic, payload, time.time()))
+        elif tipo == CONNACK:
+            if cuerpo[1] == 0:
+                self.conectada.set_result(True)
+            else:
+                self.conectada.set_exception(ConnectionRefusedError(f"CONNACK {cuerpo[1]}"))
+        elif tipo == PINGRESP:
+            self.ultima_respuesta = time.monotonic()
+            if self._ping is not None:
+                rtt = time.perf_counter() - self._ping
+                self._ping = None
+                if self.cfg.salud is not None:
+                    self.cfg.salud.rtt_medido(rtt)
+        elif tipo == PUBREL:
+            self.transport.write(paquete(PUBCOMP, 0, cuerpo[:2]))
+        # SUBACK / PUBACK: nada que hacer (sin reintentos de QoS 1)
+
+    def ping(self):
+        self._ping = time.perf_counter()
+        self.transport.write(PINGREQ_BYTES)
+
+
+class _ConfigConexion:
+    def __init__(self, broker, puerto, topics, client_id, keepalive, salud):
+        self.broker = broker
+        self.puerto = puerto
+        self.topics = list(topics)     # (filtro, qos)
+        self.client_id = client_id
+        self.keepalive = keepalive
+        self.salud = salud
+        self.actual = None             # _Conexion activa (o None)
+        self.conexiones = 0
+
+
+class NucleoIngesta:
+    def __init__(self, decodificador=None, cola_max=COLA_MAX, lote_max=LOTE_MAX,
+                 politica=None, trabajadores=TRABAJADORES, capacidad=CAPACIDAD_COLA):
+        self.decodificador = decodificador or Decodificador()
+        self.cola_max = cola_max
+        self.lote_max = lote_max
+        self.configs = []
+        self.consumidores = []
+        self.pendientes = deque()
+        self.loop = None
+        self._hay_datos = None
+        self._pausadas = set()
+        self._ids = itertools.count(1)
+        self._rutas = {}               # topic -> (consumidores crudos, de lecturas) (caché)
+        # Contadores (solo los escribe el loop; "repartidos", el trabajador si hay pool)
+        self.recibidos = 0
+        self.repartidos = 0
+        self.pausas = 0
+        self.errores_consumidor = 0
+        self.sin_conexion = 0          # publicar() sin conexión activa
+        # Cola acotada + trabajadores en lugar de contrapresión (opcional)
+        self.pool = None
+        if politica is not None:
+            self.pool = PoolTrabajadores(self._entregar, trabajadores, capacidad, politica, lote_max)
+        METRICAS.medidor("ingesta_pendientes", "Mensajes pendientes de repartir (sin pool)",
+                         funcion=lambda: len(self.pendientes))
+        METRICAS.contador("ingesta_pausas_lectura_total", "Veces que se ha dejado de leer del socket",
+                          funcion=lambda: self.pausas)
+
+    # ---------- CONFIGURACIÓN (antes o después de iniciar) ----------
+    def conectar(self, broker, puerto=1883, topics=(), client_id=None, keepalive=60, salud=None):
+        """Añade una conexión. `topics`: filtros (str) o tuplas (filtro, qos).
+        `salud`: SaludConexion opcional para estado, reconexiones y RTT."""
+        topics = [(t, 0) if isinstance(t, str) else tuple(t) for t in topics]
+        client_id = client_id or f"ingesta-{id(self):x}-{len(self.configs)}"
+        cfg = _ConfigConexion(broker, puerto, topics, client_id, keepalive, salud)
+        self.configs.append(cfg)
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.create_task, self._mantener(cfg))
+        return cfg
+
+    def consumidor(self, destino, filtro="#", crudo=False, lotes=False):
+        """Registra `destino`, llamado en el hilo del loop o, con `politica`, en
+        el de un trabajador (no debe bloquear).
+
+        crudo=False -> recibe Lectura/LoteLecturas (cada mensaje se decodifica
+        UNA vez aunque haya varios consumidores); crudo=True -> recibe Mensaje.
+        """
+        c = _Consumidor(destino, filtro, crudo, lotes)
+        if self.loop is None:
+            self._agregar_consumidor(c)
+        else:
+            self.loop.call_soon_threadsafe(self._agregar_consumidor, c)
+        return c
+
+    def _agregar_consumidor(self, c):
+        self.consumidores.append(c)
+        self._rutas = {}
+
+    def buzon(self, filtro="#", maxlen=1000, crudo=False):
+        """Deque que el loop va llenando y un hilo síncrono vacía con popleft()
+        (append/popleft de deque son atómicos: no hace falta lock)."""
+        d = deque(maxlen=maxlen)
+        self.consumidor(d.append, filtro, crudo)
+        return d
+
+    # ---------- PUENTE SÍNCRONO ----------
+    def iniciar(self):
+        """Arranca el loop en un hilo propio y vuelve enseguida."""
+        listo = threading.Event()
+
+        def _correr():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self._arrancar())
+            listo.set()
+            loop.run_forever()
+
+        threading.Thread(target=_correr, daemon=True, name="nucleo-ingesta").start()
+        listo.wait()
+        return self
+
+    def publicar(self, topic, payload, qos=0, retain=False, conexion=0):
+        """Publica desde cualquier hilo por la conexión nº `conexion`."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        self.loop.call_soon_threadsafe(self._publicar, self.configs[conexion], topic, payload, qos, retain)
+
+    def vaciar(self, conexion=0, todo=True, timeout=None):
+        """Bloquea (desde otro hilo) hasta que lo publicado por la conexión nº
+        `conexion` ha salido al socket; con todo=False, solo hasta que su búfer
+        de escritura baja de la marca alta. False si vence `timeout`."""
+        futuro = asyncio.run_coroutine_threadsafe(self._vaciar(self.configs[conexion], todo), self.loop)
+        try:
+            futuro.result(timeout)
+            return True
+        except concurrent.futures.TimeoutError:
+            futuro.cancel()
+            return False
+
+    def detener(self):
+        if self.loop is None:
+            return
+
+        def _parar():
+            for cfg in self.configs:
+                if cfg.actual is not None:
+                    cfg.actual.transport.write(DISCONNECT_BYTES)
+                    cfg.actual.transport.close()
+            for tarea in asyncio.all_tasks(self.loop):
+                tarea.cancel()
+            self.loop.call_soon(self.loop.stop)   # Tras procesar las cancelaciones
+
+        self.loop.call_soon_threadsafe(_parar)
+
+    # ---------- ASYNCIO ----------
+    async def ejecutar(self):
+        """Para programas que ya son asyncio: corre hasta que se cancele."""
+        await self._arrancar()
+        await asyncio.Event().wait()
+
+    async def _arrancar(self):
+        self.loop = asyncio.get_running_loop()
+        self._hay_datos = asyncio.Event()
+        self.loop.create_task(self._repartir())
+        for cfg in self.configs:
+            self.loop.create_task(self._mantener(cfg))
+
+    async def _mantener(self, cfg):
+        """Conecta, suscribe, hace keepalive y reconecta con backoff."""
+        espera = 1.0
+        while True:
+            con = None
+            try:
+                _, con = await self.loop.create_connection(lambda: _Conexion(self, cfg), cfg.broker, cfg.puerto)
+                await asyncio.wait_for(con.conectada, timeout=10)
+            except (OSError, asyncio.TimeoutError) as e:
+                if con is not None and con.transport is not None:
+                    con.transport.abort()   # Sin CONNACK (o rechazado): no dejar el socket abierto
+                print(f"Broker {cfg.broker}:{cfg.puerto} no disponible ({e}), reintentando en {espera:.0f} s")
+                await asyncio.sleep(espera)
+                espera = min(espera * 2, RECONEXION_MAX)
+                continue
+            espera = 1.0
+            cfg.actual = con
+            cfg.conexiones += 1
+            if cfg.salud is not None:
+                cfg.salud.conectado_cb(0)
+            if cfg.topics:
+                con.transport.write(trama_subscribe(next(self._ids) % 0xFFFF + 1, cfg.topics))
+            print(f"✅ Conectado a {cfg.broker}:{cfg.puerto} ({', '.join(t for t, _ in cfg.topics)})")
+            ping = self.loop.create_task(self._keepalive(con, cfg.keepalive))
+            motivo = await con.perdida
+            ping.cancel()
+            cfg.actual = None
+            self._pausadas.discard(con)
+            if cfg.salud is not None:
+                cfg.salud.desconectado_cb(motivo)
+            print(f"🔌 Desconectado de {cfg.broker} ({motivo}), reconectando...")
+            await asyncio.sleep(espera)
+
+    @staticmethod
+    async def _keepalive(con, keepalive):
+        while True:
+            await asyncio.sleep(keepalive * 0.75)   # Antes de que el broker nos dé por muertos
+            if time.monotonic() - con.ultima_respuesta > keepalive * 1.5:
+                # Conexión medio abierta (el TCP no se entera): se corta y _mantener reconecta
+                print(f"⚠️ Sin PINGRESP de {con.cfg.broker} en {keepalive * 1.5:.0f} s, cerrando la conexión")
+                con.transport.abort()
+                return
+            con.ping()
+
+    @staticmethod
+    async def _vaciar(cfg, todo):
+        # Corre detrás de los _publicar ya encolados con call_soon_threadsafe (FIFO)
+        con = cfg.actual
+        if con is None or con.transport.is_closing():
+            return
+        await con.escribible.wait()
+        while todo and con.transport.get_write_buffer_size() and not con.transport.is_closing():
+            await asyncio.sleep(0.01)
+
+    def _publicar(self, cfg, topic, payload, qos, retain):
+        if cfg.actual is None or cfg.actual.transport.is_closing():
+            self.sin_conexion += 1
+            return
+        packet_id = next(self._ids) % 0xFFFF + 1 if qos else None
+        cfg.actual.transport.write(trama_publish(topic, payload, qos, retain, packet_id))
+
+    def _entrante(self, con, mensaje):
+        self.recibidos += 1
+        RECIBIDOS.de(mensaje.topic).inc()
+        if con.cfg.salud is not None:
+            con.cfg.salud.mensaje_recibido()
+        if self.pool is not None:
+            self.pool.meter(mensaje.payload, mensaje)
+            return
+        self.pendientes.append(mensaje)
+        if len(self.pendientes) >= self.cola_max and con not in self._pausadas:
+            con.transport.pause_reading()
+            self._pausadas.add(con)
+            self.pausas += 1
+        self._hay_datos.set()
+
+    def _rutas_de(self, topic):
+        ruta = self._rutas.get(topic)
+        if ruta is None:
+            casan = [c for c in self.consumidores if coincide(c.filtro, topic)]
+            ruta = self._rutas[topic] = ([c for c in casan if c.crudo], [c for c in casan if not c.crudo])
+        return ruta
+
+    async def _repartir(self):
+        while True:
+            await self._hay_datos.wait()
+            self._hay_datos.clear()
+            while self.pendientes:
+                n = min(len(self.pendientes), self.lote_max)
+                lote = [self.pendientes.popleft() for _ in range(n)]
+                self._entregar(lote)
+                if self._pausadas and len(self.pendientes) < self.cola_max // 2:
+                    for con in self._pausadas:
+                        con.transport.resume_reading()
+                    self._pausadas.clear()
+                await asyncio.sleep(0)   # Deja leer a los sockets entre lotes
+
+    def _entregar(self, lote):
+        por_consumidor = {}   # id(consumidor) -> (consumidor, items)
+        rutas = [self._rutas_de(m.topic) for m in lote]
+        # Todo el lote de una vez (las tramas v1 con NumPy), en el orden de llegada
+        decodificar = [m for m, (_, de_lecturas) in zip(lote, rutas) if de_lecturas]
+        lecturas = iter(self.decodificador.decodificar_lote([m.payload for m in decodificar],
+                                                            [m.recibido for m in decodificar]))
+        for m, (crudos, de_lecturas) in zip(lote, rutas):
+            for c in crudos:
+                por_consumidor.setdefault(id(c), (c, []))[1].append(m)
+            if de_lecturas:
+                lectura = next(lecturas)
+                if lectura is not None:
+                    for c in de_lecturas:
+                        por_consumidor.setdefault(id(c), (c, []))[1].append(lectura)
+        for c, items in por_consumidor.values():
+            try:
+                if c.lotes:
+                    c.destino(items)
+                else:
+                    for item in items:
+                        c.destino(item)
+            except Exception as e:
+                self.errores_consumidor += 1
+                ERRORES_CONSUMIDOR.inc()
+                print(f"Error: {e}")
+        self.repartidos += len(lote)
+
+    # ---------- ESTADO ----------
+    def estadisticas(self):
+        r = {
+            "conexiones": {f"{c.broker}:{c.puerto}": c.actual is not None for c in self.configs},
+            "recibidos": self.recibidos,
+            "repartidos": self.repartidos,
+            "pendientes": len(self.pendientes),
+            "pausas_lectura": self.pausas,
+            "errores_consumidor": self.errores_consumidor,
+            "sin_conexion": self.sin_conexion,
+        }
+        if self.pool is not None:
+            r["cola"] = self.pool.estadisticas()
+        return r
@@ -0,0 +1,223 @@
+import threading
+from collections import Counter, deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from decodificador import Lectura, LoteLecturas, CAMPOS_ESQUEMA, NAN
+from metricas import METRICAS
+
+# ----------------------------------------------------------
+# LIMPIEZA DE DATOS DE SENSORES (antes de guardar y graficar)
+# ----------------------------------------------------------
+# Sustituye al antiguo filtro fijo "Temp_C < 150". Por cada (sensor, campo):
+#  1. Rango físico: fuera de lo que el sensor puede medir (BME280, LTR390...)
+#     -> muestra rechazada.
+#  2. Filtro de Hampel causal: cada muestra se compara con la mediana de las
+#     VENTANA_HAMPEL anteriores; si se aleja más de UMBRAL_MAD desviaciones
+#     robustas (1.4826 * MAD), es un pico y se rechaza. TOLERANCIA_MIN evita
+#     rechazarlo todo cuando la señal está plana (MAD = 0).
+# La historia guarda las muestras en rango aunque sean picos: si el cambio
+# es real (un escalón), se acepta en cuanto ocupa media ventana.
+#
+# Se trabaja por columnas con NumPy: un lote, o todas las Lecturas de un
+# sensor que llegan juntas, se limpian de una vez. Con pocas muestras (lo
+# normal a 1 mensaje cada pocos segundos) NumPy cuesta más de lo que ahorra
+# y se usa el mismo algoritmo en Python puro. Lo rechazado se pone a NaN (el
+# resto de campos de la muestra se conserva) y se cuenta por sensor.
+
+RANGOS_FISICOS = {
+    "Temp_C": (-40.0, 85.0),          # BME280
+    "Humidity_Per": (0.0, 100.0),     # BME280
+    "Pressure_hPa": (300.0, 1100.0),  # BME280
+    "UVI": (0.0, 25.0),               # LTR390
+    "CO_ppm": (0.0, 1000.0),
+    "CO2_ppm": (0.0, 10_000.0),
+}
+TOLERANCIA_MIN = {   # Desviación que nunca se considera pico (unidades del campo)
+    "Temp_C": 0.5,
+    "Humidity_Per": 2.0,
+    "Pressure_hPa": 1.0,
+    "UVI": 0.3,
+    "CO_ppm": 2.0,
+    "CO2_ppm": 50.0,
+}
+VENTANA_HAMPEL = 9     # Muestras anteriores con las que se compara cada una
+UMBRAL_MAD = 3.5       # Desviaciones robustas para considerar un pico
+MIN_VECTORIAL = 16     # Por debajo de estas muestras por sensor, sin NumPy
+_K_MAD = 1.4826        # MAD -> desviación típica (distribución normal)
+
+
+class Limpiador:
+    def __init__(self, rangos=RANGOS_FISICOS, tolerancias=TOLERANCIA_MIN,
+                 ventana=VENTANA_HAMPEL, umbral=UMBRAL_MAD):
+        self.rangos = dict(rangos)
+        self.tolerancias = dict(tolerancias)
+        self.ventana = ventana      # 0 = sin filtro de Hampel (solo rangos)
+        self.umbral = umbral
+        self._historia = {}         # (sensor, campo) -> deque con las últimas `ventana` muestras en rango
+        self.lock = threading.Lock()
+        # Contadores
+        self.revisadas = 0
+        self.fuera_de_rango = Counter()   # sensor -> muestras
+        self.picos = Counter()            # sensor -> muestras
+        self.rechazadas_campo = Counter() # (sensor, campo) -> muestras
+        METRICAS.contador("limpieza_rechazadas_total", "Muestras rechazadas por la limpieza",
+                          ("sensor", "motivo"), funcion=self._rechazadas)
+
+    # ---------- NÚCLEO VECTORIZADO ----------
+    def mascara(self, sensor_id, campo, v):
+        """Array bool: True donde la muestra de `v` se acepta (NaN se acepta,
+        no hay nada que limpiar). Actualiza la historia y los contadores."""
+        ok = np.ones(len(v), dtype=bool)
+        validos = ~np.isnan(v)
+        n_validos = int(validos.sum())
+        if not n_validos:
+            return ok
+        self.revisadas += n_validos
+        rango = self.rangos.get(campo)
+        if rango is not None:
+            fuera = validos & ((v < rango[0]) | (v > rango[1]))
+            n = int(fuera.sum())
+            if n:
+                ok &= ~fuera
+                validos &= ~fuera
+                self.fuera_de_rango[sensor_id] += n
+                self.rechazadas_campo[(sensor_id, campo)] += n
+        if self.ventana and validos.any():
+            self._hampel(sensor_id, campo, v, validos, ok)
+        return ok
+
+    def _historia_de(self, clave):
+        h = self._historia.get(clave)
+        if h is None:
+            h = self._historia[clave] = deque(maxlen=self.ventana)
+        return h
+
+    def _hampel(self, sensor_id, campo, v, validos, ok):
+        k = self.ventana
+        clave = (sensor_id, campo)
+        historia = self._historia_de(clave)
+        previa = np.fromiter(historia, dtype=float, count=len(historia))
+        pos = np.flatnonzero(validos)
+        serie = np.concatenate([previa, v[pos]])
+        historia.extend(serie[-k:].tolist())
+        # Muestras con k anteriores disponibles: posiciones >= k de la serie
+        primera = max(len(previa), k)
+        if primera >= len(serie):
+            return
+        ventanas = sliding_window_view(serie[:-1], k)[primera - k:]
+        mediana = np.median(ventanas, axis=1)
+        mad = np.median(np.abs(ventanas - mediana[:, None]), axis=1)
+        limite = np.maximum(self.umbral * _K_MAD * mad, self.tolerancias.get(campo, 0.0))
+        picos = np.abs(serie[primera:] - mediana) > limite
+        n = int(picos.sum())
+        if n:
+            ok[pos[primera - len(previa):][picos]] = False
+            self.picos[sensor_id] += n
+            self.rechazadas_campo[clave] += n
+
+    def aceptar(self, sensor_id, campo, x):
+        """mascara() para una sola muestra, sin NumPy."""
+        if x != x:
+            return True
+        self.revisadas += 1
+        rango = self.rangos.get(campo)
+        if rango is not None and not rango[0] <= x <= rango[1]:
+            self.fuera_de_rango[sensor_id] += 1
+            self.rechazadas_campo[(sensor_id, campo)] += 1
+            return False
+        if not self.ventana:
+            return True
+        clave = (sensor_id, campo)
+        historia = self._historia_de(clave)
+        completa = len(historia) == self.ventana
+        if completa:
+            orden = sorted(historia)
+            mediana = _mediana(orden)
+            mad = _mediana(sorted(abs(h - mediana) for h in orden))
+            pico = abs(x - mediana) > max(self.umbral * _K_MAD * mad, self.tolerancias.get(campo, 0.0))
+        historia.append(x)
+        if completa and pico:
+            self.picos[sensor_id] += 1
+            self.rechazadas_campo[clave] += 1
+            return False
+        return True
+
+    # ---------- REGISTROS ----------
+    def limpiar_varios(self, registros):
+        """Devuelve los registros con las muestras rechazadas a NaN. Las
+        Lecturas de un mismo sensor se limpian juntas, como columnas."""
+        salida = list(registros)
+        por_sensor = {}   # sensor -> índices de sus Lecturas
+        with self.lock:
+            for i, r in enumerate(registros):
+                if isinstance(r, LoteLecturas):
+                    salida[i] = self._limpiar_lote(r)
+                else:
+                    por_sensor.setdefault(r.ID, []).append(i)
+            for sensor_id, indices in por_sensor.items():
+                if len(indices) < MIN_VECTORIAL:
+                    for i in indices:
+                        salida[i] = self._limpiar_lectura(registros[i])
+                    continue
+                filas = np.array([registros[i][3:9] for i in indices], dtype=float)
+                tocadas = np.zeros(len(indices), dtype=bool)
+                for j, campo in enumerate(CAMPOS_ESQUEMA):
+                    ok = self.mascara(sensor_id, campo, filas[:, j])
+                    if not ok.all():
+                        filas[~ok, j] = NAN
+                        tocadas |= ~ok
+                for k in np.flatnonzero(tocadas).tolist():
+                    r = registros[indices[k]]
+                    salida[indices[k]] = Lectura(r.ID, r.Tiempo_UTC, r.received_ts, *filas[k].tolist(), r.extra, r.t_ns)
+        return salida
+
+    def limpiar(self, registro):
+        return self.limpiar_varios([registro])[0]
+
+    def _limpiar_lectura(self, r):
+        valores = None
+        for j, campo in enumerate(CAMPOS_ESQUEMA):
+            if not self.aceptar(r.ID, campo, r[3 + j]):
+                if valores is None:
+                    valores = list(r[3:9])
+                valores[j] = NAN
+        return r if valores is None else Lectura(r.ID, r.Tiempo_UTC, r.received_ts, *valores, r.extra, r.t_ns)
+
+    def _limpiar_lote(self, lote):
+        columnas = None
+        for campo, v in lote.columnas.items():
+            ok = self.mascara(lote.ID, campo, v)
+            if not ok.all():
+                if columnas is None:
+                    columnas = dict(lote.columnas)
+                columnas[campo] = np.where(ok, v, NAN)
+        return lote if columnas is None else lote.reemplazar(columnas=columnas)
+
+    # ---------- ESTADO ----------
+    def _rechazadas(self):
+        r = {(s, "fuera_de_rango"): n for s, n in list(self.fuera_de_rango.items())}
+        r.update({(s, "pico"): n for s, n in list(self.picos.items())})
+        return r
+
+    def estadisticas(self):
+        sensores = set(self.fuera_de_rango) | set(self.picos)
+        return {
+            "revisadas": self.revisadas,
+            "fuera_de_rango": sum(self.fuera_de_rango.values()),
+            "picos": sum(self.picos.values()),
+            "por_sensor": {s: {"fuera_de_rango": self.fuera_de_rango[s], "picos": self.picos[s]}
+                           for s in sorted(sensores)},
+        }
+
+
+def _mediana(orden):
+    n = len(orden)
+    m = n // 2
+    return orden[m] if n % 2 else (orden[m - 1] + orden[m]) / 2
+
+
+def vacia(registro):
+    """¿El registro se ha quedado sin ninguna medida tras limpiarlo?"""
+    if isinstance(registro, LoteLecturas):
+        return not any((~np.isnan(v)).any() for v in registro.columnas.values())
+    return next(iter(registro.medidas()), None) is None
@@ -0,0 +1,383 @@
+import atexit
+import glob
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+from decodificador import CAMPOS_ESQUEMA, LoteLecturas, como_lectura
+from metricas import METRICAS
+
+# ----------------------------------------------------------
+# LOG DE TRÁFICO INDEXADO (millones de mensajes, paginado)
+# ----------------------------------------------------------
+# - Cada mensaje se serializa a JSON UNA vez, al llegar, directamente
+#   desde los campos de la Lectura (el render solo pinta la página
+#   visible con el texto ya hecho).
+# - El log va en trozos de SEGMENTO mensajes. Cada trozo tiene un índice
+#   columnar en numpy (hora, sensor, esquema de campos y posición en el
+#   fichero) y, con carpeta, su fichero trafico/pid_N/NNNNNN.jsonl (una
+#   línea por mensaje). El texto solo se queda en memoria en los
+#   EN_MEMORIA trozos más nuevos; el de los demás se lee del disco.
+# - Filtrar por sensor, campo u hora es una máscara numpy por trozo.
+# - Búsqueda de texto: las coincidencias de cada trozo se guardan en caché
+#   por (trozo, texto), así que un refresco solo revisa los mensajes
+#   nuevos. Cada consulta revisa como mucho BUSQUEDA_TROZOS trozos que no
+#   estén en caché (el total queda como "al menos N" y la consulta
+#   siguiente sigue por donde iba); además se para en cuanto tiene la
+#   página pedida.
+# - Se guardan como mucho MAX_SEGMENTOS trozos: al pasar, se borra el
+#   más viejo. El log es el de la ejecución en curso y cada proceso usa
+#   su propia carpeta (pid_N), que se borra al salir; al arrancar se
+#   borran las de procesos que ya no existen.
+
+CARPETA_TRAFICO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trafico")
+SEGMENTO = 100_000        # Mensajes por trozo (y por fichero)
+MAX_SEGMENTOS = 50        # 5 M de mensajes con carpeta
+MAX_SEGMENTOS_MEMORIA = 4 # Sin carpeta todo el texto vive en RAM
+EN_MEMORIA = 2            # Trozos más nuevos con el texto en RAM
+TAM_PAGINA = 25
+BUSQUEDA_TROZOS = 2       # Trozos sin caché que revisa como mucho una búsqueda de texto
+CACHE_BUSQUEDAS = 256     # Entradas (trozo, texto) en la caché de coincidencias
+
+CONSULTAS = METRICAS.histograma("trafico_consulta_segundos", "Duración de una consulta al log de tráfico",
+                                ("tipo",), limites=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                                                    0.1, 0.25, 0.5, 1.0))
+
+
+class Entrada(NamedTuple):
+    seq: int        # Posición en el log (0 = primer mensaje de la ejecución)
+    ts: float       # Hora de llegada (epoch)
+    sensor: str
+    texto: str      # JSON compacto, tal cual se serializó al llegar
+
+
+class Pagina(NamedTuple):
+    entradas: list  # [Entrada], de la más nueva a la más vieja
+    total: int      # Mensajes que cumplen el filtro
+    exacto: bool    # False: búsqueda de texto cortada, `total` es un mínimo
+    pagina: int
+    paginas: int
+
+
+class _Trozo:
+    def __init__(self, base, capacidad, ruta):
+        self.base = base                  # seq de su primera entrada
+        self.n = 0
+        self.ts = np.empty(capacidad, dtype=np.float64)
+        self.sensor = np.empty(capacidad, dtype=np.int32)
+        self.esquema = np.empty(capacidad, dtype=np.int32)
+        self.posicion = np.empty(capacidad, dtype=np.int64)
+        self.textos = []                  # None cuando solo queda en disco
+        self.ruta = ruta
+        self.bytes = 0
+
+    def lineas(self, indices):
+        """Textos de las entradas `indices` (de memoria o del fichero)."""
+        textos = self.textos
+        if textos is not None:
+            return [textos[i] for i in indices]
+        try:
+            with open(self.ruta, "rb") as f:
+                if len(indices) > 64:
+                    # Muchas: una lectura secuencial gana a cientos de seek()
+                    todas = f.read().decode("ascii").split("\n")
+                    return [todas[i] for i in indices]
+                r = []
+                for i in indices:
+                    f.seek(int(self.posicion[i]))
+                    r.append(f.readline().decode("ascii").rstrip("\n"))
+                return r
+        except FileNotFoundError:
+            return []   # Trozo borrado por la retención mientras se leía
+
+    def tramo(self, a, b):
+        """Textos de las entradas a..b-1 (para revisarlas todas en una búsqueda)."""
+        textos = self.textos
+        if textos is not None:
+            return textos[a:b]
+        try:
+            with open(self.ruta, "rb") as f:
+                f.seek(int(self.posicion[a]))
+                return f.read().decode("ascii").split("\n")[:b - a]
+        except FileNotFoundError:
+            return []
+
+
+def _vivo(pid):
+    if os.name == "nt":
+        return True   # Sin forma segura de comprobarlo: no se toca su carpeta
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _carpeta_propia(carpeta):
+    """trafico/pid_N para este proceso; borra las de procesos que ya no existen."""
+    os.makedirs(carpeta, exist_ok=True)
+    for ruta in glob.glob(os.path.join(carpeta, "pid_*")):
+        try:
+            pid = int(os.path.basename(ruta)[4:])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _vivo(pid):
+            shutil.rmtree(ruta, ignore_errors=True)
+    propia = os.path.join(carpeta, f"pid_{os.getpid()}")
+    shutil.rmtree(propia, ignore_errors=True)   # De un proceso muerto con el mismo PID
+    os.makedirs(propia)
+    atexit.register(shutil.rmtree, propia, True)
+    return propia
+
+
+def _numero(v):
+    # repr de float es JSON válido salvo inf/nan
+    return repr(v) if math.isfinite(v) else json.dumps(v)
+
+
+def _serializar(r):
+    """(campos, JSON compacto) de una Lectura o LoteLecturas, sin pasar por un dict."""
+    campos = ["ID"]
+    partes = ['{"ID":', json.dumps(r.ID)]
+    if r.Tiempo_UTC is not None:
+        campos.append("Tiempo_UTC")
+        partes += [',"Tiempo_UTC":', json.dumps(r.Tiempo_UTC)]
+    if isinstance(r, LoteLecturas):
+        campos.append("Muestras")
+        partes.append(f',"Muestras":{len(r.t)}')
+        valores = ((c, float(v[-1])) for c, v in r.columnas.items() if len(v))
+    else:
+        valores = ((c, v) for c, v in zip(CAMPOS_ESQUEMA, r[3:9]) if v == v)
+    for campo, v in valores:
+        campos.append(campo)
+        partes += [',"', campo, '":', _numero(v)]
+    extra = getattr(r, "extra", None)
+    if extra:
+        campos += extra.keys()
+        partes += [",", json.dumps(extra, separators=(",", ":"))[1:-1]]
+    partes.append("}")
+    return tuple(campos), "".join(partes)
+
+
+class LogTrafico:
+    def __init__(self, carpeta=CARPETA_TRAFICO, segmento=SEGMENTO, max_segmentos=None,
+                 en_memoria=EN_MEMORIA):
+        """`carpeta=None`: solo en memoria (MAX_SEGMENTOS_MEMORIA trozos)."""
+        self.carpeta = carpeta
+        self.segmento = segmento
+        self.max_segmentos = max_segmentos or (MAX_SEGMENTOS if carpeta else MAX_SEGMENTOS_MEMORIA)
+        self.en_memoria = max(1, en_memoria)
+        self.lock = threading.Lock()
+        self.trozos = []
+        self.total = 0           # Mensajes escritos desde el arranque
+        self.sensores = {}       # ID -> código
+        self.esquemas = {}       # tupla de campos -> código
+        self._nombres = []       # código -> ID
+        self._campos = []        # código -> frozenset de campos
+        self._archivo = None
+        self._busquedas = {}     # (base del trozo, texto) -> [revisadas, índices que coinciden]
+        self._lock_busquedas = threading.Lock()
+        if carpeta:
+            self.carpeta = _carpeta_propia(carpeta)
+        METRICAS.medidor("trafico_entradas", "Mensajes guardados en el log de tráfico",
+                         funcion=lambda: sum(tr.n for tr in self.trozos))
+        METRICAS.contador("trafico_escritos_total", "Mensajes que han pasado por el log de tráfico",
+                          funcion=lambda: self.total)
+
+    # ---------- INGESTA ----------
+    def agregar(self, registro):
+        self.agregar_varios([registro])
+
+    def agregar_varios(self, registros):
+        """Lecturas, lotes o dicts con "ID": se serializan fuera del lock."""
+        filas = []
+        for r in registros:
+            if isinstance(r, dict):
+                r = como_lectura(r)
+            if r is None:
+                continue
+            # ensure_ascii: el nº de caracteres es el de bytes (posición en el fichero)
+            campos, texto = _serializar(r)
+            filas.append((r.received_ts, r.ID, campos, texto))
+        if not filas:
+            return
+        with self.lock:
+            for fila in filas:
+                self._escribir(*fila)
+            if self._archivo is not None:
+                self._archivo.flush()
+
+    def _escribir(self, ts, sensor, campos, texto):
+        # Llamar con el lock tomado
+        trozo = self.trozos[-1] if self.trozos else None
+        if trozo is None or trozo.n == self.segmento:
+            trozo = self._nuevo_trozo()
+        codigo = self.sensores.get(sensor)
+        if codigo is None:
+            codigo = self.sensores[sensor] = len(self._nombres)
+            self._nombres.append(sensor)
+        esquema = self.esquemas.get(campos)
+        if esquema is None:
+            esquema = self.esquemas[campos] = len(self._campos)
+            self._campos.append(frozenset(campos))
+        i = trozo.n
+        trozo.ts[i] = ts
+        trozo.sensor[i] = codigo
+        trozo.esquema[i] = esquema
+        trozo.posicion[i] = trozo.bytes
+        trozo.textos.append(texto)
+        if self._archivo is not None:
+            self._archivo.write(texto)
+            self._archivo.write("\n")
+        trozo.bytes += len(texto) + 1
+        trozo.n = i + 1
+        self.total += 1
+
+    def _nuevo_trozo(self):
+        ruta = None
+        if self.carpeta:
+            if self._archivo is not None:
+                self._archivo.close()
+            ruta = os.path.join(self.carpeta, f"{self.total // self.segmento:06d}.jsonl")
+            self._archivo = open(ruta, "w", encoding="ascii", buffering=1 << 16)
+        trozo = _Trozo(self.total, self.segmento, ruta)
+        self.trozos.append(trozo)
+        if ruta is not None and len(self.trozos) > self.en_memoria:
+            # El texto de los trozos viejos ya está en su fichero
+            self.trozos[-1 - self.en_memoria].textos = None
+        while len(self.trozos) > self.max_segmentos:
+            viejo = self.trozos.pop(0)
+            if viejo.ruta:
+                try:
+                    os.remove(viejo.ruta)
+                except OSError:
+                    pass
+        return trozo
+
+    def cerrar(self):
+        with self.lock:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+
+    # ---------- CONSULTA ----------
+    def __len__(self):
+        with self.lock:
+            return sum(tr.n for tr in self.trozos)
+
+    def ids(self):
+        with self.lock:
+            return sorted(self._nombres)
+
+    def campos(self):
+        with self.lock:
+            return sorted(set().union(*self._campos))
+
+    def consulta(self, sensores=None, campo=None, desde=None, hasta=None, texto=None,
+                 pagina=0, tam=TAM_PAGINA):
+        """Página `pagina` (0 = la más nueva) de los mensajes que cumplen todos los filtros.
+        `sensores`: IDs; `campo`: solo mensajes que lo traen; `desde`/`hasta`: epoch
+        de llegada; `texto`: búsqueda sin distinguir mayúsculas en el JSON."""
+        t0 = time.perf_counter()
+        with self.lock:
+            # Foto del índice: las entradas < n de cada trozo ya no cambian
+            foto = [(tr, tr.n) for tr in self.trozos]
+            cod_sensores = None if sensores is None else \
+                [self.sensores[s] for s in sensores if s in self.sensores]
+            cod_esquemas = None if campo is None else \
+                [i for i, c in enumerate(self._campos) if campo in c]
+            nombres = list(self._nombres)
+
+        def mascara(tr, n):
+            m = None
+            if cod_sensores is not None:
+                m = np.isin(tr.sensor[:n], cod_sensores)
+            if cod_esquemas is not None:
+                e = np.isin(tr.esquema[:n], cod_esquemas)
+                m = e if m is None else m & e
+            if desde is not None:
+                e = tr.ts[:n] >= desde
+                m = e if m is None else m & e
+            if hasta is not None:
+                e = tr.ts[:n] <= hasta
+                m = e if m is None else m & e
+            return m
+
+        saltar = pagina * tam
+        entradas = []
+        total = 0
+        exacto = True
+        aguja = texto.lower() if texto else None
+        presupuesto = BUSQUEDA_TROZOS
+        for tr, n in reversed(foto):
+            if not n:
+                continue
+            m = mascara(tr, n)
+            if aguja is None:
+                # Más nuevo primero
+                indices = np.arange(n - 1, -1, -1) if m is None else np.flatnonzero(m)[::-1]
+            else:
+                coinciden = self._coincidencias(tr, n, aguja, presupuesto > 0)
+                if coinciden is None:
+                    exacto = False   # Sin presupuesto: la consulta siguiente sigue desde aquí
+                    break
+                if coinciden[1]:
+                    presupuesto -= 1
+                coinciden = coinciden[0]
+                if m is not None:
+                    coinciden = coinciden[m[coinciden]]
+                indices = coinciden[::-1]
+            # El total sale del índice (o de la caché) y solo se lee la página
+            if saltar < total + len(indices) and len(entradas) < tam:
+                hueco = max(0, saltar - total)
+                elegidos = indices[hueco:hueco + tam - len(entradas)]
+                entradas += self._entradas(tr, elegidos, tr.lineas(elegidos), nombres)
+            total += len(indices)
+            if aguja is not None and total > saltar + tam and tr is not foto[0][0]:
+                # Ya hay página y sabemos que existe la siguiente: no se sigue buscando
+                exacto = False
+                break
+        CONSULTAS.de("texto" if aguja else "indice").observar(time.perf_counter() - t0)
+        return Pagina(entradas, total, exacto, pagina, max(1, math.ceil(total / tam)))
+
+    def _coincidencias(self, tr, n, aguja, revisar_trozo):
+        """(índices del trozo < n cuyo JSON contiene `aguja`, True si ha hecho falta
+        revisar el trozo entero), o None si no está en caché y `revisar_trozo` es False.
+        Lo ya revisado sale de la caché: solo se leen las entradas nuevas."""
+        clave = (tr.base, aguja)
+        with self._lock_busquedas:
+            previo = self._busquedas.get(clave)
+        revisadas, indices = previo if previo is not None else (0, np.empty(0, dtype=np.int64))
+        if revisadas >= n:
+            return indices[:np.searchsorted(indices, n)], False
+        if previo is None and not revisar_trozo:
+            return None
+        nuevas = [revisadas + k for k, t in enumerate(tr.tramo(revisadas, n)) if aguja in t.lower()]
+        indices = np.concatenate([indices, np.asarray(nuevas, dtype=np.int64)])
+        with self._lock_busquedas:
+            self._busquedas[clave] = (n, indices)
+            while len(self._busquedas) > CACHE_BUSQUEDAS:
+                self._busquedas.pop(next(iter(self._busquedas)))
+        return indices, previo is None
+
+    @staticmethod
+    def _entradas(tr, indices, textos, nombres):
+        return [Entrada(tr.base + int(i), float(tr.ts[i]), nombres[tr.sensor[i]], t)
+                for i, t in zip(indices, textos)]
+
+    def estadisticas(self):
+        with self.lock:
+            return {
+                "entradas": sum(tr.n for tr in self.trozos),
+                "escritos": self.total,
+                "trozos": len(self.trozos),
+                "sensores": len(self._nombres),
+                "en_disco": bool(self.carpeta),
+            }
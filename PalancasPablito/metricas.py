@@ -0,0 +1,320 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ----------------------------------------------------------
+# MÉTRICAS DE INGESTA (formato de texto de Prometheus)
+# ----------------------------------------------------------
+# Registro de métricas del proceso, barato en el camino caliente:
+#  - Las métricas se crean UNA vez al importar cada módulo (contadores,
+#    medidores e histogramas con cubetas fijas). Cada evento solo suma a un
+#    atributo de una serie ya creada; el hijo de cada etiqueta (sensor,
+#    topic...) se crea la primera vez que aparece y después es un dict.get.
+#  - Sin locks: como el resto de contadores del proyecto, se confía en el
+#    GIL (en el peor caso se pierde algún incremento entre hilos).
+#  - Lo que ya cuentan otros módulos (colas, descartes, limpieza...) no se
+#    duplica: se registra con `funcion`, que solo se evalúa al leer.
+#
+# Lectura:
+#  - servir(): GET http://127.0.0.1:9108/metrics (apuntar ahí un Prometheus)
+#  - METRICAS.tabla() / cuantil(): para el panel del dashboard
+#
+# Uso:
+#   from metricas import METRICAS
+#   RECIBIDOS = METRICAS.contador("ingesta_recibidos_total", "Mensajes recibidos", ("topic",))
+#   RECIBIDOS.de(topic).inc()
+
+PUERTO = int(os.environ.get("METRICAS_PUERTO", 9108))
+TIPOS = ("counter", "gauge", "histogram")
+# Cubetas por defecto (s): de 1 µs a 10 s
+CUBETAS_TIEMPO = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3,
+                  2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Serie:
+    """Valor de un contador o medidor para una combinación de etiquetas."""
+    __slots__ = ("valor",)
+
+    def __init__(self):
+        self.valor = 0
+
+    def inc(self, n=1):
+        self.valor += n
+
+    def fijar(self, v):
+        self.valor = v
+
+
+class _SerieHistograma:
+    __slots__ = ("limites", "cubetas", "suma", "cuenta")
+
+    def __init__(self, limites):
+        self.limites = limites                 # En las unidades de observar()
+        self.cubetas = [0] * (len(limites) + 1)  # La última es +Inf (no acumuladas)
+        self.suma = 0
+        self.cuenta = 0
+
+    def observar(self, v):
+        self.cubetas[bisect_left(self.limites, v)] += 1
+        self.suma += v
+        self.cuenta += 1
+
+
+class Metrica:
+    def __init__(self, nombre, tipo, ayuda, etiquetas=(), limites=None, escala=1.0, funcion=None):
+        if tipo not in TIPOS:
+            raise ValueError(f"Métrica {nombre}: tipo desconocido {tipo} (válidos: {', '.join(TIPOS)})")
+        self.nombre = nombre
+        self.tipo = tipo
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.escala = escala      # Unidades de observar() -> unidades expuestas (ns -> s: 1e-9)
+        self.funcion = funcion    # Valores calculados al leer: número o {etiqueta(s): número}
+        if tipo == "histogram":
+            limites = tuple(limites or CUBETAS_TIEMPO)
+            self._le = [repr(float(x)) for x in limites]           # Para exponer
+            self._limites = [x / escala for x in limites]         # En unidades de observar()
+        self._hijos = {}          # valor de etiqueta (o tupla de valores) -> serie
+        self._sola = None if self.etiquetas else self._nueva()
+
+    def _nueva(self):
+        return _SerieHistograma(self._limites) if self.tipo == "histogram" else _Serie()
+
+    # ---------- CAMINO CALIENTE ----------
+    def de(self, valor):
+        """Serie de la (única) etiqueta `valor`."""
+        s = self._hijos.get(valor)
+        if s is None:
+            s = self._hijos[valor] = self._nueva()
+        return s
+
+    def con(self, *valores):
+        """Serie de varias etiquetas (en el orden de `etiquetas`)."""
+        return self.de(valores)
+
+    def inc(self, n=1):
+        self._sola.valor += n
+
+    def fijar(self, v):
+        self._sola.valor = v
+
+    def observar(self, v):
+        self._sola.observar(v)
+
+    # ---------- LECTURA ----------
+    def series(self):
+        """[(dict de etiquetas, serie o número)]"""
+        if self.funcion is not None:
+            try:
+                valores = self.funcion()
+            except Exception as e:
+                print(f"Error leyendo la métrica {self.nombre}: {e}")
+                return []
+            if not isinstance(valores, dict):
+                return [({}, valores)]
+            return [(self._etiquetas_de(k), v) for k, v in valores.items()]
+        if self._sola is not None:
+            return [({}, self._sola)]
+        return [(self._etiquetas_de(k), s) for k, s in list(self._hijos.items())]
+
+    def _etiquetas_de(self, clave):
+        valores = clave if isinstance(clave, tuple) else (clave,)
+        return dict(zip(self.etiquetas, map(str, valores)))
+
+    def cuantil(self, q, *valores):
+        """Cuantil aproximado (interpolado dentro de la cubeta) de un histograma,
+        en unidades expuestas. Sin etiquetas: todas las series juntas."""
+        if valores:
+            series = [self.de(valores[0] if len(valores) == 1 else valores)]
+        else:
+            series = [s for _, s in self.series()]
+        cubetas = [sum(c) for c in zip(*(s.cubetas for s in series))] if series else []
+        total = sum(cubetas)
+        if not total:
+            return None
+        objetivo = q * total
+        acumulado = 0
+        for i, n in enumerate(cubetas):
+            if acumulado + n >= objetivo and n:
+                if i == len(self._limites):          # +Inf: lo mejor es el último límite
+                    return self._limites[-1] * self.escala
+                bajo = self._limites[i - 1] if i else 0.0
+                return (bajo + (self._limites[i] - bajo) * (objetivo - acumulado) / n) * self.escala
+            acumulado += n
+        return None
+
+    def total(self):
+        """Suma de todas las series (contadores y medidores) o nº de observaciones (histogramas)."""
+        if self.tipo == "histogram":
+            return sum(s.cuenta for _, s in self.series())
+        return sum(s.valor if isinstance(s, _Serie) else s for _, s in self.series())
+
+
+def _escapar(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formato_etiquetas(etiquetas, extra=None):
+    pares = list(etiquetas.items()) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas = {}   # nombre -> Metrica
+        self.lock = threading.Lock()   # Solo para registrar (no en el camino caliente)
+        self.inicio = time.time()
+
+    def _registrar(self, nombre, tipo, ayuda, etiquetas, **opciones):
+        with self.lock:
+            m = self._metricas.get(nombre)
+            if m is not None:
+                # Registrar dos veces la misma métrica (otra instancia, recarga de
+                # Streamlit) devuelve la existente; con `funcion`, gana la última
+                if m.tipo != tipo or m.etiquetas != tuple(etiquetas):
+                    raise ValueError(f"La métrica {nombre} ya existe con otro tipo o etiquetas")
+                if opciones.get("funcion") is not None:
+                    m.funcion = opciones["funcion"]
+                return m
+            m = self._metricas[nombre] = Metrica(nombre, tipo, ayuda, etiquetas, **opciones)
+            return m
+
+    def contador(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self._registrar(nombre, "counter", ayuda, etiquetas, funcion=funcion)
+
+    def medidor(self, nombre, ayuda, etiquetas=(), funcion=None):
+        return self._registrar(nombre, "gauge", ayuda, etiquetas, funcion=funcion)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=None, escala=1.0):
+        """`limites` en unidades expuestas (s); `escala` pasa de lo observado a
+        ellas (p. ej. 1e-9 para observar ns directamente)."""
+        return self._registrar(nombre, "histogram", ayuda, etiquetas, limites=limites, escala=escala)
+
+    def __getitem__(self, nombre):
+        return self._metricas[nombre]
+
+    def __contains__(self, nombre):
+        return nombre in self._metricas
+
+    # ---------- EXPOSICIÓN ----------
+    def exponer(self):
+        """Texto en el formato de exposición de Prometheus (0.0.4)."""
+        lineas = []
+        for nombre in sorted(self._metricas):
+            m = self._metricas[nombre]
+            lineas.append(f"# HELP {nombre} {m.ayuda}")
+            lineas.append(f"# TYPE {nombre} {m.tipo}")
+            for etiquetas, s in m.series():
+                if m.tipo != "histogram":
+                    v = s.valor if isinstance(s, _Serie) else s
+                    lineas.append(f"{nombre}{_formato_etiquetas(etiquetas)} {_numero(v)}")
+                    continue
+                acumulado = 0
+                for le, n in zip(m._le, s.cubetas):
+                    acumulado += n
+                    lineas.append(f"{nombre}_bucket{_formato_etiquetas(etiquetas, ('le', le))} {acumulado}")
+                lineas.append(f"{nombre}_bucket{_formato_etiquetas(etiquetas, ('le', '+Inf'))} {s.cuenta}")
+                lineas.append(f"{nombre}_sum{_formato_etiquetas(etiquetas)} {_numero(s.suma * m.escala)}")
+                lineas.append(f"{nombre}_count{_formato_etiquetas(etiquetas)} {s.cuenta}")
+        return "\n".join(lineas) + "\n"
+
+    def tabla(self):
+        """Filas {métrica, etiquetas, valor} para mostrar (histogramas: p50/p99)."""
+        filas = []
+        for nombre in sorted(self._metricas):
+            m = self._metricas[nombre]
+            for etiquetas, s in m.series():
+                fila = {"métrica": nombre, "etiquetas": ", ".join(f"{k}={v}" for k, v in etiquetas.items())}
+                if m.tipo == "histogram":
+                    if not s.cuenta:
+                        continue
+                    clave = tuple(etiquetas.values())
+                    fila["valor"] = s.cuenta
+                    fila["p50"] = m.cuantil(0.5, *clave) if clave else m.cuantil(0.5)
+                    fila["p99"] = m.cuantil(0.99, *clave) if clave else m.cuantil(0.99)
+                else:
+                    fila["valor"] = s.valor if isinstance(s, _Serie) else s
+                filas.append(fila)
+        return filas
+
+
+METRICAS = RegistroMetricas()   # Registro del proceso
+
+
+# ---------- LOCKS CON ESPERA MEDIDA ----------
+class LockMedido:
+    """Envuelve un Lock y anota en un histograma (ns) lo que se espera por él.
+    Sin contención cuesta un acquire no bloqueante más. Los acquire no
+    bloqueantes no se anotan: no esperan."""
+
+    def __init__(self, lock, serie):
+        self._lock = lock
+        self.serie = serie
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            if blocking:
+                self.serie.observar(0)
+            return True
+        if not blocking:
+            return False
+        t0 = time.perf_counter_ns()
+        ok = self._lock.acquire(True, timeout)
+        self.serie.observar(time.perf_counter_ns() - t0)
+        return ok
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def _is_owned(self):
+        # threading.Condition(LockMedido(...)) lo usa; sin él lo averigua con
+        # acquire(False) + release() en cada wait()/notify()
+        propio = getattr(self._lock, "_is_owned", None)
+        return propio() if propio is not None else self._lock.locked()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+# ---------- ENDPOINT HTTP ----------
+def servir(registro=METRICAS, puerto=PUERTO, direccion="127.0.0.1"):
+    """Sirve /metrics en un hilo aparte. Devuelve el servidor o None si el
+    puerto está ocupado (otro proceso ya expone sus métricas)."""
+
+    class _Manejador(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            cuerpo = registro.exponer().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        servidor = ThreadingHTTPServer((direccion, puerto), _Manejador)
+    except OSError as e:
+        print(f"⚠️ Métricas no disponibles en {direccion}:{puerto}: {e}")
+        return None
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    print(f"📈 Métricas en http://{direccion}:{puerto}/metrics")
+    return servidor
@@ -1,99 +1,153 @@
-import json
-import paho.mqtt.client as mqtt
 import matplotlib.pyplot as plt
-from collections import deque
-import threading
+import numpy as np
 import time
+import os
+from registro_sensores import RegistroSensores
+from decodificador import Decodificador
+from codec_binario import TOPIC_BINARIO
+from ingesta_async import NucleoIngesta
+from limpieza import Limpiador, vacia
 
 # ----------------------------------------------------------
 # CONFIGURACIÓN
 # ----------------------------------------------------------
-BROKER = "broker.emqx.io"
+BROKER = os.environ.get("MQTT_BROKER", "broker.emqx.io")
 TOPIC = "Enviromental Sensors Network"
-TARGET_ID = "A1"
+TARGET_IDS = ["A1"]        # Sensores a dibujar (se guardan todos)
 
-MAX_POINTS = 200
+MAX_POINTS = 200           # Muestras dibujadas por sensor
+FPS = 30                   # Máximo de fotogramas por segundo
+PRESUPUESTO = 100_000      # Muestras totales entre todos los sensores
 
-time_buf = deque(maxlen=MAX_POINTS)
-temp_buf = deque(maxlen=MAX_POINTS)
-hum_buf = deque(maxlen=MAX_POINTS)
-pres_buf = deque(maxlen=MAX_POINTS)
-uvi_buf = deque(maxlen=MAX_POINTS)
+registro = RegistroSensores(PRESUPUESTO)
+decodificador = Decodificador()
+limpiador = Limpiador()
+
+# Campo -> etiqueta de la leyenda
+VARIABLES = {
+    "Temp_C": "Temperatura (°C)",
+    "Humidity_Per": "Humedad (%)",
+    "Pressure_hPa": "Presión (hPa)",
+    "UVI": "UVI",
+}
 
 # ----------------------------------------------------------
-# MQTT CALLBACKS
+# INGESTA (núcleo asyncio en segundo plano)
 # ----------------------------------------------------------
-def on_connect(client, userdata, flags, rc):
-    print("Conectado al broker:", rc)
-    client.subscribe(TOPIC)
-
-
-def on_message(client, userdata, msg):
-    raw = msg.payload.decode("utf-8").strip()
-    print("Mensaje recibido:", raw)
-
-    try:
-        data = json.loads(raw)
-    except:
-        return
-
-    # Filtrar ID
-    if data.get("ID") != TARGET_ID:
-        return
+def mostrar(mensaje):
+    print("Mensaje recibido:", mensaje.payload.decode("utf-8", "replace").strip())
 
-    # Extraer datos reales del proyecto
-    t = data.get("Tiempo_UTC", time.time())
-    temp = float(data.get("Temp_C", 0))
-    hum = float(data.get("Humidity_Per", 0))
-    pres = float(data.get("Pressure_hPa", 0))
-    uvi = float(data.get("UVI", 0))
 
-    # Añadir al buffer
-    time_buf.append(t)
-    temp_buf.append(temp)
-    hum_buf.append(hum)
-    pres_buf.append(pres)
-    uvi_buf.append(uvi)
+def guardar(registros):
+    # Picos y valores imposibles a NaN antes de graficar (limpieza.py)
+    registro.agregar_varios([r for r in limpiador.limpiar_varios(registros) if not vacia(r)])
 
 
-# ----------------------------------------------------------
-# HILO MQTT
-# ----------------------------------------------------------
-def start_mqtt():
-    client = mqtt.Client()
-    client.on_connect = on_connect
-    client.on_message = on_message
-    client.connect(BROKER, 1883, 60)
-    client.loop_forever()
-
-# Lanzar MQTT en segundo plano
-threading.Thread(target=start_mqtt, daemon=True).start()
+nucleo = NucleoIngesta(decodificador)
+# JSON y, de los nodos en modo binario, tramas compactas
+nucleo.conectar(BROKER, 1883, [TOPIC, TOPIC_BINARIO])
+nucleo.consumidor(mostrar, crudo=True)
+# Se guardan todos los sensores, cada uno en su propia serie (un lock por lote)
+nucleo.consumidor(guardar, lotes=True)
+nucleo.iniciar()
 
 # ----------------------------------------------------------
 # GRAFICADO EN TIEMPO REAL
 # ----------------------------------------------------------
-plt.ion()
+# Blitting: el fondo (ejes, rejilla, leyenda) se dibuja una vez y se guarda;
+# en cada fotograma solo se restaura y se pintan encima las líneas. Solo se
+# dibuja si la versión del registro cambió (llegaron datos de TARGET_IDS) y
+# como mucho FPS veces por segundo; mientras, la ventana atiende eventos sin
+# gastar CPU. El redibujado completo queda para cuando los datos se salen de
+# la escala (o se redimensiona la ventana).
 fig, ax = plt.subplots()
 
-line_temp, = ax.plot([], [], label="Temperatura (°C)")
-line_hum,  = ax.plot([], [], label="Humedad (%)")
-line_pres, = ax.plot([], [], label="Presión (hPa)")
-line_uvi,  = ax.plot([], [], label="UVI")
+# Una línea por (sensor, variable); "animated" = fuera del fondo guardado
+lines = {}
+for sensor_id in TARGET_IDS:
+    for var, label in VARIABLES.items():
+        lines[(sensor_id, var)], = ax.plot([], [], label=f"{label} {sensor_id}", animated=True)
 
 ax.set_xlabel("Muestras (tiempo)")
-ax.set_title("Lecturas en tiempo real – ID A1")
+ax.set_title(f"Lecturas en tiempo real – ID {', '.join(TARGET_IDS)}")
+ax.set_xlim(0, MAX_POINTS - 1)
 ax.legend()
 
-# Loop principal
-while True:
-    if len(time_buf) > 0:
-        line_temp.set_data(range(len(temp_buf)), temp_buf)
-        line_hum.set_data(range(len(hum_buf)), hum_buf)
-        line_pres.set_data(range(len(pres_buf)), pres_buf)
-        line_uvi.set_data(range(len(uvi_buf)), uvi_buf)
-
-        ax.relim()
-        ax.autoscale_view()
-        plt.pause(0.5)
-
-    time.sleep(0.1)
+fondo = None
+
+
+def guardar_fondo(evento):
+    # Cada dibujado completo (inicio, escala nueva, redimensionar) renueva el fondo
+    global fondo
+    fondo = fig.canvas.copy_from_bbox(fig.bbox)
+
+
+fig.canvas.mpl_connect("draw_event", guardar_fondo)
+
+
+def actualizar_lineas():
+    """Copia (bajo el lock del registro) las últimas muestras y las pasa a
+    las líneas. Devuelve (mín, máx) de lo dibujado, o None si no hay datos."""
+    mn, mx = float("inf"), float("-inf")
+    for sensor_id in TARGET_IDS:
+        datos = registro.copia(sensor_id, MAX_POINTS)
+        if datos is None:
+            continue
+        _, columnas = datos
+        for var in VARIABLES:
+            y = columnas.get(var)
+            if y is None or not len(y):
+                continue
+            # Alineadas a la derecha: la última muestra siempre en x = MAX_POINTS - 1
+            lines[(sensor_id, var)].set_data(np.arange(MAX_POINTS - len(y), MAX_POINTS), y)
+            if not np.isnan(y).all():
+                mn = min(mn, float(np.nanmin(y)))
+                mx = max(mx, float(np.nanmax(y)))
+    return (mn, mx) if mn <= mx else None
+
+
+def fuera_de_escala(rango):
+    lo, hi = ax.get_ylim()
+    mn, mx = rango
+    # Se sale, o ocupa menos de un tercio del eje: escala nueva
+    return mn < lo or mx > hi or (mx - mn) < (hi - lo) / 3
+
+
+def reescalar(rango):
+    mn, mx = rango
+    margen = max((mx - mn) * 0.1, 1e-3 * max(abs(mn), abs(mx)), 0.5)
+    ax.set_ylim(mn - margen, mx + margen)
+
+
+def dibujar():
+    rango = actualizar_lineas()
+    if rango is not None and fuera_de_escala(rango):
+        reescalar(rango)
+        fondo_nuevo = True
+    else:
+        fondo_nuevo = fondo is None
+    if fondo_nuevo or not fig.canvas.supports_blit:
+        fig.canvas.draw()      # Dispara draw_event -> guardar_fondo()
+    fig.canvas.restore_region(fondo)
+    for linea in lines.values():
+        ax.draw_artist(linea)
+    fig.canvas.blit(fig.bbox)
+
+
+plt.show(block=False)
+fig.canvas.draw()
+periodo = 1 / FPS
+vista = None
+ids = tuple(TARGET_IDS)
+
+# Loop principal: redibuja solo si hay datos nuevos, a como mucho FPS
+while plt.fignum_exists(fig.number):
+    inicio = time.perf_counter()
+    version = registro.version_de(ids)
+    if version != vista:
+        vista = version
+        dibujar()
+    fig.canvas.flush_events()
+    resto = periodo - (time.perf_counter() - inicio)
+    if resto > 0:
+        fig.canvas.start_event_loop(resto)
@@ -0,0 +1,231 @@
+import json
+import os
+import threading
+from typing import NamedTuple
+import numpy as np
+from decodificador import como_lectura
+
+# ----------------------------------------------------------
+# MOTOR DE ALARMAS SOBRE EL FLUJO DE INGESTA
+# ----------------------------------------------------------
+# Reglas declarativas (alarmas.json) evaluadas en cada mensaje:
+#
+#   {"nombre": "temp_aviso", "campo": "Temp_C", "menor": 10, "mayor": 30,
+#    "nivel": "aviso", "histeresis": 0.5, "durante": 0, "sensor": "*"}
+#
+#  - tipo "umbral" (por defecto): se viola si valor > mayor o < menor
+#  - tipo "tasa": lo mismo sobre la variación por `por` segundos (60 = por
+#    minuto) entre dos muestras seguidas del sensor (p. ej. caída de presión)
+#  - durante: segundos seguidos en violación antes de disparar
+#  - histeresis: para despejarse el valor tiene que volver `histeresis`
+#    unidades dentro del rango (evita que la alarma parpadee en el borde)
+#  - sensor: "*" (todos), un ID o una lista de IDs
+#
+# Las reglas se indexan por campo y, la primera vez que aparece un
+# (sensor, campo), se resuelve la lista de reglas que le aplican junto con
+# su estado: cada mensaje solo recorre sus reglas, aunque haya miles. En los
+# lotes, un umbral en reposo se descarta con una comparación vectorizada.
+#
+# Solo se publican los cambios de estado, retenidos, en
+# <topic>/<ID>/<regla>: quien se suscriba ve el estado actual al conectar.
+
+RUTA_CONFIG = os.environ.get("ALARMAS_CONFIG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alarmas.json"))
+TOPIC_ALARMAS = "Enviromental Sensors Network/alarmas"
+NIVELES = ("aviso", "peligro")
+TIPOS = ("umbral", "tasa")
+
+
+class EventoAlarma(NamedTuple):
+    regla: str
+    ID: str
+    campo: str
+    nivel: str
+    activa: bool
+    valor: float
+    t: float
+
+    def como_json(self):
+        return json.dumps({"Regla": self.regla, "ID": self.ID, "Campo": self.campo, "Nivel": self.nivel,
+                           "Activa": self.activa, "Valor": round(self.valor, 3), "t": self.t})
+
+
+class Regla:
+    __slots__ = ("nombre", "campo", "sensores", "tipo", "mayor", "menor", "histeresis", "durante", "nivel", "por")
+
+    def __init__(self, nombre, campo, mayor=None, menor=None, tipo="umbral", nivel="aviso",
+                 histeresis=0.0, durante=0.0, sensor="*", por=60.0):
+        if tipo not in TIPOS:
+            raise ValueError(f"Regla {nombre}: tipo desconocido {tipo} (válidos: {', '.join(TIPOS)})")
+        if nivel not in NIVELES:
+            raise ValueError(f"Regla {nombre}: nivel desconocido {nivel} (válidos: {', '.join(NIVELES)})")
+        if mayor is None and menor is None:
+            raise ValueError(f"Regla {nombre}: hace falta 'mayor' y/o 'menor'")
+        self.nombre = nombre
+        self.campo = campo
+        self.sensores = None if sensor == "*" else frozenset([sensor] if isinstance(sensor, str) else sensor)
+        self.tipo = tipo
+        self.mayor = float("inf") if mayor is None else float(mayor)
+        self.menor = float("-inf") if menor is None else float(menor)
+        self.histeresis = float(histeresis)
+        self.durante = float(durante)
+        self.nivel = nivel
+        self.por = float(por)
+
+    def aplica(self, sensor_id):
+        return self.sensores is None or sensor_id in self.sensores
+
+    def violada(self, x):
+        return x > self.mayor or x < self.menor
+
+    def despejada(self, x):
+        return self.menor + self.histeresis <= x <= self.mayor - self.histeresis
+
+
+class _Estado:
+    """Estado de una regla para un sensor."""
+    __slots__ = ("activa", "desde", "previo_v", "previo_t")
+
+    def __init__(self):
+        self.activa = False
+        self.desde = None      # Inicio de la violación en curso (para "durante")
+        self.previo_v = None   # Última muestra (para "tasa")
+        self.previo_t = None
+
+
+class MotorAlarmas:
+    def __init__(self, reglas, publicar=None, topic=TOPIC_ALARMAS):
+        """`reglas`: lista de Regla o de dicts como los de alarmas.json.
+        `publicar(topic, payload)`: opcional, se llama en cada cambio de estado."""
+        self.reglas = [r if isinstance(r, Regla) else Regla(**r) for r in reglas]
+        nombres = [r.nombre for r in self.reglas]
+        if len(set(nombres)) != len(nombres):
+            raise ValueError("Hay nombres de regla repetidos")
+        self.publicar = publicar
+        self.topic = topic
+        self._por_campo = {}
+        for r in self.reglas:
+            self._por_campo.setdefault(r.campo, []).append(r)
+        self._indice = {}      # (sensor, campo) -> [(Regla, _Estado)] de las reglas que le aplican
+        self.lock = threading.Lock()
+        # Contadores
+        self.evaluaciones = 0
+        self.eventos = 0
+
+    @classmethod
+    def desde_fichero(cls, ruta=RUTA_CONFIG, publicar=None):
+        with open(ruta, encoding="utf-8") as f:
+            config = json.load(f)
+        return cls(config["reglas"], publicar, config.get("topic", TOPIC_ALARMAS))
+
+    def _reglas_de(self, sensor_id, campo):
+        pares = self._indice.get((sensor_id, campo))
+        if pares is None:
+            pares = self._indice[(sensor_id, campo)] = [
+                (r, _Estado()) for r in self._por_campo.get(campo, ()) if r.aplica(sensor_id)]
+        return pares
+
+    # ---------- EVALUACIÓN ----------
+    def evaluar(self, registro):
+        """Evalúa una Lectura (o un LoteLecturas) y devuelve los cambios de estado."""
+        return self.evaluar_varios([registro])
+
+    def evaluar_varios(self, registros):
+        eventos = []
+        with self.lock:
+            for registro in registros:
+                if hasattr(registro, "columnas"):
+                    self._evaluar_lote(registro, eventos)
+                    continue
+                lectura = como_lectura(registro)
+                if lectura is None:
+                    continue
+                t = lectura.hora()
+                for campo, v in lectura.medidas():
+                    for regla, estado in self._reglas_de(lectura.ID, campo):
+                        self._paso(regla, estado, lectura.ID, v, t, eventos)
+                        self.evaluaciones += 1
+        self._avisar(eventos)
+        return eventos
+
+    def _evaluar_lote(self, lote, eventos):
+        # Llamar con el lock tomado
+        t_lote = lote.t_corregido()
+        for campo, v in lote.columnas.items():
+            pares = self._reglas_de(lote.ID, campo)
+            if not pares:
+                continue
+            validos = ~np.isnan(v)
+            v, t = v[validos], t_lote[validos]
+            if not len(v):
+                continue
+            vs, ts = None, None
+            for regla, estado in pares:
+                ini = 0
+                if regla.tipo == "umbral" and estado.desde is None:
+                    # Atajo vectorizado: nada que cambie en todo el lote -> no se recorre
+                    if estado.activa:
+                        cambia = (v >= regla.menor + regla.histeresis) & (v <= regla.mayor - regla.histeresis)
+                    else:
+                        cambia = (v > regla.mayor) | (v < regla.menor)
+                    if not cambia.any():
+                        self.evaluaciones += len(v)
+                        continue
+                    ini = int(cambia.argmax())
+                if vs is None:
+                    vs, ts = v.tolist(), t.tolist()
+                for i in range(ini, len(vs)):
+                    self._paso(regla, estado, lote.ID, vs[i], ts[i], eventos)
+                self.evaluaciones += len(vs)
+
+    def _paso(self, regla, estado, sensor_id, v, t, eventos):
+        if regla.tipo == "tasa":
+            pv, pt = estado.previo_v, estado.previo_t
+            estado.previo_v, estado.previo_t = v, t
+            if pv is None or t <= pt:
+                return
+            x = (v - pv) / (t - pt) * regla.por
+        else:
+            x = v
+        if estado.activa:
+            if regla.despejada(x):
+                estado.activa = False
+                eventos.append(EventoAlarma(regla.nombre, sensor_id, regla.campo, regla.nivel, False, x, t))
+        elif regla.violada(x):
+            if estado.desde is None:
+                estado.desde = t
+            if t - estado.desde >= regla.durante:
+                estado.activa = True
+                estado.desde = None
+                eventos.append(EventoAlarma(regla.nombre, sensor_id, regla.campo, regla.nivel, True, x, t))
+        else:
+            estado.desde = None
+
+    def _avisar(self, eventos):
+        if not eventos:
+            return
+        self.eventos += len(eventos)
+        if self.publicar is None:
+            return
+        for e in eventos:
+            try:
+                self.publicar(f"{self.topic}/{e.ID}/{e.regla}", e.como_json())
+            except Exception as ex:
+                print(f"Error publicando alarma {e.regla}: {ex}")
+
+    # ---------- ESTADO ----------
+    def activas(self):
+        """[(sensor, regla, nivel)] de las alarmas activas, las de peligro primero."""
+        with self.lock:
+            r = [(sensor_id, regla.nombre, regla.nivel)
+                 for (sensor_id, _), pares in self._indice.items()
+                 for regla, estado in pares if estado.activa]
+        return sorted(r, key=lambda a: (a[2] != "peligro", a[0], a[1]))
+
+    def estadisticas(self):
+        return {
+            "reglas": len(self.reglas),
+            "series": len(self._indice),
+            "evaluaciones": self.evaluaciones,
+            "eventos": self.eventos,
+            "activas": len(self.activas()),
+        }
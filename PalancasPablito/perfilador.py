@@ -0,0 +1,241 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from metricas import METRICAS
+
+# ----------------------------------------------------------
+# PERFILADO DEL RENDER DEL DASHBOARD (opcional)
+# ----------------------------------------------------------
+# Dos herramientas, las dos apagadas salvo que se pidan:
+#  - Perfilador: tiempo de cada sección de una ejecución del script
+#    (copia de datos, métricas, cada gráfica, log...). Cada ejecución se
+#    guarda en un buffer circular de HISTORIAL entradas y resumen() da
+#    media, p50, p95 y máximo por sección. Se marca con `marca(nombre)`
+#    (vuelta de cronómetro: el tiempo desde la marca anterior) o con
+#    `with seccion(nombre)`. Apagado, cada marca es un if.
+#  - Muestreador: hilo que cada `intervalo` lee sys._current_frames() y
+#    cuenta las pilas (solo las que pasan por `archivo`, p. ej. appV3.py).
+#    plegadas() las da en formato "f1;f2;f3 N", el que leen flamegraph.pl,
+#    speedscope o inferno.
+#
+# Uso:
+#   PERFILAR_DASHBOARD=1 streamlit run appV3.py
+#   python perfilador.py pilas.folded   # resumen de un volcado: funciones más vistas
+
+HISTORIAL = 200          # Ejecuciones guardadas
+INTERVALO = 0.005        # Segundos entre muestras del muestreador
+PROFUNDIDAD_MAX = 128    # Marcos por pila (se corta por la raíz)
+
+SECCIONES = METRICAS.histograma("dashboard_seccion_segundos", "Duración de cada sección del render",
+                                ("seccion",), limites=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                                                       0.25, 0.5, 1.0, 2.5))
+
+
+class _Nada:
+    """Contexto vacío (sección con el perfilador apagado)."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NADA = _Nada()
+
+
+class Perfilador:
+    def __init__(self, activo=True, historial=HISTORIAL):
+        self.activo = activo
+        self.ejecuciones = deque(maxlen=historial)   # [{sección: s, "total": s}]
+        # Cada sesión de Streamlit ejecuta el script en su hilo: la ejecución
+        # en curso es por hilo y el buffer, compartido
+        self._hilo = threading.local()
+        self.en_curso = set()          # Hilos a mitad de una ejecución (para el Muestreador)
+        self.lock = threading.Lock()
+
+    # ---------- UNA EJECUCIÓN ----------
+    def empezar(self):
+        if not self.activo:
+            return
+        h = self._hilo
+        h.actual = {}
+        h.t0 = h.ultima = time.perf_counter()
+        self.en_curso.add(threading.get_ident())
+
+    def marca(self, nombre):
+        """Atribuye a `nombre` el tiempo desde la marca anterior (o el inicio)."""
+        h = self._hilo
+        if getattr(h, "actual", None) is None:
+            return
+        ahora = time.perf_counter()
+        h.actual[nombre] = h.actual.get(nombre, 0.0) + ahora - h.ultima
+        h.ultima = ahora
+
+    def seccion(self, nombre):
+        """with perfil.seccion("gráfica Temp_C"): ..."""
+        if getattr(self._hilo, "actual", None) is None:
+            return _NADA
+        return self._medir(nombre)
+
+    @contextmanager
+    def _medir(self, nombre):
+        h = self._hilo
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ahora = time.perf_counter()
+            h.actual[nombre] = h.actual.get(nombre, 0.0) + ahora - t0
+            h.ultima = ahora   # La siguiente marca no vuelve a contar esta sección
+
+    def terminar(self):
+        h = self._hilo
+        ejecucion = getattr(h, "actual", None)
+        if ejecucion is None:
+            return None
+        h.actual = None
+        self.en_curso.discard(threading.get_ident())
+        ejecucion["total"] = time.perf_counter() - h.t0
+        for nombre, s in ejecucion.items():
+            SECCIONES.de(nombre).observar(s)
+        with self.lock:
+            self.ejecuciones.append(ejecucion)
+        return ejecucion
+
+    # ---------- RESUMEN ----------
+    def resumen(self):
+        """{sección: {media_ms, p50_ms, p95_ms, max_ms, pct}} de las ejecuciones guardadas,
+        de la más cara a la más barata (pct: parte del total medio)."""
+        with self.lock:
+            ejecuciones = list(self.ejecuciones)
+        if not ejecuciones:
+            return {}
+        por_seccion = {}
+        for e in ejecuciones:
+            for nombre, s in e.items():
+                por_seccion.setdefault(nombre, []).append(s)
+        total_medio = sum(e["total"] for e in ejecuciones) / len(ejecuciones)
+        r = {}
+        for nombre, tiempos in por_seccion.items():
+            tiempos.sort()
+            media = sum(tiempos) / len(ejecuciones)   # Las que no pasaron por la sección cuentan 0
+            r[nombre] = {
+                "media_ms": media * 1000,
+                "p50_ms": tiempos[len(tiempos) // 2] * 1000,
+                "p95_ms": tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))] * 1000,
+                "max_ms": tiempos[-1] * 1000,
+                "pct": 100 * media / total_medio if total_medio else 0.0,
+                "ejecuciones": len(tiempos),
+            }
+        return dict(sorted(r.items(), key=lambda kv: -kv[1]["media_ms"]))
+
+
+# ---------- MUESTREADOR DE PILAS ----------
+def _nombre_marco(codigo):
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+
+class Muestreador:
+    def __init__(self, intervalo=INTERVALO, archivo=None, hilos=None):
+        """`archivo`: solo se cuentan las pilas que pasan por un fichero con
+        este nombre. `hilos`: conjunto (vivo) de hilos a muestrear, p. ej.
+        Perfilador.en_curso para no contar la espera entre ejecuciones.
+        Sin filtros, todos los hilos menos el propio muestreador."""
+        self.intervalo = intervalo
+        self.archivo = archivo
+        self.hilos = hilos
+        self.pilas = Counter()     # tupla de códigos (raíz -> hoja) -> muestras
+        self.muestras = 0
+        self.hasta = 0.0
+        self._hilo = None
+        self._parar = threading.Event()
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self, duracion=None):
+        """Empieza a muestrear (durante `duracion` s, o hasta detener())."""
+        if self.activo:
+            return False
+        self.pilas.clear()
+        self.muestras = 0
+        self.hasta = time.monotonic() + duracion if duracion else float("inf")
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._muestrear, daemon=True, name="muestreador")
+        self._hilo.start()
+        return True
+
+    def detener(self):
+        self._parar.set()
+        if self._hilo is not None:
+            self._hilo.join()
+
+    def _muestrear(self):
+        propio = threading.get_ident()
+        while not self._parar.wait(self.intervalo) and time.monotonic() < self.hasta:
+            for ident, marco in sys._current_frames().items():
+                if ident == propio or (self.hilos is not None and ident not in self.hilos):
+                    continue
+                codigos = []
+                ver = self.archivo is None
+                while marco is not None and len(codigos) < PROFUNDIDAD_MAX:
+                    codigo = marco.f_code
+                    codigos.append(codigo)
+                    if not ver and os.path.basename(codigo.co_filename) == self.archivo:
+                        ver = True
+                    marco = marco.f_back
+                if ver:
+                    self.pilas[tuple(reversed(codigos))] += 1
+            self.muestras += 1
+
+    def plegadas(self):
+        """Pilas en formato plegado ("raíz;...;hoja N"), de la más vista a la menos."""
+        nombres = {}
+        lineas = []
+        for pila, n in sorted(list(self.pilas.items()), key=lambda kv: -kv[1]):
+            partes = []
+            for codigo in pila:
+                nombre = nombres.get(codigo)
+                if nombre is None:
+                    nombre = nombres[codigo] = _nombre_marco(codigo).replace(";", ":")
+                partes.append(nombre)
+            lineas.append(f"{';'.join(partes)} {n}")
+        return "\n".join(lineas) + ("\n" if lineas else "")
+
+    def volcar(self, ruta):
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write(self.plegadas())
+        return ruta
+
+
+def funciones_mas_vistas(plegadas, n=20):
+    """[(función, % de muestras en las que está en la pila, % como hoja)]."""
+    total = 0
+    inclusivo, propio = Counter(), Counter()
+    for linea in plegadas.splitlines():
+        pila, _, cuenta = linea.rpartition(" ")
+        if not pila:
+            continue
+        cuenta = int(cuenta)
+        total += cuenta
+        marcos = pila.split(";")
+        for marco in set(marcos):
+            inclusivo[marco] += cuenta
+        propio[marcos[-1]] += cuenta
+    if not total:
+        return []
+    return [(f, 100 * c / total, 100 * propio[f] / total) for f, c in inclusivo.most_common(n)]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python perfilador.py pilas.folded")
+        raise SystemExit(1)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        for funcion, incl, hoja in funciones_mas_vistas(f.read()):
+            print(f"{incl:6.1f}% {hoja:6.1f}%  {funcion}")
@@ -0,0 +1,115 @@
+import struct
+
+# ----------------------------------------------------------
+# PAQUETES MQTT 3.1.1 (lo justo para broker_local e ingesta_async)
+# ----------------------------------------------------------
+# Funciones puras bytes <-> paquetes: sin sockets ni hilos, para que el
+# broker de pruebas y el cliente asyncio compartan exactamente el mismo
+# código de (de)serialización.
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+_U16 = struct.Struct(">H")
+
+
+def longitud_restante(n):
+    """Entero -> bytes de "remaining length" (varint de 7 bits)."""
+    out = bytearray()
+    while True:
+        n, byte = divmod(n, 128)
+        out.append(byte | (0x80 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def paquete(tipo, flags, cuerpo=b""):
+    return bytes([(tipo << 4) | flags]) + longitud_restante(len(cuerpo)) + cuerpo
+
+
+def cadena(s):
+    b = s.encode("utf-8") if isinstance(s, str) else s
+    return _U16.pack(len(b)) + b
+
+
+def leer_cadena(cuerpo, pos):
+    """(bytes, nueva posición) de la cadena con longitud que empieza en `pos`."""
+    (n,) = _U16.unpack_from(cuerpo, pos)
+    return cuerpo[pos + 2:pos + 2 + n], pos + 2 + n
+
+
+def leer_paquete(buf, ini=0):
+    """(tipo, flags, cuerpo, fin) del paquete que empieza en buf[ini], o None si está incompleto."""
+    if len(buf) - ini < 2:
+        return None
+    mult, n, i = 1, 0, ini + 1
+    while True:
+        if i >= len(buf):
+            return None
+        byte = buf[i]
+        n += (byte & 0x7F) * mult
+        i += 1
+        if not byte & 0x80:
+            break
+        mult *= 128
+        if mult > 128 ** 3:
+            raise ValueError("Remaining length inválido")
+    if len(buf) < i + n:
+        return None
+    return buf[ini] >> 4, buf[ini] & 0x0F, bytes(buf[i:i + n]), i + n
+
+
+# ---------- PUBLISH ----------
+def trama_publish(topic, payload, qos=0, retain=False, packet_id=None):
+    cuerpo = cadena(topic) + (_U16.pack(packet_id) if qos else b"") + payload
+    return paquete(PUBLISH, (qos << 1) | int(retain), cuerpo)
+
+
+def leer_publish(flags, cuerpo):
+    """Cuerpo de un PUBLISH -> (topic, payload, qos, retain, packet_id en bytes o None)."""
+    qos = (flags >> 1) & 0x03
+    (n,) = _U16.unpack_from(cuerpo, 0)
+    topic = cuerpo[2:2 + n].decode("utf-8")
+    pos = 2 + n
+    packet_id = None
+    if qos:
+        packet_id = cuerpo[pos:pos + 2]
+        pos += 2
+    return topic, cuerpo[pos:], qos, bool(flags & 0x01), packet_id
+
+
+# ---------- LADO CLIENTE ----------
+def trama_connect(client_id, keepalive=60, limpia=True):
+    flags = 0x02 if limpia else 0x00
+    return paquete(CONNECT, 0, cadena("MQTT") + bytes([4, flags]) + _U16.pack(keepalive) + cadena(client_id))
+
+
+def trama_subscribe(packet_id, filtros):
+    """filtros: lista de (filtro, qos)."""
+    cuerpo = _U16.pack(packet_id) + b"".join(cadena(f) + bytes([q]) for f, q in filtros)
+    return paquete(SUBSCRIBE, 0x02, cuerpo)
+
+
+PINGREQ_BYTES = paquete(PINGREQ, 0)
+PINGRESP_BYTES = paquete(PINGRESP, 0)
+DISCONNECT_BYTES = paquete(DISCONNECT, 0)
+
+
+# ---------- TOPICS ----------
+def coincide(filtro, topic):
+    """¿`topic` encaja con el filtro de suscripción (comodines + y #)?"""
+    if filtro == topic:
+        return True
+    f = filtro.split("/")
+    t = topic.split("/")
+    # Los topics que empiezan por $ no casan con comodines en el primer nivel
+    if t[0].startswith("$") and f[0] in ("+", "#"):
+        return False
+    for i, parte in enumerate(f):
+        if parte == "#":
+            return True
+        if i >= len(t):
+            return False
+        if parte != "+" and parte != t[i]:
+            return False
+    return len(f) == len(t)
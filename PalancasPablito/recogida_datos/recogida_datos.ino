@@ -52,6 +52,49 @@ const int mqtt_port = 1883;
 const char* TOPIC_TIME = "TimeNow";
 const char* TOPIC_SENSORS = "Enviromental Sensors Network";
 
+// ===============================
+// FORMATO DE PUBLICACIÓN
+// ===============================
+// 0: JSON (por defecto, compatible con todos los consumidores)
+// 1: trama binaria v1 de 40 bytes en TOPIC_SENSORS_BIN (ver codec_binario.py)
+#define FORMATO_BINARIO 0
+const char* TOPIC_SENSORS_BIN = "Enviromental Sensors Network/bin";
+
+// Con FORMATO_BINARIO 1 y MUESTRAS_POR_LOTE > 1 se muestrea cada
+// PERIODO_MUESTREO_MS y se publica un lote v2 con todas las muestras
+// juntas (un solo mensaje MQTT cada MUESTRAS_POR_LOTE muestras).
+#define MUESTRAS_POR_LOTE 1
+#define PERIODO_MUESTREO_MS 100
+
+struct __attribute__((packed)) TramaV1 {
+  uint8_t magia;        // 0xA5
+  uint8_t version;      // 1
+  uint8_t mascara;      // bit i = campo i presente
+  uint8_t reservado;
+  char id[8];           // ID con relleno de \0
+  uint32_t epoch;       // Hora UTC en segundos desde 1970 (0 = sin hora)
+  float valores[6];     // Temp_C, Humidity_Per, Pressure_hPa, UVI, CO_ppm, CO2_ppm
+};
+
+struct __attribute__((packed)) CabeceraLote {
+  uint8_t magia;        // 0xA5
+  uint8_t version;      // 2
+  uint8_t mascara;
+  uint8_t reservado;
+  char id[8];
+  uint32_t epoch;       // Hora UTC de la primera muestra
+  uint16_t n;           // Nº de muestras; siguen n x uint16 (ms) y una columna float por campo
+};
+
+#if MUESTRAS_POR_LOTE > 1
+uint16_t loteDt[MUESTRAS_POR_LOTE];
+float loteValores[4][MUESTRAS_POR_LOTE];   // Temp, Hum, Pres, UVI
+uint8_t loteTrama[sizeof(CabeceraLote) + MUESTRAS_POR_LOTE * (2 + 4 * 4)];
+int loteN = 0;
+unsigned long loteInicio = 0;
+uint32_t loteEpoch = 0;
+#endif
+
 WiFiClient espClient;
 PubSubClient client(espClient);
 
@@ -104,6 +147,19 @@ void callback(char* topic, byte* payload, unsigned int length) {
   }
 }
 
+// ===============================
+// "AAAA-DDD-HH:MM:SS" (TimeNow) -> epoch
+// ===============================
+uint32_t utcAEpoch(const String& utc) {
+  int y, doy, h, m, s;
+  if (sscanf(utc.c_str(), "%d-%d-%d:%d:%d", &y, &doy, &h, &m, &s) != 5) return 0;
+  long dias = (y - 1970) * 365L
+            + ((y - 1) / 4 - (y - 1) / 100 + (y - 1) / 400)
+            - (1969 / 4 - 1969 / 100 + 1969 / 400)
+            + (doy - 1);
+  return (uint32_t)(dias * 86400L + h * 3600L + m * 60L + s);
+}
+
 // ===============================
 // RECONNECT MQTT
 // ===============================
@@ -147,7 +203,11 @@ void setup() {
   
   // ¡AUMENTAMOS EL TAMAÑO DEL BUFFER MQTT! 
   // Por defecto es 256 bytes, lo subimos a 512 para que quepa el JSON completo con la presión.
-  client.setBufferSize(512); 
+#if FORMATO_BINARIO && MUESTRAS_POR_LOTE > 1
+  client.setBufferSize(sizeof(loteTrama) + 64);   // Cabecera MQTT + topic
+#else
+  client.setBufferSize(512);
+#endif 
 
   // Inicialización de BME280
   Wire.begin(BME_SDA, BME_SCL); 
@@ -217,6 +277,57 @@ void loop() {
   // PUBLICAR DATOS MQTT (CORREGIDO)
   // ===============================
 
+#if FORMATO_BINARIO && MUESTRAS_POR_LOTE > 1
+  // Acumular la muestra; solo se publica cuando el lote está lleno
+  if (loteN == 0) {
+    loteInicio = millis();
+    loteEpoch = utcAEpoch(lastUTC);
+  }
+  loteDt[loteN] = (uint16_t)(millis() - loteInicio);
+  loteValores[0][loteN] = temp;
+  loteValores[1][loteN] = hum;
+  loteValores[2][loteN] = pres;
+  loteValores[3][loteN] = uvi;
+  loteN++;
+  if (loteN < MUESTRAS_POR_LOTE) {
+    delay(PERIODO_MUESTREO_MS);
+    return;
+  }
+
+  CabeceraLote cab = {0xA5, 2, 0x0F, 0};   // Presentes: Temp, Hum, Pres, UVI
+  strncpy(cab.id, "A1", sizeof(cab.id));
+  cab.epoch = loteEpoch;
+  cab.n = loteN;
+  size_t len = 0;
+  memcpy(loteTrama, &cab, sizeof(cab));                     len += sizeof(cab);
+  memcpy(loteTrama + len, loteDt, loteN * sizeof(uint16_t)); len += loteN * sizeof(uint16_t);
+  for (int c = 0; c < 4; c++) {
+    memcpy(loteTrama + len, loteValores[c], loteN * sizeof(float));
+    len += loteN * sizeof(float);
+  }
+  loteN = 0;
+
+  bool ok = client.publish(TOPIC_SENSORS_BIN, loteTrama, len);
+  Serial.print("Lote binario: ");
+  Serial.print(len);
+  Serial.println(" bytes");
+#elif FORMATO_BINARIO
+  // Trama compacta: 40 bytes en vez de ~130 de JSON
+  TramaV1 trama = {0xA5, 1, 0x0F, 0};   // Presentes: Temp, Hum, Pres, UVI
+  strncpy(trama.id, "A1", sizeof(trama.id));
+  trama.epoch = utcAEpoch(lastUTC);
+  trama.valores[0] = temp;
+  trama.valores[1] = hum;
+  trama.valores[2] = pres;
+  trama.valores[3] = uvi;
+  trama.valores[4] = NAN;
+  trama.valores[5] = NAN;
+
+  bool ok = client.publish(TOPIC_SENSORS_BIN, (const uint8_t*)&trama, sizeof(trama));
+  Serial.print("Trama binaria: ");
+  Serial.print(sizeof(trama));
+  Serial.println(" bytes");
+#else
   // 1. Aumentamos el tamaño del documento JSON
   StaticJsonDocument<512> doc;
 
@@ -242,8 +353,13 @@ void loop() {
   Serial.print(strlen(out)); // Útil para depurar el tamaño real
   Serial.println(" bytes");
   Serial.println(out);
+#endif
   Serial.println(ok ? "MQTT OK" : "MQTT FAIL (Buffer overflow?)");
   Serial.println("----------------------");
 
+#if FORMATO_BINARIO && MUESTRAS_POR_LOTE > 1
+  delay(PERIODO_MUESTREO_MS);
+#else
   delay(2000); 
+#endif
 }
\ No newline at end of file
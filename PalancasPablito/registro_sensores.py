@@ -0,0 +1,189 @@
+import threading
+from buffer_columnar import BufferColumnar
+from decodificador import LoteLecturas, como_lectura
+
+# ----------------------------------------------------------
+# REGISTRO DE SENSORES (una serie temporal por ID)
+# ----------------------------------------------------------
+# Cada nodo de la red (A1, A2_DEMO, B2, ...) tiene su propio
+# BufferColumnar. La memoria está limitada por un presupuesto GLOBAL de
+# muestras que se reparte entre los sensores activos: cuando aparece un
+# sensor nuevo se redimensionan los buffers para no pasarse del total.
+
+PRESUPUESTO_MUESTRAS = 1_000_000   # Muestras totales entre todos los sensores
+MIN_MUESTRAS_SENSOR = 1_000        # Por debajo de esto se expulsa al sensor más inactivo
+
+
+class RegistroSensores:
+    def __init__(self, presupuesto=PRESUPUESTO_MUESTRAS, minimo=MIN_MUESTRAS_SENSOR, lock=None):
+        """`lock`: opcional, p. ej. un metricas.LockMedido para medir la espera."""
+        self.presupuesto = presupuesto
+        self.minimo = minimo
+        self.series = {}          # ID -> BufferColumnar
+        self.ultima_vez = {}      # ID -> última llegada (para expulsar inactivos)
+        self.lock = lock if lock is not None else threading.Lock()
+        # Contadores de versión para refresco "push": global y por sensor
+        self.version = 0
+        self.versiones = {}       # ID -> nº de muestras recibidas
+        self.cambio = threading.Condition(self.lock)
+
+    def ids(self):
+        with self.lock:
+            return sorted(self.series)
+
+    def _capacidad_por_sensor(self, n_sensores):
+        # Se reparte en potencias de 2 (presupuesto/1, /2, /4...): los buffers
+        # solo se redimensionan cuando el nº de sensores cruza una potencia de
+        # 2, no con cada sensor nuevo (con miles de IDs era O(n²) en copias).
+        huecos = 1 << max(0, n_sensores - 1).bit_length()
+        return max(self.minimo, self.presupuesto // huecos)
+
+    def _nuevo_sensor(self, sensor_id, campos):
+        # Si no cabe otro sensor con el mínimo, se expulsa al más inactivo
+        if (len(self.series) + 1) * self.minimo > self.presupuesto:
+            viejo = min(self.ultima_vez, key=self.ultima_vez.get)
+            del self.series[viejo]
+            del self.ultima_vez[viejo]
+
+        capacidad = self._capacidad_por_sensor(len(self.series) + 1)
+        if capacidad != self._capacidad_por_sensor(len(self.series)):
+            for buf in self.series.values():
+                buf.redimensionar(capacidad)
+        buf = BufferColumnar(capacidad, campos)
+        self.series[sensor_id] = buf
+        return buf
+
+    def agregar(self, registro):
+        """Guarda una Lectura (o un dict con "ID") en la serie de su ID."""
+        if isinstance(registro, LoteLecturas):
+            return self.agregar_lote(registro)
+        lectura = como_lectura(registro)
+        if lectura is None:
+            return
+        with self.lock:
+            self._agregar(lectura)
+            self._notificar(lectura.ID)
+
+    def agregar_varios(self, registros):
+        """Varias Lecturas/lotes tomando el lock UNA vez (ingesta por lotes)."""
+        with self.lock:
+            for registro in registros:
+                if isinstance(registro, LoteLecturas):
+                    self._agregar_lote(registro)
+                else:
+                    registro = como_lectura(registro)
+                    if registro is None:
+                        continue
+                    self._agregar(registro)
+                self.versiones[registro.ID] = self.versiones.get(registro.ID, 0) + 1
+            self._notificar()
+
+    def _agregar(self, lectura):
+        # Llamar con el lock tomado
+        sensor_id = lectura.ID
+        t = lectura.hora()
+        medidas = dict(lectura.medidas())
+        buf = self.series.get(sensor_id)
+        if buf is None:
+            buf = self._nuevo_sensor(sensor_id, tuple(medidas))
+        else:
+            for c in medidas:
+                buf.agregar_campo(c)
+        buf.agregar(t, medidas)
+        self.ultima_vez[sensor_id] = t
+
+    def agregar_lote(self, lote):
+        """Guarda un LoteLecturas (N muestras de un sensor) con una sola escritura."""
+        if len(lote) == 0:
+            return
+        with self.lock:
+            self._agregar_lote(lote)
+            self._notificar(lote.ID)
+
+    def _agregar_lote(self, lote):
+        # Llamar con el lock tomado
+        if len(lote) == 0:
+            return
+        buf = self.series.get(lote.ID)
+        if buf is None:
+            buf = self._nuevo_sensor(lote.ID, tuple(lote.columnas))
+        else:
+            for c in lote.columnas:
+                buf.agregar_campo(c)
+        t = lote.t_corregido()
+        buf.agregar_lote(t, lote.columnas)
+        self.ultima_vez[lote.ID] = float(t[-1])
+
+    def _notificar(self, sensor_id=None):
+        # Llamar con el lock tomado
+        self.version += 1
+        if sensor_id is not None:
+            self.versiones[sensor_id] = self.versiones.get(sensor_id, 0) + 1
+        self.cambio.notify_all()
+
+    def notificar(self, sensor_id=None):
+        """Marca un cambio que no pasa por agregar() (p. ej. solo el log)."""
+        with self.lock:
+            self._notificar(sensor_id)
+
+    def version_de(self, ids=None):
+        """Versión global (ids=None) o tupla de versiones de los sensores dados."""
+        with self.lock:
+            return self._version_de(ids)
+
+    def _version_de(self, ids):
+        if ids is None:
+            return self.version
+        return tuple(self.versiones.get(i, 0) for i in ids)
+
+    def esperar_cambio(self, ids, vista, timeout=None):
+        """Bloquea hasta que la versión de `ids` sea distinta de `vista`.
+
+        Devuelve True si hubo cambio y False si venció el timeout.
+        """
+        with self.cambio:
+            return self.cambio.wait_for(lambda: self._version_de(ids) != vista, timeout)
+
+    def serie(self, sensor_id):
+        """Buffer de un sensor (O(1)), o None si no existe."""
+        return self.series.get(sensor_id)
+
+    def dataframe(self, sensor_id, n=None):
+        """Copia de las últimas n muestras del sensor como DataFrame (o None)."""
+        with self.lock:
+            buf = self.series.get(sensor_id)
+            if buf is None or len(buf) == 0:
+                return None
+            return buf.dataframe(n)
+
+    def copia(self, sensor_id, n=None):
+        """(tiempo, {campo: array}) con copia de las últimas n muestras, tomada
+        bajo el lock (o None). Para dibujar sin pasar por pandas."""
+        with self.lock:
+            buf = self.series.get(sensor_id)
+            if buf is None or len(buf) == 0:
+                return None
+            t, cols = buf.ultimos(n)
+            return t.copy(), {c: col.copy() for c, col in cols.items()}
+
+    def nuevas(self, sensor_id, vistas=None, n=None):
+        """(cursor, tiempo, {campo: array}) con copia de las muestras escritas
+        después del cursor `vistas` (como mucho las n últimas), o None.
+        El cursor es (generación, escritas) del buffer: el `vistas` de la
+        próxima vez. Si la generación cambia, el buffer se ha recreado y se
+        devuelve todo lo que guarda."""
+        with self.lock:
+            buf = self.series.get(sensor_id)
+            if buf is None:
+                return None
+            desde = vistas[1] if vistas is not None and vistas[0] == buf.generacion else 0
+            k = min(max(buf.escritas - desde, 0), len(buf))
+            if n is not None:
+                k = min(k, n)
+            t, cols = buf.ultimos(k)
+            return (buf.generacion, buf.escritas), t.copy(), {c: col.copy() for c, col in cols.items()}
+
+    def ultimo(self, sensor_id):
+        with self.lock:
+            buf = self.series.get(sensor_id)
+            return buf.ultimo() if buf is not None else None
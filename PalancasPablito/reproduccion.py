@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import time
+from typing import NamedTuple
+import pandas as pd
+from decodificador import Decodificador, LoteLecturas, CAMPOS_ESQUEMA
+from grabador import leer_capturas, EXTENSION, BROKER, TOPIC
+from ingesta_async import NucleoIngesta
+from registro_sensores import RegistroSensores
+from limpieza import Limpiador, vacia
+from estadisticas_vivo import EstadisticasVivo
+from motor_alarmas import MotorAlarmas
+
+# ----------------------------------------------------------
+# REPRODUCCIÓN DETERMINISTA DE TRÁFICO CAPTURADO
+# ----------------------------------------------------------
+# Fuentes:
+#  - capturas de grabador.py (.cap.gz o directorios): payload crudo + hora
+#  - el CSV que exporta el dashboard (received_at, ID y un campo por columna;
+#    de las ventanas de histórico se toma la media de cada cubeta)
+# Ritmo: velocidad 1 = tiempo real, N = N veces más rápido, 0 = sin esperas.
+# Los tiempos entre mensajes se respetan respecto al PRIMER mensaje (no se
+# acumula el retraso de cada sleep); lo que va tarde se entrega en lote.
+# Destinos:
+#  - "broker": se publica por MQTT (para el dashboard, el demonio...)
+#  - "tuberia": sin red, por el mismo camino que el dashboard (decodificar,
+#    limpiar, registro, estadísticas y alarmas) con la hora ORIGINAL de
+#    cada mensaje: dos reproducciones dan exactamente el mismo resultado.
+#
+# Uso:
+#   python reproduccion.py capturas/ --velocidad 10
+#   python reproduccion.py mis_datos_sensor.csv --destino tuberia --velocidad 0
+
+LOTE_MAX = 500   # Mensajes que se entregan de una vez cuando van tarde
+
+
+class Evento(NamedTuple):
+    t: float         # Hora original de recepción (epoch s)
+    topic: str
+    payload: bytes
+
+
+# ---------- FUENTES ----------
+def desde_capturas(rutas):
+    for t, topic, payload in leer_capturas(rutas):
+        yield Evento(t, topic, payload)
+
+
+def desde_csv(ruta, topic=TOPIC):
+    """Filas del CSV del dashboard -> mensajes JSON como los del firmware."""
+    df = pd.read_csv(ruta)
+    if "received_ts" in df.columns:
+        ts = df["received_ts"].astype(float)
+    else:
+        ts = (pd.to_datetime(df["received_at"]) - pd.Timestamp(0)).dt.total_seconds()
+    columnas = {}
+    for c in df.columns:
+        campo = c[:-5] if c.endswith("_mean") else c
+        if campo in CAMPOS_ESQUEMA:
+            columnas[campo] = c
+    ts = ts.to_numpy()
+    ids = df["ID"].astype(str).tolist() if "ID" in df.columns else ["CSV"] * len(df)
+    valores = {campo: df[c].to_numpy(dtype=float) for campo, c in columnas.items()}
+    for i in ts.argsort(kind="stable").tolist():   # Varios sensores concatenados -> orden temporal
+        t = float(ts[i])
+        mensaje = {"ID": ids[i], "Tiempo_UTC": time.strftime("%Y-%j-%H:%M:%S", time.gmtime(t))}
+        for campo, v in valores.items():
+            if v[i] == v[i]:
+                mensaje[campo] = float(v[i])
+        yield Evento(t, topic, json.dumps(mensaje).encode("utf-8"))
+
+
+def abrir(rutas):
+    """Elige la fuente por extensión (CSV o capturas)."""
+    csvs = [r for r in rutas if r.lower().endswith(".csv")]
+    if csvs and len(csvs) != len(rutas):
+        raise ValueError("No se pueden mezclar CSV y capturas en una misma reproducción")
+    if csvs:
+        return (e for r in csvs for e in desde_csv(r))
+    return desde_capturas(rutas)
+
+
+# ---------- RITMO ----------
+class Ritmo:
+    """Agrupa los eventos en lotes y los suelta a su hora (escalada)."""
+
+    def __init__(self, velocidad=1.0, lote_max=LOTE_MAX):
+        self.velocidad = velocidad
+        self.lote_max = lote_max
+        self.retraso_max = 0.0   # Peor retraso frente a la hora prevista (s)
+        self.eventos = 0
+
+    def lotes(self, eventos):
+        t0 = inicio = None
+        lote = []
+        for e in eventos:
+            self.eventos += 1
+            if self.velocidad <= 0:
+                lote.append(e)
+                if len(lote) >= self.lote_max:
+                    yield lote
+                    lote = []
+                continue
+            if t0 is None:
+                t0, inicio = e.t, time.monotonic()
+            espera = inicio + (e.t - t0) / self.velocidad - time.monotonic()
+            if espera > 0 and lote:
+                yield lote            # Lo pendiente sale antes de dormir
+                lote = []
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                self.retraso_max = max(self.retraso_max, -espera)
+            lote.append(e)
+            if len(lote) >= self.lote_max:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+
+# ---------- DESTINOS ----------
+class DestinoBroker:
+    def __init__(self, broker=BROKER, puerto=1883, topic=None, espera=10.0):
+        self.topic = topic
+        self.nucleo = NucleoIngesta()
+        self.nucleo.conectar(broker, puerto, client_id=f"reproductor-{os.getpid()}")
+        self.nucleo.iniciar()
+        limite = time.time() + espera
+        while not all(self.nucleo.estadisticas()["conexiones"].values()):   # Esperar al CONNACK
+            if time.time() > limite:
+                self.nucleo.detener()
+                raise ConnectionError(f"Sin conexión con {broker}:{puerto}")
+            time.sleep(0.05)
+
+    def __call__(self, lote):
+        for e in lote:
+            self.nucleo.publicar(self.topic or e.topic, e.payload)
+        # No adelantarse al socket: si el búfer de escritura pasa de la marca alta, esperar
+        self.nucleo.vaciar(todo=False)
+
+    def cerrar(self, espera=10.0):
+        # Detener el loop con datos en el búfer perdería el final de la reproducción
+        if not self.nucleo.vaciar(timeout=espera):
+            print(f"⚠️ El broker no ha aceptado todo lo publicado en {espera:.0f} s")
+        self.nucleo.detener()
+
+    def resumen(self):
+        return {}
+
+
+class DestinoTuberia:
+    """Mismo camino que appV3.SensorData.add_records, sin red ni Streamlit."""
+
+    def __init__(self, alarmas=True, ahora=False):
+        self.decodificador = Decodificador()
+        self.limpieza = Limpiador()
+        self.registro = RegistroSensores()
+        self.estadisticas = EstadisticasVivo()
+        self.alarmas = MotorAlarmas.desde_fichero() if alarmas else None
+        self.ahora = ahora           # True: hora actual en vez de la original
+        self.eventos_alarma = []
+
+    def __call__(self, lote):
+        registros = []
+        for e in lote:
+            r = self.decodificador.decodificar(e.payload, time.time() if self.ahora else e.t)
+            if r is not None:
+                registros.append(r)
+        registros = [r for r in self.limpieza.limpiar_varios(registros) if not vacia(r)]
+        self.registro.agregar_varios(registros)
+        self.estadisticas.agregar_varios([r for r in registros if not isinstance(r, LoteLecturas)])
+        for r in registros:
+            if isinstance(r, LoteLecturas):
+                self.estadisticas.agregar_lote(r)
+        if self.alarmas is not None:
+            for ev in self.alarmas.evaluar_varios(registros):
+                self.eventos_alarma.append(ev)
+                marca = "🚨" if ev.activa else "✅"
+                print(f"{marca} {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ev.t))} "
+                      f"{ev.ID} {ev.regla} = {ev.valor:.2f}")
+
+    def cerrar(self):
+        pass
+
+    def resumen(self):
+        r = {"sensores": len(self.registro.ids()), "decodificacion": self.decodificador.estadisticas(),
+             "limpieza": {k: v for k, v in self.limpieza.estadisticas().items() if k != "por_sensor"}}
+        if self.alarmas is not None:
+            r["alarmas"] = self.alarmas.estadisticas()
+        return r
+
+
+def reproducir(eventos, destino, velocidad=1.0, lote_max=LOTE_MAX):
+    """Entrega los eventos al destino a su ritmo; devuelve un resumen."""
+    ritmo = Ritmo(velocidad, lote_max)
+    t_inicio = time.perf_counter()
+    primero = ultimo = None
+    try:
+        for lote in ritmo.lotes(eventos):
+            destino(lote)
+            if primero is None:
+                primero = lote[0].t
+            ultimo = lote[-1].t
+    finally:
+        destino.cerrar()
+    segundos = time.perf_counter() - t_inicio
+    return {
+        "mensajes": ritmo.eventos,
+        "segundos": round(segundos, 3),
+        "msg_s": round(ritmo.eventos / segundos, 1) if segundos else None,
+        "duracion_original_s": round(ultimo - primero, 3) if primero is not None else 0,
+        "retraso_max_s": round(ritmo.retraso_max, 4),
+        **destino.resumen(),
+    }
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Reproduce capturas (grabador.py) o CSV del dashboard")
+    p.add_argument("fuentes", nargs="+", help=f"Ficheros {EXTENSION}, directorios de capturas o CSV")
+    p.add_argument("--velocidad", type=float, default=1.0, help="1 = tiempo real, N = N veces más rápido, 0 = sin esperas")
+    p.add_argument("--destino", choices=("broker", "tuberia"), default="broker")
+    p.add_argument("--broker", default=BROKER)
+    p.add_argument("--puerto", type=int, default=1883)
+    p.add_argument("--topic", default=None, help="Publicar todo en este topic (por defecto, el original)")
+    p.add_argument("--sin-alarmas", action="store_true", help="Destino tubería: no evaluar alarmas.json")
+    p.add_argument("--hora-actual", action="store_true", help="Destino tubería: sellar con la hora actual")
+    args = p.parse_args(argv)
+
+    if args.destino == "broker":
+        try:
+            destino = DestinoBroker(args.broker, args.puerto, args.topic)
+        except ConnectionError as e:
+            print(f"❌ {e}")
+            return 1
+    else:
+        destino = DestinoTuberia(not args.sin_alarmas, args.hora_actual)
+    try:
+        resumen = reproducir(abrir(args.fuentes), destino, args.velocidad)
+    except KeyboardInterrupt:
+        print("\nReproducción interrumpida.")
+        return 1
+    print(f"▶️  {resumen['mensajes']} mensajes en {resumen['segundos']} s "
+          f"({resumen['msg_s']} msg/s, retraso máx {resumen['retraso_max_s'] * 1000:.1f} ms)")
+    print(json.dumps({k: v for k, v in resumen.items() if k not in ("mensajes", "segundos", "msg_s")},
+                     indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
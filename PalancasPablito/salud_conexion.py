@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# ----------------------------------------------------------
+# SALUD DE LA CONEXIÓN MQTT (sin E/S de red al pintar)
+# ----------------------------------------------------------
+# Se engancha a los callbacks del cliente de larga duración (paho, o
+# NucleoIngesta de ingesta_async.py, que llama a los mismos métodos):
+#  - on_connect / on_disconnect -> estado y nº de reconexiones
+#  - on_log "Sending PINGREQ" / "Received PINGRESP" -> RTT del keepalive
+#  - mensaje_recibido() desde on_message -> última vez que llegó algo
+# La UI solo lee un resumen ya calculado en memoria.
+
+MUESTRAS_RTT = 200
+
+
+class SaludConexion:
+    def __init__(self, muestras_rtt=MUESTRAS_RTT):
+        self.lock = threading.Lock()
+        self.conectado = False
+        self.conexiones = 0          # on_connect con éxito
+        self.desconexiones = 0
+        self.ultimo_cambio = None    # Momento del último connect/disconnect
+        self.ultimo_mensaje = None   # Último on_message
+        self.ultimo_motivo = None
+        self._ping_enviado = None
+        self.rtts = deque(maxlen=muestras_rtt)
+
+    # ---------- ENGANCHE ----------
+    def instalar(self, client, on_connect=None, on_disconnect=None):
+        """Pone los callbacks en el cliente, encadenando los que ya tuviera la app."""
+        def _on_connect(client, userdata, flags, reason_code, *args):
+            self.conectado_cb(reason_code)
+            if on_connect:
+                on_connect(client, userdata, flags, reason_code, *args)
+
+        def _on_disconnect(client, userdata, *args):
+            # VERSION1: (rc) | VERSION2: (flags, reason_code, properties)
+            self.desconectado_cb(args[1] if len(args) >= 2 else (args[0] if args else None))
+            if on_disconnect:
+                on_disconnect(client, userdata, *args)
+
+        client.on_connect = _on_connect
+        client.on_disconnect = _on_disconnect
+        client.on_log = self._on_log
+
+    def conectado_cb(self, reason_code):
+        ok = getattr(reason_code, "is_failure", None)
+        ok = (not ok) if ok is not None else reason_code == 0
+        with self.lock:
+            self.conectado = ok
+            self.ultimo_motivo = str(reason_code)
+            self.ultimo_cambio = time.time()
+            if ok:
+                self.conexiones += 1
+
+    def desconectado_cb(self, reason_code):
+        with self.lock:
+            self.conectado = False
+            self.desconexiones += 1
+            self.ultimo_motivo = str(reason_code)
+            self.ultimo_cambio = time.time()
+            self._ping_enviado = None
+
+    def _on_log(self, client, userdata, level, buf):
+        if buf == "Sending PINGREQ":
+            self._ping_enviado = time.perf_counter()
+        elif buf == "Received PINGRESP" and self._ping_enviado is not None:
+            rtt = time.perf_counter() - self._ping_enviado
+            self._ping_enviado = None
+            self.rtt_medido(rtt)
+
+    def rtt_medido(self, rtt):
+        """RTT de un PINGREQ/PINGRESP (s), medido por paho o por ingesta_async."""
+        with self.lock:
+            self.rtts.append(rtt)
+
+    def mensaje_recibido(self):
+        # Asignación simple: no hace falta lock
+        self.ultimo_mensaje = time.time()
+
+    # ---------- LECTURA (UI) ----------
+    def resumen(self):
+        """Foto del estado para la UI (solo memoria)."""
+        with self.lock:
+            rtts = np.array(self.rtts) * 1000.0
+            r = {
+                "conectado": self.conectado,
+                "reconexiones": max(0, self.conexiones - 1),
+                "desconexiones": self.desconexiones,
+                "ultimo_cambio": self.ultimo_cambio,
+                "ultimo_mensaje": self.ultimo_mensaje,
+                "motivo": self.ultimo_motivo,
+                "muestras_rtt": len(rtts),
+            }
+        if len(rtts):
+            r["rtt_p50_ms"], r["rtt_p95_ms"], r["rtt_p99_ms"] = np.percentile(rtts, [50, 95, 99])
+        return r
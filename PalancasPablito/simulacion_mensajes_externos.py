@@ -2,9 +2,10 @@ import paho.mqtt.client as mqtt
 import json
 import time
 import random
+import os
 
 # --- CONFIGURACIÓN ---
-BROKER = "broker.emqx.io"
+BROKER = os.environ.get("MQTT_BROKER", "broker.emqx.io")  # MQTT_BROKER=127.0.0.1 -> broker_local.py
 TOPIC = "Enviromental Sensors Network"
 SENSOR_ID = "B2"  # ID diferente al A1 para diferenciarlo
 UBICACION = "Laboratorio Bio-Regenerativo"
@@ -52,7 +53,7 @@ def run_simulator():
             payload = {
                 "ID": SENSOR_ID,
                 "Location": UBICACION,
-                "Tiempo_UTC": time.strftime("%Y-%j-%H:%M:%S"),
+                "Tiempo_UTC": time.strftime("%Y-%j-%H:%M:%S", time.gmtime()),
                 "CO_ppm": co_val,
                 "CO2_ppm": co2_val,
                 "Status": "OK"
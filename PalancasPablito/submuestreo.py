@@ -0,0 +1,220 @@
+import math
+import threading
+import numpy as np
+import pandas as pd
+from buffer_columnar import BufferColumnar
+from decodificador import como_lectura
+
+# ----------------------------------------------------------
+# SUBMUESTREO PARA GRÁFICAS
+# ----------------------------------------------------------
+# 1. Reductores visuales: dejan una serie larga en <= n puntos sin perder
+#    los picos (LTTB o mínimo/máximo por tramo).
+# 2. Agregados multirresolución (1 s, 10 s, 1 min, 1 h) con min/max/media/
+#    cuenta por campo, actualizados de forma incremental en la ingesta.
+
+MAX_PUNTOS_TRAZA = 2000
+RESOLUCIONES = (1, 10, 60, 3600)   # Segundos por cubeta
+CUBETAS_POR_RESOLUCION = 2_000     # 1 s -> 33 min, 10 s -> 5.5 h, 1 min -> 33 h, 1 h -> 83 días
+
+
+def indices_lttb(x, y, n=MAX_PUNTOS_TRAZA):
+    """Índices elegidos por Largest-Triangle-Three-Buckets (x, y sin NaN)."""
+    total = len(x)
+    if n >= total or n < 3:
+        return np.arange(total)
+    bordes = np.linspace(1, total - 1, n - 1).astype(np.int64)
+    idx = np.empty(n, dtype=np.int64)
+    idx[0], idx[-1] = 0, total - 1
+    a = 0
+    for i in range(n - 2):
+        ini, fin = bordes[i], max(bordes[i + 1], bordes[i] + 1)
+        sig_ini = fin
+        sig_fin = bordes[i + 2] if i + 2 < n - 1 else total
+        sig_fin = max(sig_fin, sig_ini + 1)
+        mx = x[sig_ini:sig_fin].mean()
+        my = y[sig_ini:sig_fin].mean()
+        area = np.abs((x[a] - mx) * (y[ini:fin] - y[a]) - (x[a] - x[ini:fin]) * (my - y[a]))
+        a = ini + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def indices_minmax(y, n=MAX_PUNTOS_TRAZA):
+    """Índices del mínimo y el máximo de cada tramo (totalmente vectorizado)."""
+    total = len(y)
+    cubetas = max(1, n // 2)
+    if total <= n:
+        return np.arange(total)
+    ancho = math.ceil(total / cubetas)
+    relleno = np.full(cubetas * ancho, np.nan)
+    relleno[:total] = y
+    tabla = relleno.reshape(cubetas, ancho)
+    filas = [f for f in range(cubetas) if f * ancho < total]
+    base = np.asarray(filas) * ancho
+    tabla = tabla[filas]
+    idx = np.concatenate([base + np.nanargmin(tabla, axis=1), base + np.nanargmax(tabla, axis=1)])
+    return np.unique(idx)
+
+
+def reducir(df, columna, n=MAX_PUNTOS_TRAZA, metodo="lttb"):
+    """Devuelve (x, y) de `columna` con como mucho n puntos."""
+    datos = df[["received_at", columna]].dropna()
+    x = datos["received_at"]
+    y = datos[columna].to_numpy(dtype=float)
+    if len(datos) <= n:
+        return x, y
+    if metodo == "minmax":
+        idx = indices_minmax(y, n)
+    else:
+        xs = (x - pd.Timestamp(0)).dt.total_seconds().to_numpy()
+        idx = indices_lttb(xs, y, n)
+    return x.iloc[idx], y[idx]
+
+
+class _Cubeta:
+    """Acumulador de la cubeta abierta: [min, max, suma, cuenta] por campo."""
+    __slots__ = ("inicio", "acum")
+
+    def __init__(self, inicio):
+        self.inicio = inicio
+        self.acum = {}
+
+    def agregar(self, campo, v):
+        a = self.acum.get(campo)
+        if a is None:
+            self.acum[campo] = [v, v, v, 1]
+        else:
+            if v < a[0]:
+                a[0] = v
+            if v > a[1]:
+                a[1] = v
+            a[2] += v
+            a[3] += 1
+
+    def fusionar(self, campo, mn, mx, suma, n):
+        """Suma a la cubeta un tramo ya reducido (min, max, suma, cuenta)."""
+        a = self.acum.get(campo)
+        if a is None:
+            self.acum[campo] = [mn, mx, suma, n]
+        else:
+            a[0] = min(a[0], mn)
+            a[1] = max(a[1], mx)
+            a[2] += suma
+            a[3] += n
+
+    def fila(self):
+        fila = {}
+        for campo, (mn, mx, suma, n) in self.acum.items():
+            fila[f"{campo}_min"] = mn
+            fila[f"{campo}_max"] = mx
+            fila[f"{campo}_mean"] = suma / n
+            fila[f"{campo}_count"] = n
+        return fila
+
+
+class Agregados:
+    """Agregados min/max/media/cuenta por sensor y resolución, en memoria acotada."""
+
+    def __init__(self, resoluciones=RESOLUCIONES, capacidad=CUBETAS_POR_RESOLUCION):
+        self.resoluciones = tuple(resoluciones)
+        self.capacidad = capacidad
+        self.cerradas = {}    # (sensor, resolución) -> BufferColumnar de cubetas cerradas
+        self.abiertas = {}    # (sensor, resolución) -> _Cubeta
+        self.lock = threading.Lock()
+
+    def agregar(self, registro):
+        lectura = como_lectura(registro)
+        if lectura is None:
+            return
+        with self.lock:
+            self._agregar(lectura)
+
+    def agregar_varios(self, registros):
+        """Varias Lecturas tomando el lock una vez (los lotes van por agregar_lote)."""
+        with self.lock:
+            for registro in registros:
+                lectura = como_lectura(registro)
+                if lectura is not None:
+                    self._agregar(lectura)
+
+    def _agregar(self, lectura):
+        # Llamar con el lock tomado
+        sensor_id, t = lectura.ID, lectura.hora()
+        valores = list(lectura.medidas())
+        if not valores:
+            return
+        for res in self.resoluciones:
+            clave = (sensor_id, res)
+            inicio = t - (t % res)
+            cubeta = self.abiertas.get(clave)
+            if cubeta is None or cubeta.inicio != inicio:
+                if cubeta is not None:
+                    self._cerrar(clave, cubeta)
+                cubeta = self.abiertas[clave] = _Cubeta(inicio)
+            for c, v in valores:
+                cubeta.agregar(c, v)
+
+    def agregar_lote(self, lote):
+        """Añade un LoteLecturas: cada campo se reduce por cubeta con reduceat
+        (sin bucle por muestra) y luego se funde con la cubeta abierta."""
+        if len(lote) == 0 or not lote.columnas:
+            return
+        t = lote.t_corregido()
+        with self.lock:
+            for res in self.resoluciones:
+                clave = (lote.ID, res)
+                inicios = t - (t % res)
+                # Cortes donde cambia la cubeta (las muestras vienen ordenadas)
+                cortes = np.flatnonzero(np.r_[True, inicios[1:] != inicios[:-1]])
+                tramos = {}
+                for c, v in lote.columnas.items():
+                    validos = ~np.isnan(v)
+                    cuenta = np.add.reduceat(validos.astype(np.int64), cortes)
+                    tramos[c] = (np.fmin.reduceat(v, cortes), np.fmax.reduceat(v, cortes),
+                                 np.add.reduceat(np.where(validos, v, 0.0), cortes), cuenta)
+                for k, ini in enumerate(inicios[cortes].tolist()):
+                    cubeta = self.abiertas.get(clave)
+                    if cubeta is None or cubeta.inicio != ini:
+                        if cubeta is not None:
+                            self._cerrar(clave, cubeta)
+                        cubeta = self.abiertas[clave] = _Cubeta(ini)
+                    for c, (mn, mx, suma, cuenta) in tramos.items():
+                        if cuenta[k]:
+                            cubeta.fusionar(c, float(mn[k]), float(mx[k]), float(suma[k]), int(cuenta[k]))
+
+    def _cerrar(self, clave, cubeta):
+        fila = cubeta.fila()
+        buf = self.cerradas.get(clave)
+        if buf is None:
+            buf = self.cerradas[clave] = BufferColumnar(self.capacidad, tuple(fila))
+        for c in fila:
+            buf.agregar_campo(c)
+        buf.agregar(cubeta.inicio, fila)
+
+    def resolucion_para(self, segundos, n=MAX_PUNTOS_TRAZA):
+        """Resolución más fina que deja la ventana en <= n puntos y cabe en memoria."""
+        for res in self.resoluciones:
+            if segundos / res <= n and segundos / res <= self.capacidad:
+                return res
+        return None
+
+    def dataframe(self, sensor_id, resolucion, desde):
+        """Cubetas (cerradas + la abierta) desde `desde` como DataFrame, o None
+        si no hay datos en memoria que cubran toda la ventana."""
+        clave = (sensor_id, resolucion)
+        with self.lock:
+            buf = self.cerradas.get(clave)
+            df = buf.dataframe() if buf is not None and len(buf) else pd.DataFrame()
+            abierta = self.abiertas.get(clave)
+            if abierta is not None:
+                fila = abierta.fila()
+                fila["received_at"] = pd.to_datetime(abierta.inicio, unit="s")
+                df = pd.concat([df, pd.DataFrame([fila])], ignore_index=True)
+        if df.empty:
+            return None
+        desde = pd.to_datetime(desde, unit="s")
+        # Si la memoria no llega al principio de la ventana, mejor ir al histórico
+        if df["received_at"].iloc[0] > desde + pd.Timedelta(seconds=resolucion):
+            return None
+        return df[df["received_at"] >= desde]
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Los módulos del proyecto se importan "planos" (import buffer_columnar),
+# como cuando se lanzan los scripts desde PalancasPablito/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,48 @@
+import time
+import numpy as np
+from decodificador import Lectura, LoteLecturas
+from almacen_historico import AlmacenHistorico
+
+MEDIANOCHE = 1_760_054_400.0   # 2025-10-10 00:00:00 UTC
+
+
+def _esperar(almacen, filas, timeout=5.0):
+    limite = time.monotonic() + timeout
+    while almacen.escritos + almacen.fallidas < filas:
+        assert time.monotonic() < limite, "El escritor no ha terminado a tiempo"
+        time.sleep(0.01)
+
+
+def test_un_fichero_por_dia_utc(tmp_path):
+    almacen = AlmacenHistorico(str(tmp_path), lote_ms=10)
+    t = MEDIANOCHE - 3 + np.arange(6.0)   # Un lote que cruza la medianoche
+    almacen.guardar_lote(LoteLecturas("A1", None, float(t[-1]), t, {"Temp_C": np.arange(6.0)}))
+    _esperar(almacen, 6)
+    assert sorted(p.name for p in tmp_path.glob("*.sqlite")) == ["lecturas_20251009.sqlite", "lecturas_20251010.sqlite"]
+    df = almacen.rango("A1", MEDIANOCHE - 10, MEDIANOCHE + 10)
+    assert df["Temp_C"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0]
+    assert almacen.sensores(MEDIANOCHE - 10, MEDIANOCHE + 10) == ["A1"]
+    assert almacen.fallidas == 0
+
+
+def test_fila_rezagada_de_un_dia_viejo(tmp_path):
+    almacen = AlmacenHistorico(str(tmp_path), lote_ms=10)
+    for dias in (0, 1):
+        almacen.guardar(Lectura("A1", None, MEDIANOCHE + dias * 86_400 + 5, 20.0 + dias))
+    _esperar(almacen, 2)
+    almacen.guardar(Lectura("A1", None, MEDIANOCHE - 86_400, 10.0))   # Dos días antes
+    _esperar(almacen, 3)
+    assert almacen.fallidas == 0
+    df = almacen.rango("A1", MEDIANOCHE - 2 * 86_400, MEDIANOCHE + 2 * 86_400)
+    assert df["Temp_C"].tolist() == [10.0, 20.0, 21.0]
+
+
+def test_agregado_por_cubetas_entre_dos_dias(tmp_path):
+    almacen = AlmacenHistorico(str(tmp_path), lote_ms=10)
+    t = MEDIANOCHE - 30 + np.arange(60.0)
+    almacen.guardar_lote(LoteLecturas("A1", None, float(t[-1]), t, {"Temp_C": np.arange(60.0)}))
+    _esperar(almacen, 60)
+    df = almacen.agregado("A1", MEDIANOCHE - 60, 60, t1=MEDIANOCHE + 60)
+    assert df["Temp_C_count"].tolist() == [30, 30]
+    assert df["Temp_C_min"].tolist() == [0.0, 30.0]
+    assert df["Temp_C_mean"].tolist() == [14.5, 44.5]
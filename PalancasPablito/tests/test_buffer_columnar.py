@@ -0,0 +1,60 @@
+import numpy as np
+from buffer_columnar import BufferColumnar
+
+
+def _lleno(capacidad, n):
+    buf = BufferColumnar(capacidad, ("Temp_C",))
+    for i in range(n):
+        buf.agregar(float(i), {"Temp_C": i * 10.0})
+    return buf
+
+
+def test_vuelta_conserva_las_ultimas_en_orden():
+    buf = _lleno(4, 10)
+    t, cols = buf.ultimos()
+    assert len(buf) == 4
+    assert t.tolist() == [6.0, 7.0, 8.0, 9.0]
+    assert cols["Temp_C"].tolist() == [60.0, 70.0, 80.0, 90.0]
+    assert buf.ultimo()["Temp_C"] == 90.0
+
+
+def test_ultimos_es_una_vista_contigua():
+    buf = _lleno(4, 6)   # La escritura ha dado la vuelta: pos = 2
+    t, _ = buf.ultimos(3)
+    assert t.base is buf.tiempo
+    assert t.flags["C_CONTIGUOUS"]
+    assert t.tolist() == [3.0, 4.0, 5.0]
+
+
+def test_lote_mayor_que_la_capacidad_guarda_el_final():
+    buf = _lleno(4, 3)
+    buf.agregar_lote(np.arange(100.0, 106.0), {"Temp_C": np.arange(6.0)})
+    t, cols = buf.ultimos()
+    assert t.tolist() == [102.0, 103.0, 104.0, 105.0]
+    assert cols["Temp_C"].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert buf.escritas == 9
+
+
+def test_lote_que_cruza_el_final_del_anillo():
+    buf = _lleno(5, 4)
+    buf.agregar_lote([4.0, 5.0, 6.0], {"Temp_C": [40.0, 50.0, 60.0]})
+    t, cols = buf.ultimos()
+    assert t.tolist() == [2.0, 3.0, 4.0, 5.0, 6.0]
+    assert cols["Temp_C"].tolist() == [20.0, 30.0, 40.0, 50.0, 60.0]
+
+
+def test_campo_ausente_queda_a_nan():
+    buf = BufferColumnar(3, ("Temp_C", "UVI"))
+    buf.agregar(1.0, {"Temp_C": 21.0, "UVI": "no es un número"})
+    _, cols = buf.ultimos()
+    assert cols["Temp_C"].tolist() == [21.0]
+    assert np.isnan(cols["UVI"][0])
+
+
+def test_redimensionar_conserva_lo_mas_reciente_y_el_cursor():
+    buf = _lleno(8, 11)
+    buf.redimensionar(3)
+    assert buf.ultimos()[0].tolist() == [8.0, 9.0, 10.0]
+    assert buf.escritas == 11
+    buf.agregar(11.0, {"Temp_C": 110.0})
+    assert buf.ultimos()[0].tolist() == [9.0, 10.0, 11.0]
@@ -0,0 +1,67 @@
+import math
+import numpy as np
+import pytest
+import codec_binario
+from codec_binario import CAMPOS_BINARIO
+
+
+def test_lectura_v1_ida_y_vuelta():
+    valores = {"Temp_C": 21.37, "Humidity_Per": 45.5, "UVI": 0.0, "CO2_ppm": 612.0}
+    trama = codec_binario.codificar_lectura("A1", valores, epoch=1_760_000_000)
+    assert len(trama) == codec_binario.LECTURA_V1.size
+    assert codec_binario.es_binario(trama)
+    assert codec_binario.version_trama(trama) == codec_binario.VERSION_LECTURA
+    sensor_id, epoch, nums = codec_binario.decodificar_lectura(trama)
+    assert (sensor_id, epoch) == ("A1", 1_760_000_000)
+    for campo, v in zip(CAMPOS_BINARIO, nums):
+        if campo in valores:
+            assert v == valores[campo]   # Redondeado a DECIMALES: sin ruido de float32
+        else:
+            assert math.isnan(v)
+
+
+def test_lectura_v1_id_largo_se_recorta():
+    trama = codec_binario.codificar_lectura("SENSOR_LARGO", {"Temp_C": 1.0})
+    assert codec_binario.decodificar_lectura(trama)[0] == "SENSOR_L"
+
+
+def test_lote_v1_con_numpy_coincide_con_una_a_una():
+    tramas = [codec_binario.codificar_lectura(f"N{i}", {"Temp_C": 20 + i / 10, "UVI": i}, epoch=100 + i)
+              for i in range(10)]
+    datos = codec_binario.decodificar_lote_v1(tramas)
+    for i, trama in enumerate(tramas):
+        sensor_id, epoch, nums = codec_binario.decodificar_lectura(trama)
+        assert datos["id"][i].rstrip(b"\0").decode("ascii") == sensor_id
+        assert int(datos["epoch"][i]) == epoch
+        assert round(float(datos["Temp_C"][i]), codec_binario.DECIMALES) == nums[0]
+
+
+def test_lote_v1_rechaza_tramas_de_otra_version():
+    otra = bytearray(codec_binario.codificar_lectura("A1", {"Temp_C": 1.0}))
+    otra[1] = 7
+    with pytest.raises(ValueError):
+        codec_binario.decodificar_lote_v1([codec_binario.codificar_lectura("A1", {}), bytes(otra)])
+
+
+def test_tiempo_utc_en_formato_timenow():
+    assert codec_binario.tiempo_utc(0) is None
+    assert codec_binario.tiempo_utc(86_400 * 31 + 3661) == "1970-032-01:01:01"
+
+
+def test_lote_v2_ida_y_vuelta():
+    dt = [0, 250, 500, 60_000]
+    columnas = {"Temp_C": [20.1, 20.2, np.nan, 20.4], "CO_ppm": [1.5, 1.5, 2.0, 2.5]}
+    trama = codec_binario.codificar_lote("B2", dt, columnas, epoch=1_760_000_000)
+    assert codec_binario.version_trama(trama) == codec_binario.VERSION_LOTE
+    sensor_id, epoch, dt_ms, cols = codec_binario.decodificar_lote(trama)
+    assert (sensor_id, epoch) == ("B2", 1_760_000_000)
+    assert dt_ms.tolist() == dt
+    assert list(cols) == ["Temp_C", "CO_ppm"]   # Orden de CAMPOS_BINARIO, solo los presentes
+    np.testing.assert_array_equal(cols["Temp_C"], columnas["Temp_C"])
+    assert cols["CO_ppm"].tolist() == columnas["CO_ppm"]
+
+
+def test_lote_v2_longitud_incorrecta():
+    trama = codec_binario.codificar_lote("B2", [0, 1], {"Temp_C": [1.0, 2.0]})
+    with pytest.raises(ValueError):
+        codec_binario.decodificar_lote(trama[:-1])
@@ -0,0 +1,74 @@
+import math
+import codec_binario
+from decodificador import Decodificador, Lectura, LOTE_V1_MIN
+from tiempo import RelojSensores
+
+
+def _v1(sensor_id, temp, epoch=0):
+    return codec_binario.codificar_lectura(sensor_id, {"Temp_C": temp}, epoch=epoch)
+
+
+def test_decodificar_lote_mantiene_el_orden_de_llegada():
+    # JSON, basura y tramas v1 mezclados: la salida va alineada con la entrada
+    payloads = []
+    for i in range(LOTE_V1_MIN + 2):
+        payloads.append(_v1("A1", float(i)))
+        if i % 3 == 0:
+            payloads.append(b'{"ID": "B2", "Temp_C": %d}' % (100 + i))
+        if i == 4:
+            payloads.append(b"no es un mensaje")
+    salida = Decodificador().decodificar_lote(payloads, recibidos=list(range(len(payloads))))
+    assert len(salida) == len(payloads)
+    for p, r, llegada in zip(payloads, salida, range(len(payloads))):
+        esperado = Decodificador().decodificar(p, llegada)
+        if esperado is None:
+            assert r is None
+            continue
+        assert isinstance(r, Lectura)
+        assert (r.ID, r.received_ts, r.Temp_C) == (esperado.ID, esperado.received_ts, esperado.Temp_C)
+
+
+def test_decodificar_lote_con_numpy_igual_que_una_a_una():
+    payloads = [_v1(f"N{i % 3}", 20.0 + i / 8, epoch=1_760_000_000 + i) for i in range(3 * LOTE_V1_MIN)]
+    lote = Decodificador().decodificar_lote(payloads, 5.0)
+    sueltas = [Decodificador().decodificar(p, 5.0) for p in payloads]
+    assert [tuple(r[:4]) for r in lote] == [tuple(r[:4]) for r in sueltas]
+    assert all(math.isnan(r.UVI) for r in lote)
+
+
+def test_decodificar_lote_sella_en_orden_de_llegada():
+    # El reloj de cada sensor tiene que ver sus mensajes en el orden en que llegaron
+    payloads = [_v1("A1", 20.0, epoch=1_760_000_000 + i) for i in range(LOTE_V1_MIN)]
+    recibidos = [1_760_000_000 + i + 0.2 for i in range(LOTE_V1_MIN)]
+    en_lote = Decodificador(RelojSensores()).decodificar_lote(payloads, recibidos)
+    uno_a_uno = Decodificador(RelojSensores())
+    sueltas = [uno_a_uno.decodificar(p, r) for p, r in zip(payloads, recibidos)]
+    assert [r.t_ns for r in en_lote] == [r.t_ns for r in sueltas]
+    assert all(r.t_ns for r in en_lote)
+
+
+def test_lote_v2_y_json_dan_el_mismo_lote():
+    dt = [0, 1000, 2000]
+    binario = codec_binario.codificar_lote("B2", dt, {"Temp_C": [1.0, 2.0, 3.0]}, epoch=1_760_000_000)
+    texto = (b'{"ID": "B2", "Tiempo_UTC": "%s", "Lote": {"dt_ms": [0, 1000, 2000], "Temp_C": [1, 2, 3]}}'
+             % codec_binario.tiempo_utc(1_760_000_000).encode())
+    a, b = (Decodificador().decodificar(p, 50.0) for p in (binario, texto))
+    for lote in (a, b):
+        assert lote.t.tolist() == [48.0, 49.0, 50.0]   # La última muestra llega "ahora"
+        assert lote.columnas["Temp_C"].tolist() == [1.0, 2.0, 3.0]
+        assert lote.sello_ns == (1_760_000_000 + 2) * 10**9   # Cabecera + dt_ms[-1]
+
+
+def test_lote_v2_se_sella_con_la_hora_de_su_ultima_muestra():
+    # El nodo va 5 s adelantado y la red tarda 0.1 s: lotes de 10 muestras
+    # (1 por segundo) tienen que dar la misma hora corregida que tramas v1
+    t0 = 1_760_000_000
+    sueltas, lotes = Decodificador(RelojSensores()), Decodificador(RelojSensores())
+    for k in range(60):
+        r = sueltas.decodificar(_v1("A1", 20.0, epoch=t0 + k + 5), t0 + k + 0.1)
+    for k in range(0, 60, 10):
+        trama = codec_binario.codificar_lote("A1", range(0, 10_000, 1000), {"Temp_C": [20.0] * 10},
+                                             epoch=t0 + k + 5)
+        lote = lotes.decodificar(trama, t0 + k + 9.1)
+    assert abs(lote.t_corregido()[-1] - r.hora()) < 1e-3
+    assert abs(lote.t_corregido()[0] - (r.hora() - 9)) < 1e-3
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from decodificador import Lectura, LoteLecturas
+from estadisticas_vivo import EstadisticasVivo, GAMMA, _Tramo
+
+
+def _valores(n=500, semilla=1):
+    return np.random.default_rng(semilla).normal(1e4, 3.0, n)   # Media grande: Welford no pierde precisión
+
+
+def test_welford_igual_que_numpy():
+    v = _valores()
+    tramo = _Tramo(0)
+    for x in v.tolist():
+        tramo.agregar(x)
+    r = tramo.resumen()
+    assert r["n"] == len(v)
+    assert r["media"] == pytest.approx(v.mean(), rel=1e-12)
+    assert r["desv"] == pytest.approx(v.std(ddof=1), rel=1e-9)
+    assert (r["min"], r["max"]) == (v.min(), v.max())
+
+
+def test_fusionar_tramos_igual_que_uno_solo():
+    v = _valores()
+    junto, a, b = _Tramo(0), _Tramo(0), _Tramo(0)
+    for i, x in enumerate(v.tolist()):
+        junto.agregar(x)
+        (a if i < 123 else b).agregar(x)
+    a.fusionar_tramo(b)
+    assert a.n == junto.n
+    assert a.media == pytest.approx(junto.media, rel=1e-12)
+    assert a.m2 == pytest.approx(junto.m2, rel=1e-9)
+    assert a.hist == junto.hist
+
+
+def test_percentiles_con_error_relativo_acotado():
+    v = np.random.default_rng(2).uniform(1.0, 100.0, 5000)
+    tramo = _Tramo(0)
+    for x in v.tolist():
+        tramo.agregar(x)
+    for p, estimado in zip((50, 90, 99), tramo.percentiles((50, 90, 99))):
+        assert estimado == pytest.approx(np.percentile(v, p), rel=GAMMA - 1)
+
+
+def test_lote_y_lecturas_dan_el_mismo_resumen():
+    t = 1_000_000.0 + np.arange(300) * 0.5
+    v = _valores(300)
+    por_lecturas, por_lote = EstadisticasVivo(), EstadisticasVivo()
+    por_lecturas.agregar_varios([Lectura("A1", None, ti, vi) for ti, vi in zip(t.tolist(), v.tolist())])
+    por_lote.agregar_lote(LoteLecturas("A1", None, float(t[-1]), t, {"Temp_C": v}))
+    a = por_lecturas.resumen("A1", "Temp_C", "1 h", ahora=t[-1])
+    b = por_lote.resumen("A1", "Temp_C", "1 h", ahora=t[-1])
+    assert a.keys() == b.keys()
+    for k in a:
+        assert a[k] == pytest.approx(b[k], rel=1e-9)
+
+
+def test_la_ventana_olvida_lo_viejo():
+    est = EstadisticasVivo()
+    for i in range(120):
+        est.agregar(Lectura("A1", None, 1_000_000.0 + i, float(i)))
+    r = est.resumen("A1", "Temp_C", "1 min", ahora=1_000_119.5)
+    assert r["min"] >= 59 and r["max"] == 119
+    assert est.resumen("A1", "Temp_C", "1 min", ahora=1_000_000.0 + 3600) is None
+    assert est.resumen("A1", "Temp_C", "1 h", ahora=1_000_119.5)["n"] == 120
@@ -0,0 +1,66 @@
+import math
+import numpy as np
+from decodificador import Lectura, LoteLecturas
+from limpieza import Limpiador, MIN_VECTORIAL, VENTANA_HAMPEL, vacia
+
+
+def _serie(semilla=3, n=200):
+    rng = np.random.default_rng(semilla)
+    v = 22.0 + rng.normal(0, 0.2, n)
+    v[[40, 41, 120]] = [35.0, 34.0, 8.0]   # Picos
+    v[150:] += 5.0                         # Escalón real
+    v[60] = 150.0                          # Fuera del rango del BME280
+    return v
+
+
+def test_hampel_rechaza_picos_y_acepta_escalones():
+    limpiador = Limpiador()
+    ok = limpiador.mascara("A1", "Temp_C", _serie())
+    rechazadas = set(np.flatnonzero(~ok).tolist())
+    assert {40, 41, 60, 120} <= rechazadas
+    # El escalón se acepta en cuanto ocupa media ventana
+    assert not rechazadas & set(range(150 + VENTANA_HAMPEL // 2 + 1, 200))
+    assert limpiador.fuera_de_rango["A1"] == 1
+    assert limpiador.picos["A1"] == len(rechazadas) - 1
+
+
+def test_vectorial_igual_que_muestra_a_muestra():
+    v = _serie()
+    vectorial, escalar = Limpiador(), Limpiador()
+    ok = np.concatenate([vectorial.mascara("A1", "Temp_C", trozo) for trozo in np.array_split(v, 7)])
+    uno_a_uno = [escalar.aceptar("A1", "Temp_C", x) for x in v.tolist()]
+    assert ok.tolist() == uno_a_uno
+    assert vectorial.estadisticas() == escalar.estadisticas()
+
+
+def test_senal_plana_no_se_rechaza():
+    limpiador = Limpiador()
+    v = np.full(50, 1013.0)
+    v[30] = 1013.4   # Por debajo de TOLERANCIA_MIN aunque el MAD sea 0
+    assert limpiador.mascara("A1", "Pressure_hPa", v).all()
+
+
+def test_nan_se_acepta_y_no_entra_en_la_historia():
+    limpiador = Limpiador()
+    v = np.array([np.nan, 20.0, np.nan])
+    assert limpiador.mascara("A1", "Temp_C", v).all()
+    assert limpiador.revisadas == 1
+
+
+def test_limpiar_varios_con_y_sin_numpy():
+    lecturas = [Lectura("A1", None, float(i), x, 50.0) for i, x in enumerate(_serie().tolist())]
+    assert len(lecturas) >= MIN_VECTORIAL
+    juntas = Limpiador().limpiar_varios(lecturas)   # Columnas con NumPy
+    limpiador = Limpiador()
+    sueltas = [limpiador.limpiar(r) for r in lecturas]   # Python puro
+    assert sum(math.isnan(r.Temp_C) for r in juntas) >= 4
+    for a, b in zip(juntas, sueltas):
+        assert (math.isnan(a.Temp_C) and math.isnan(b.Temp_C)) or a.Temp_C == b.Temp_C
+        assert a.Humidity_Per == 50.0   # Solo se anula el campo rechazado
+
+
+def test_lote_rechazado_entero_queda_vacio():
+    lote = LoteLecturas("A1", None, 3.0, np.arange(3.0), {"UVI": np.array([-1.0, 30.0, 99.0])})
+    limpio = Limpiador().limpiar(lote)
+    assert np.isnan(limpio.columnas["UVI"]).all()
+    assert vacia(limpio)
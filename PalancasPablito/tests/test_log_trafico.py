@@ -0,0 +1,78 @@
+import json
+import numpy as np
+from decodificador import Lectura, LoteLecturas
+from log_trafico import LogTrafico
+
+
+def _lecturas(n, t0=1000.0):
+    r = []
+    for i in range(n):
+        uvi = float(i) if i % 5 == 0 else float("nan")
+        r.append(Lectura("A1" if i % 2 == 0 else "B2", None, t0 + i, 20.0 + i, UVI=uvi))
+    return r
+
+
+def _log(n, **opciones):
+    log = LogTrafico(carpeta=opciones.pop("carpeta", None), segmento=10, **opciones)
+    log.agregar_varios(_lecturas(n))
+    return log
+
+
+def test_paginas_de_la_mas_nueva_a_la_mas_vieja():
+    log = _log(35)
+    p = log.consulta(tam=10)
+    assert [e.seq for e in p.entradas] == list(range(34, 24, -1))
+    assert (p.total, p.paginas, p.exacto) == (35, 4, True)
+    ultima = log.consulta(pagina=3, tam=10)
+    assert [e.seq for e in ultima.entradas] == [4, 3, 2, 1, 0]
+
+
+def test_filtros_por_sensor_campo_y_hora():
+    log = _log(35)
+    assert log.consulta(sensores=["A1"]).total == 18
+    assert {e.sensor for e in log.consulta(sensores=["A1"]).entradas} == {"A1"}
+    assert [e.seq for e in log.consulta(campo="UVI").entradas] == [30, 25, 20, 15, 10, 5, 0]
+    p = log.consulta(sensores=["B2"], desde=1010.0, hasta=1020.0)
+    assert [e.seq for e in p.entradas] == [19, 17, 15, 13, 11]
+    assert log.consulta(sensores=["NO_EXISTE"]).total == 0
+
+
+def test_el_texto_es_el_json_de_la_lectura():
+    log = _log(3)
+    e = log.consulta().entradas[0]
+    assert json.loads(e.texto) == {"ID": "A1", "Temp_C": 22.0}
+    lote = LoteLecturas("C3", "2025-283-00:00:00", 5.0, np.arange(3.0), {"Temp_C": np.array([1.0, 2.0, 3.0])})
+    log.agregar(lote)
+    assert json.loads(log.consulta(sensores=["C3"]).entradas[0].texto) == \
+        {"ID": "C3", "Tiempo_UTC": "2025-283-00:00:00", "Muestras": 3, "Temp_C": 3.0}
+
+
+def test_busqueda_de_texto_acotada_y_paginada():
+    log = _log(95)
+    esperado = [e.seq for e in log.consulta(sensores=["B2"], tam=100).entradas]
+    p = log.consulta(texto='"id":"b2"', tam=10)   # Sin distinguir mayúsculas
+    n = len(p.entradas)
+    assert [e.seq for e in p.entradas] == esperado[:n]
+    assert not p.exacto and p.total == n   # Cortada: cada consulta revisa pocos trozos nuevos
+    for _ in range(10):
+        p = log.consulta(texto='"id":"b2"', pagina=4, tam=10)
+        if p.exacto:
+            break
+    assert p.exacto and p.total == len(esperado)
+    assert [e.seq for e in p.entradas] == esperado[40:50]
+    assert [e.seq for e in log.consulta(texto='"ID":"B2"', tam=10).entradas] == esperado[:10]
+
+
+def test_trozos_viejos_en_disco_y_retencion(tmp_path):
+    log = _log(45, carpeta=str(tmp_path), en_memoria=1, max_segmentos=3)
+    assert len(log) == 25   # Solo los 3 trozos más nuevos: seq 20..44
+    assert len(list(tmp_path.glob("pid_*/*.jsonl"))) == 3
+    p = log.consulta(pagina=1, tam=10)   # seq 34..25, del fichero del trozo 30..39 y 20..29
+    assert [e.seq for e in p.entradas] == list(range(34, 24, -1))
+    assert [json.loads(e.texto)["Temp_C"] for e in p.entradas] == [20.0 + s for s in range(34, 24, -1)]
+    for _ in range(3):
+        p = log.consulta(texto='"temp_c":42.0')
+        if p.exacto:
+            break
+    assert [e.seq for e in p.entradas] == [22]
+    log.cerrar()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from decodificador import Lectura, LoteLecturas
+from motor_alarmas import MotorAlarmas, Regla
+
+
+def _evaluar(motor, valores, sensor_id="A1", t0=0.0):
+    eventos = []
+    for i, v in enumerate(valores):
+        eventos += motor.evaluar(Lectura(sensor_id, None, t0 + i, v))
+    return [(e.regla, e.activa, e.t) for e in eventos]
+
+
+def test_umbral_con_histeresis_no_parpadea():
+    motor = MotorAlarmas([Regla("calor", "Temp_C", mayor=30, histeresis=1.0)])
+    eventos = _evaluar(motor, [25, 31, 29.5, 30.5, 29.5, 28.9, 31])
+    assert eventos == [("calor", True, 1.0), ("calor", False, 5.0), ("calor", True, 6.0)]
+
+
+def test_durante_exige_violacion_seguida():
+    motor = MotorAlarmas([Regla("calor", "Temp_C", mayor=30, durante=2)])
+    eventos = _evaluar(motor, [31, 31, 25, 31, 31, 31])
+    assert eventos == [("calor", True, 5.0)]
+
+
+def test_tasa_por_minuto():
+    motor = MotorAlarmas([Regla("caida", "Pressure_hPa", menor=-1.0, tipo="tasa")])
+    eventos = []
+    for i, p in enumerate([1013.0, 1013.0, 1012.9, 1012.0]):
+        eventos += motor.evaluar(Lectura("A1", None, i * 30.0, Pressure_hPa=p))
+    assert [(e.activa, e.t) for e in eventos] == [(True, 90.0)]
+    assert eventos[0].valor == pytest.approx(-1.8)
+
+
+def test_solo_aplica_a_sus_sensores():
+    motor = MotorAlarmas([Regla("calor", "Temp_C", mayor=30, sensor=["B2"])])
+    assert _evaluar(motor, [40], "A1") == []
+    assert _evaluar(motor, [40], "B2") == [("calor", True, 0.0)]
+    assert motor.activas() == [("B2", "calor", "aviso")]
+
+
+def test_lote_igual_que_lecturas_sueltas():
+    reglas = [{"nombre": "calor", "campo": "Temp_C", "mayor": 30, "histeresis": 1, "durante": 1},
+              {"nombre": "frio", "campo": "Temp_C", "menor": 5, "nivel": "peligro"}]
+    v = np.array([20, 31, 32, 29.5, np.nan, 28, 4, 3, 10, 31, 31, 31])
+    t = np.arange(len(v), dtype=float)
+    sueltas = MotorAlarmas(reglas)
+    esperado = []
+    for ti, vi in zip(t.tolist(), v.tolist()):
+        esperado += [(e.regla, e.activa, e.t) for e in sueltas.evaluar(Lectura("A1", None, ti, vi))]
+    en_lote = MotorAlarmas(reglas).evaluar(LoteLecturas("A1", None, t[-1], t, {"Temp_C": v}))
+    # En un lote los eventos salen regla a regla; cada regla, en orden de tiempo
+    assert sorted((e.t, e.regla, e.activa) for e in en_lote) == sorted((t, r, a) for r, a, t in esperado)
+    assert len(esperado) == 5
+
+
+def test_publica_cambios_de_estado():
+    publicados = []
+    motor = MotorAlarmas([Regla("calor", "Temp_C", mayor=30)],
+                         publicar=lambda topic, payload: publicados.append(topic), topic="alarmas")
+    _evaluar(motor, [31, 32, 20])
+    assert publicados == ["alarmas/A1/calor", "alarmas/A1/calor"]
+
+
+def test_reglas_invalidas():
+    with pytest.raises(ValueError):
+        Regla("x", "Temp_C")
+    with pytest.raises(ValueError):
+        MotorAlarmas([Regla("x", "Temp_C", mayor=1), Regla("x", "UVI", mayor=1)])
@@ -0,0 +1,55 @@
+import numpy as np
+from decodificador import Lectura, LoteLecturas
+from registro_sensores import RegistroSensores
+
+
+def _lectura(sensor_id, t, temp=20.0):
+    return Lectura(sensor_id, None, t, temp)
+
+
+def test_reparte_el_presupuesto_en_potencias_de_2():
+    reg = RegistroSensores(presupuesto=4000, minimo=500)
+    reg.agregar(_lectura("A1", 1.0))
+    assert reg.series["A1"].capacidad == 4000
+    reg.agregar(_lectura("A2", 2.0))
+    assert {s: b.capacidad for s, b in reg.series.items()} == {"A1": 2000, "A2": 2000}
+    reg.agregar(_lectura("A3", 3.0))
+    assert all(b.capacidad == 1000 for b in reg.series.values())
+
+
+def test_expulsa_al_sensor_mas_inactivo():
+    reg = RegistroSensores(presupuesto=3000, minimo=1000)
+    reg.agregar(_lectura("A1", 10.0))
+    reg.agregar(_lectura("A2", 5.0))
+    reg.agregar(_lectura("A3", 20.0))
+    reg.agregar(_lectura("A1", 30.0))   # A2 es ahora el que lleva más tiempo sin datos
+    reg.agregar(_lectura("B2", 40.0))
+    assert reg.ids() == ["A1", "A3", "B2"]
+    assert "A2" not in reg.ultima_vez
+
+
+def test_nuevas_devuelve_solo_lo_escrito_tras_el_cursor():
+    reg = RegistroSensores(presupuesto=4000, minimo=500)
+    for i in range(5):
+        reg.agregar(_lectura("A1", float(i), float(i)))
+    cursor, t, cols = reg.nuevas("A1")
+    assert t.tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+    reg.agregar(LoteLecturas("A1", None, 7.0, np.array([5.0, 6.0, 7.0]),
+                             {"Temp_C": np.array([5.0, 6.0, 7.0])}))
+    cursor, t, cols = reg.nuevas("A1", cursor)
+    assert t.tolist() == [5.0, 6.0, 7.0]
+    assert cols["Temp_C"].tolist() == [5.0, 6.0, 7.0]
+    assert reg.nuevas("A1", cursor)[1].tolist() == []
+
+
+def test_nuevas_tras_expulsion_devuelve_el_buffer_nuevo():
+    reg = RegistroSensores(presupuesto=2000, minimo=1000)
+    reg.agregar(_lectura("A1", 1.0))
+    cursor = reg.nuevas("A1")[0]
+    reg.agregar(_lectura("A2", 2.0))
+    reg.agregar(_lectura("A3", 3.0))    # Expulsa a A1
+    reg.agregar(_lectura("A1", 4.0))    # Vuelve con un buffer (generación) nuevo
+    nuevo, t, _ = reg.nuevas("A1", cursor)
+    assert nuevo[0] != cursor[0]
+    assert t.tolist() == [4.0]
+
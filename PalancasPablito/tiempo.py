@@ -0,0 +1,303 @@
+import json
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timezone
+
+# ----------------------------------------------------------
+# HORA DE LOS SENSORES: PARSEO Y SINCRONIZACIÓN DE RELOJES
+# ----------------------------------------------------------
+# Formatos de hora que circulan por la red:
+#  - "AAAA-DDD-HH:MM:SS" (día del año): Tiempo_UTC del firmware y del
+#    simulador, y el {"TimeNow": ...} de enviar_TimeNow.py
+#  - UNIX (s, ms, µs o ns; entero, float o texto), como el que esperaba
+#    mqtt_time_subscriber.py
+#  - ISO 8601 ("2024-05-01T12:00:00Z", con o sin zona; sin zona = UTC)
+# Todos pasan a epoch en ns (int) UNA vez. Sin strptime por mensaje: el día
+# ("AAAA-DDD") y el texto completo se cachean (muchos sensores comparten el
+# mismo segundo) y HH:MM:SS se lee por posiciones.
+#
+# RelojSensores estima, para cada fuente (un sensor o la referencia
+# TimeNow), el desfase y la deriva de su reloj frente al del colector:
+#  - d = llegada - sello. La latencia de red solo puede sumar, así que el
+#    mínimo de d en cada cubeta de VENTANA_S segundos es la mejor cota del
+#    desfase (filtro de mínimos, como NTP).
+#  - Recta por mínimos cuadrados sobre las últimas CUBETAS: desfase en el
+#    origen y deriva (ppm). Con pocas cubetas, solo desfase.
+#  - Si el reloj del sensor salta (reinicio, resincronización) más de
+#    SALTO_S respecto a la recta, se descarta su historia y se vuelve a empezar.
+# Hora corregida = sello + desfase (nunca posterior a la llegada) y, si hay
+# TimeNow, pasada al reloj de referencia. Latencia = llegada - corregida
+# (retraso por encima del mínimo observado). Con sellos de 1 s, la hora
+# corregida es el inicio de ese segundo.
+
+NS = 1_000_000_000
+TOPIC_TIME = "TimeNow"
+REFERENCIA = "TimeNow"   # Nombre de la fuente de referencia en RelojSensores
+VENTANA_S = 60           # Cubeta del filtro de mínimos
+CUBETAS = 30             # Cubetas en el ajuste (30 min con VENTANA_S = 60)
+MIN_CUBETAS_DERIVA = 3   # Por debajo, solo se estima el desfase
+SALTO_S = 2.0            # Salto del reloj de un sensor que reinicia su estimación
+CACHE_MAX = 4096         # Textos de hora cacheados
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_dias = {}    # "AAAA-DDD" -> ns de las 00:00 UTC de ese día
+_textos = {}  # texto -> ns
+
+
+# ---------- PARSEO ----------
+def _dia_ns(prefijo):
+    ns = _dias.get(prefijo)
+    if ns is None:
+        anio, doy = int(prefijo[:4]), int(prefijo[5:8])
+        if not 1 <= doy <= 366:
+            raise ValueError(f"Día del año fuera de rango: {prefijo}")
+        ns = _dias[prefijo] = (date(anio, 1, 1).toordinal() - _EPOCH_ORDINAL + doy - 1) * 86400 * NS
+    return ns
+
+
+def _desde_doy(texto):
+    # "AAAA-DDD-HH:MM:SS[.fff]"
+    h, m, s = int(texto[9:11]), int(texto[12:14]), int(texto[15:17])
+    ns = _dia_ns(texto[:8]) + (h * 3600 + m * 60 + s) * NS
+    if len(texto) > 17:
+        if texto[17] != ".":
+            raise ValueError(f"Hora no reconocida: {texto}")
+        ns += int(float("0" + texto[17:]) * NS)
+    return ns
+
+
+def _desde_unix(x):
+    """Epoch numérico -> ns. La unidad se deduce de la magnitud."""
+    x = float(x) if not isinstance(x, int) else x
+    if abs(x) >= 1e17:
+        return int(x)
+    if abs(x) >= 1e14:
+        return int(x * 1_000)
+    if abs(x) >= 1e11:
+        return int(x * 1_000_000)
+    return int(round(x * NS)) if isinstance(x, float) else x * NS
+
+
+def _desde_iso(texto):
+    dt = datetime.fromisoformat(texto[:-1] + "+00:00" if texto.endswith(("Z", "z")) else texto)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    delta = dt - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * NS + delta.microseconds * 1000
+
+
+def _desde_texto(texto):
+    if len(texto) >= 17 and texto[4] == "-" and texto[8] == "-" and texto[11] == ":":
+        return _desde_doy(texto)
+    if texto.lstrip("-").replace(".", "", 1).isdigit():
+        return _desde_unix(float(texto) if "." in texto else int(texto))
+    return _desde_iso(texto)
+
+
+def a_ns(valor):
+    """Hora en cualquiera de los formatos de la red -> epoch ns (int).
+    None -> None; formato desconocido -> ValueError."""
+    if valor is None:
+        return None
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        if valor != valor:
+            raise ValueError("Hora NaN")
+        return _desde_unix(valor)
+    if isinstance(valor, (bytes, bytearray)):
+        valor = valor.decode("ascii")
+    elif not isinstance(valor, str):
+        raise ValueError(f"Hora no reconocida: {valor!r}")
+    ns = _textos.get(valor)
+    if ns is None:
+        texto = valor.strip()
+        if not texto:
+            raise ValueError("Hora vacía")
+        ns = _desde_texto(texto)
+        if len(_textos) >= CACHE_MAX:
+            _textos.clear()
+        _textos[valor] = ns
+    return ns
+
+
+def leer_timenow(payload):
+    """Payload del topic TimeNow ({"TimeNow": "AAAA-DDD-HH:MM:SS"} o un UNIX
+    en texto) -> epoch ns."""
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode("utf-8")
+    texto = payload.strip()
+    if texto.startswith("{"):
+        data = json.loads(texto)
+        if TOPIC_TIME not in data:
+            raise ValueError(f"Falta la clave {TOPIC_TIME}: {texto}")
+        return a_ns(data[TOPIC_TIME])
+    return a_ns(texto)
+
+
+def como_texto(ns):
+    """epoch ns -> "AAAA-DDD-HH:MM:SS" (UTC), el formato de Tiempo_UTC."""
+    return time.strftime("%Y-%j-%H:%M:%S", time.gmtime(ns // NS))
+
+
+# ---------- ESTIMACIÓN DE DESFASE Y DERIVA ----------
+class _Fuente:
+    """Reloj de una fuente. Todo en ns; x = sello del sensor, d = llegada - sello."""
+    __slots__ = ("cubetas", "cubeta", "min_x", "min_d", "x0", "desfase", "deriva",
+                 "muestras", "saltos", "lat_suma", "lat_max", "lat_n")
+
+    def __init__(self, n_cubetas):
+        self.cubetas = deque(maxlen=n_cubetas)   # (x, d mínimo) de las cubetas cerradas
+        self.cubeta = None
+        self.min_x = self.min_d = None
+        self.x0 = 0
+        self.desfase = None    # d estimado en x0
+        self.deriva = 0.0      # ns de d por ns de sello (1e-6 = 1 ppm)
+        self.muestras = 0
+        self.saltos = 0
+        self.lat_suma = 0
+        self.lat_max = 0
+        self.lat_n = 0
+
+    def prevision(self, x):
+        return self.desfase + self.deriva * (x - self.x0)
+
+    def observar(self, x, d, cubeta):
+        self.muestras += 1
+        if self.desfase is not None and d < self.prevision(x) - SALTO_S * NS:
+            self._reiniciar()   # El reloj del sensor ha saltado hacia delante
+        if cubeta != self.cubeta:
+            if self.cubeta is not None:
+                if self.cubetas and self.min_d - self.prevision(self.min_x) > SALTO_S * NS:
+                    self._reiniciar()   # ... o hacia atrás: toda la cubeta por encima de la recta
+                self.cubetas.append((self.min_x, self.min_d))
+                self._ajustar()
+            self.cubeta, self.min_x, self.min_d = cubeta, x, d
+        elif d < self.min_d:
+            self.min_x, self.min_d = x, d
+        if not self.cubetas:
+            self.x0, self.desfase, self.deriva = self.min_x, self.min_d, 0.0
+
+    def _reiniciar(self):
+        self.saltos += 1
+        self.cubetas.clear()
+        self.cubeta = None
+
+    def _ajustar(self):
+        n = len(self.cubetas)
+        x0 = self.cubetas[0][0]
+        if n < MIN_CUBETAS_DERIVA:
+            self.x0, self.desfase, self.deriva = x0, min(d for _, d in self.cubetas), 0.0
+            return
+        xs = [x - x0 for x, _ in self.cubetas]
+        ds = [d for _, d in self.cubetas]
+        mx, md = sum(xs) / n, sum(ds) / n
+        sxx = sum((x - mx) ** 2 for x in xs)
+        deriva = sum((x - mx) * (d - md) for x, d in zip(xs, ds)) / sxx if sxx else 0.0
+        # La recta pasa por debajo de todos los mínimos (la latencia solo suma)
+        base = min(d - deriva * x for x, d in zip(xs, ds))
+        self.x0, self.desfase, self.deriva = x0, base, deriva
+
+
+class RelojSensores:
+    def __init__(self, ventana_s=VENTANA_S, cubetas=CUBETAS, referencia=True):
+        """`referencia`: si llega TimeNow, las horas corregidas se dan en su reloj
+        (si no, en el del colector)."""
+        self.ventana_ns = int(ventana_s * NS)
+        self.n_cubetas = cubetas
+        self.usar_referencia = referencia
+        self._fuentes = {}     # fuente -> _Fuente
+        self.lock = threading.Lock()
+        # Contadores
+        self.observaciones = 0
+        self.errores = 0
+
+    def _observar(self, fuente, sello_ns, llegada_ns):
+        # Llamar con el lock tomado
+        f = self._fuentes.get(fuente)
+        if f is None:
+            f = self._fuentes[fuente] = _Fuente(self.n_cubetas)
+        f.observar(sello_ns, llegada_ns - sello_ns, llegada_ns // self.ventana_ns)
+        self.observaciones += 1
+        return f
+
+    def observar(self, fuente, sello, llegada=None):
+        """Anota un mensaje de `fuente` con su hora (`sello`, cualquier formato
+        de a_ns) y la de llegada (epoch s; por defecto, ahora). Devuelve su
+        hora corregida en epoch ns, o None si el sello no se entiende."""
+        try:
+            sello_ns = a_ns(sello)
+        except (ValueError, UnicodeDecodeError):
+            self.errores += 1
+            return None
+        llegada_ns = int((time.time() if llegada is None else llegada) * NS)
+        with self.lock:
+            f = self._observar(fuente, sello_ns, llegada_ns)
+            corregida = min(int(sello_ns + f.prevision(sello_ns)), llegada_ns)
+            latencia = llegada_ns - corregida
+            f.lat_suma += latencia
+            f.lat_n += 1
+            if latencia > f.lat_max:
+                f.lat_max = latencia
+            return corregida - self._desfase_referencia(llegada_ns)
+
+    def referencia(self, payload, llegada=None):
+        """Anota un mensaje de TimeNow; devuelve su hora en epoch ns (o None)."""
+        try:
+            sello_ns = leer_timenow(payload)
+        except (ValueError, UnicodeDecodeError):
+            self.errores += 1
+            return None
+        llegada_ns = int((time.time() if llegada is None else llegada) * NS)
+        with self.lock:
+            self._observar(REFERENCIA, sello_ns, llegada_ns)
+        return sello_ns
+
+    def _desfase_referencia(self, llegada_ns):
+        # Reloj del colector - reloj de referencia (0 sin TimeNow). Con el lock tomado
+        if not self.usar_referencia:
+            return 0
+        ref = self._fuentes.get(REFERENCIA)
+        if ref is None or ref.desfase is None:
+            return 0
+        # La recta de la referencia va en su propio reloj: se evalúa en la llegada
+        return int(ref.prevision(llegada_ns - ref.desfase))
+
+    def corregir(self, fuente, sello):
+        """Hora corregida (epoch ns) de un sello de `fuente`, sin anotarlo."""
+        sello_ns = a_ns(sello)
+        with self.lock:
+            f = self._fuentes.get(fuente)
+            if f is None or f.desfase is None:
+                return None
+            return int(sello_ns + f.prevision(sello_ns)) - self._desfase_referencia(sello_ns + int(f.desfase))
+
+    # ---------- ESTADO ----------
+    def estimacion(self, fuente):
+        with self.lock:
+            f = self._fuentes.get(fuente)
+            if f is None or f.desfase is None:
+                return None
+            return {
+                "desfase_s": f.prevision(f.min_x) / NS,
+                "deriva_ppm": f.deriva * 1e6,
+                "muestras": f.muestras,
+                "cubetas": len(f.cubetas),
+                "saltos": f.saltos,
+                "latencia_media_ms": f.lat_suma / f.lat_n / 1e6 if f.lat_n else None,
+                "latencia_max_ms": f.lat_max / 1e6 if f.lat_n else None,
+            }
+
+    def fuentes(self):
+        with self.lock:
+            return sorted(self._fuentes)
+
+    def estadisticas(self):
+        ref = self.estimacion(REFERENCIA)
+        return {
+            "fuentes": len(self._fuentes),
+            "observaciones": self.observaciones,
+            "errores": self.errores,
+            "referencia": ref is not None,
+            "desfase_referencia_s": ref["desfase_s"] if ref else None,
+            "por_fuente": {f: self.estimacion(f) for f in self.fuentes() if f != REFERENCIA},
+        }
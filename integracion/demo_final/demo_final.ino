@@ -20,6 +20,21 @@ const int mqtt_port = 1883;
 const char* topic_publish = "Enviromental Sensors Network";
 const char* topic_time = "TimeNow";
 
+// --- Formato de publicación ---
+// 0: JSON (por defecto) | 1: trama binaria v1 de 40 bytes (ver PalancasPablito/codec_binario.py)
+#define FORMATO_BINARIO 0
+const char* topic_publish_bin = "Enviromental Sensors Network/bin";
+
+struct __attribute__((packed)) TramaV1 {
+    uint8_t magia;        // 0xA5
+    uint8_t version;      // 1
+    uint8_t mascara;      // bit i = campo i presente
+    uint8_t reservado;
+    char id[8];           // ID con relleno de \0
+    uint32_t epoch;       // Hora UTC en segundos desde 1970
+    float valores[6];     // Temp_C, Humidity_Per, Pressure_hPa, UVI, CO_ppm, CO2_ppm
+};
+
 // --- Variables ---
 Adafruit_LTR390 ltr = Adafruit_LTR390();
 WiFiClient espClient;
@@ -147,6 +162,22 @@ void loop() {
         time_t current_unix_time = time(NULL); 
         getLocalTime(&timeinfo, current_unix_time);
         
+#if FORMATO_BINARIO
+        // Trama compacta: solo UVI presente (bit 3)
+        TramaV1 trama = {0xA5, 1, 0x08, 0};
+        strncpy(trama.id, DEVICE_ID, sizeof(trama.id));
+        trama.epoch = (uint32_t)current_unix_time;
+        for (int i = 0; i < 6; i++) trama.valores[i] = NAN;
+        trama.valores[3] = uvi;
+
+        if(client.publish(topic_publish_bin, (const uint8_t*)&trama, sizeof(trama), false, MQTT_QOS)) {
+            Serial.println("\n[MQTT] PUBLICACIÓN BINARIA EXITOSA (40 bytes)");
+        } else {
+            Serial.println("\n[MQTT] ❌ Fallo en la publicación.");
+        }
+        return;
+#endif
+
         // 4. Formatear la hora
         char timeUTC[30];
         strftime(timeUTC, sizeof(timeUTC), "%Y-%m-%d %H:%M:%S", &timeinfo);
@@ -1,64 +1,47 @@
-import paho.mqtt.client as mqtt
+import os
+import sys
 import time
-import threading
+
+# El núcleo de ingesta vive junto al dashboard (PalancasPablito/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PalancasPablito"))
+from ingesta_async import NucleoIngesta
 
 # Configuración MQTT
-MQTT_BROKER = "10.42.0.1"
+MQTT_BROKER = os.environ.get("MQTT_BROKER", "10.42.0.1")
 MQTT_PORT = 1883
 MQTT_TOPIC = "test1"
 
 class MQTTClient:
     def __init__(self):
-        self.client = mqtt.Client()
-        self.setup_callbacks()
-       
-    def setup_callbacks(self):
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.on_publish = self.on_publish
-       
-    def on_connect(self, client, userdata, flags, rc):
-        if rc == 0:
-            print(f"✅ Conectado exitosamente al broker: {MQTT_BROKER}")
-            client.subscribe(MQTT_TOPIC)
-            print(f"📡 Suscrito al tópico: {MQTT_TOPIC}")
-        else:
-            print(f"❌ Error de conexión. Código: {rc}")
+        # Un event loop (en su propio hilo) en vez del hilo de red de paho
+        self.nucleo = NucleoIngesta()
+        self.nucleo.conectar(MQTT_BROKER, MQTT_PORT, [MQTT_TOPIC])
+        self.nucleo.consumidor(self.on_message, MQTT_TOPIC, crudo=True)
            
-    def on_message(self, client, userdata, msg):
+    def on_message(self, msg):
         mensaje = msg.payload.decode()
         print(f"\n📨 MENSAJE RECIBIDO:")
         print(f"   Tópico: {msg.topic}")
         print(f"   Texto: {mensaje}")
-        print(f"   Hora: {time.strftime('%H:%M:%S')}")
+        print(f"   Hora: {time.strftime('%H:%M:%S', time.localtime(msg.recibido))}")
         print("-" * 40)
        
-    def on_publish(self, client, userdata, mid):
-        print(f"📤 Mensaje publicado con ID: {mid}")
-       
     def enviar_mensaje(self, mensaje):
-        result = self.client.publish(MQTT_TOPIC, mensaje)
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"✍️  Mensaje enviado: '{mensaje}'")
-        else:
-            print(f"❌ Error al enviar mensaje")
+        if not any(self.nucleo.estadisticas()["conexiones"].values()):
+            print(f"❌ Error al enviar mensaje (sin conexión)")
+            return
+        self.nucleo.publicar(MQTT_TOPIC, mensaje)
+        print(f"✍️  Mensaje enviado: '{mensaje}'")
            
     def iniciar_recepcion(self):
-        try:
-            print(f"🔌 Conectando a {MQTT_BROKER}:{MQTT_PORT}...")
-            self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
-           
-            # Iniciar loop en segundo plano para recibir mensajes
-            self.client.loop_start()
-            print("🔄 Listo para enviar y recibir mensajes...")
-            print("   Escribe tu mensaje y presiona Enter (o 'quit' para salir)")
-           
-        except Exception as e:
-            print(f"❌ Error: {e}")
+        print(f"🔌 Conectando a {MQTT_BROKER}:{MQTT_PORT}...")
+        self.nucleo.iniciar()
+        print(f"📡 Suscrito al tópico: {MQTT_TOPIC}")
+        print("🔄 Listo para enviar y recibir mensajes...")
+        print("   Escribe tu mensaje y presiona Enter (o 'quit' para salir)")
            
     def detener(self):
-        self.client.loop_stop()
-        self.client.disconnect()
+        self.nucleo.detener()
         print("🔌 Desconectado del broker MQTT")
 
 def interfaz_usuario(mqtt_client):
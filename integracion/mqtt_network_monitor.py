@@ -1,9 +1,10 @@
 import paho.mqtt.client as mqtt
 import json
 from datetime import datetime
+import os
 
 # --- Configuracion ---
-BROKER_HOST = "broker.emqx.io"
+BROKER_HOST = os.environ.get("MQTT_BROKER", "broker.emqx.io")
 BROKER_PORT = 1883
 TOPIC_NETWORK = "Enviromental Sensors Network"
 MY_SENSOR_ID = "Sensor_Astro_ID_007" # ¡DEBES USAR EL MISMO ID QUE EN EL ARDUINO!
@@ -1,10 +1,11 @@
 import paho.mqtt.client as mqtt
 import time
+import os
 
 # -----------------
 # CONFIGURACIÓN
 # -----------------
-MQTT_BROKER = "broker.emqx.io"
+MQTT_BROKER = os.environ.get("MQTT_BROKER", "broker.emqx.io")
 MQTT_TOPIC = "test1"
 CLIENT_ID = "Python_Publisher"
 
@@ -1,9 +1,10 @@
 import paho.mqtt.client as mqtt
+import os
 
 # -----------------
 # CONFIGURACIÓN
 # -----------------
-MQTT_BROKER = "broker.emqx.io"
+MQTT_BROKER = os.environ.get("MQTT_BROKER", "broker.emqx.io")
 MQTT_TOPIC = "test1"
 CLIENT_ID = "Python_Subscriber"
 
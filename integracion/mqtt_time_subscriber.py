@@ -1,29 +1,36 @@
-import paho.mqtt.client as mqtt
 import time
 from datetime import datetime
+import os
+import sys
+
+# El núcleo de ingesta vive junto al dashboard (PalancasPablito/)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PalancasPablito"))
+from ingesta_async import NucleoIngesta
+from tiempo import RelojSensores, NS, REFERENCIA
 
 # --- Configuracion ---
-BROKER_HOST = "LunarComms4"
+BROKER_HOST = os.environ.get("MQTT_BROKER", "LunarComms4")
 BROKER_PORT = 1883
 TOPIC_TIME = "TimeNow"
 
 # --- Variables Globales ---
 last_update_time = None
+# enviar_TimeNow.py publica {"TimeNow": "YYYY-DDD-HH:MM:SS"}; otros emisores,
+# un timestamp UNIX en texto. tiempo.leer_timenow entiende los dos.
+reloj = RelojSensores()
 
-# --- Funciones de Callback ---
-
-def on_connect(client, userdata, flags, rc):
-    print(f"Conectado al broker MQTT con resultado: {rc}")
-    client.subscribe(TOPIC_TIME)
-    print(f"Suscrito al topic: {TOPIC_TIME}")
+# --- Procesado de mensajes ---
 
-def on_message(client, userdata, msg):
+def on_message(msg):
     global last_update_time
     
     try:
-        # Asumimos que el payload es una marca de tiempo (timestamp) UNIX en string
-        timestamp_str = msg.payload.decode()
-        unix_timestamp = int(timestamp_str)
+        # Marca de tiempo en epoch ns (el desfase con el reloj local se va estimando)
+        ns = reloj.referencia(msg.payload, msg.recibido)
+        if ns is None:
+            print(f"Error: Payload no es una hora válida: {msg.payload.decode(errors='replace')}")
+            return
+        unix_timestamp = ns // NS
         
         # Convertir el timestamp UNIX a un objeto datetime
         current_dt = datetime.fromtimestamp(unix_timestamp)
@@ -34,33 +41,30 @@ def on_message(client, userdata, msg):
         print(f"\n--- HORA RECIBIDA ---")
         print(f"Timestamp UNIX: {unix_timestamp}")
         print(f"Hora Decodificada: {current_dt.strftime('%Y-%m-%d %H:%M:%S')}")
+        estimacion = reloj.estimacion(REFERENCIA)
+        print(f"Desfase reloj local - TimeNow: {estimacion['desfase_s']:+.3f} s")
 
-    except ValueError:
-        print(f"Error: Payload no es un timestamp UNIX válido: {msg.payload.decode()}")
     except Exception as e:
         print(f"Error inesperado al procesar mensaje: {e}")
 
 # --- Programa Principal ---
 
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "PythonTimeSubscriber")
-client.on_connect = on_connect
-client.on_message = on_message
+# Buzón sin locks: el event loop de ingesta lo llena y este hilo lo vacía
+nucleo = NucleoIngesta()
+nucleo.conectar(BROKER_HOST, BROKER_PORT, [TOPIC_TIME], client_id="PythonTimeSubscriber")
+buzon = nucleo.buzon(TOPIC_TIME, crudo=True)
 
-try:
-    print(f"Intentando conectar a {BROKER_HOST}:{BROKER_PORT}...")
-    client.connect(BROKER_HOST, BROKER_PORT, 60)
-except Exception as e:
-    print(f"Error al conectar: {e}")
-    exit()
-
-# Inicia un hilo en segundo plano para manejar la red (no bloqueante)
-client.loop_start()
+print(f"Intentando conectar a {BROKER_HOST}:{BROKER_PORT}...")
+nucleo.iniciar()
 
 # Bucle principal para mostrar la hora cada 10s
 try:
     last_display_time = time.time() - 10 # Para forzar la primera impresión
     
     while True:
+        while buzon:
+            on_message(buzon.popleft())
+
         current_time = time.time()
         
         if (current_time - last_display_time) >= 10:
@@ -76,5 +80,4 @@ try:
 except KeyboardInterrupt:
     print("\nPrograma detenido por el usuario.")
     
-client.loop_stop()
-client.disconnect()
\ No newline at end of file
+nucleo.detener()
\ No newline at end of file